@@ -98,11 +98,15 @@ class Category(object):
             self._logger.critical(
                 'Category: Exception in explicit terms filter in torrent: %s', display_name, exc_info=True)
 
+        # the names are split into words once, all categories are judged on the same words
+        display_words = set(self._getWords(display_name.lower()))
+        files = self._getFiles(files_list)
+
         torrent_category = None
         # filename_list ready
         strongest_cat = 0.0
         for category in self.category_info:  # for each category
-            (decision, strength) = self.judge(category, files_list, display_name)
+            (decision, strength) = self._judge(category, files, display_words)
             if decision and (strength > strongest_cat):
                 torrent_category = category['name']
                 strongest_cat = strength
@@ -115,18 +119,25 @@ class Category(object):
     # judge whether a torrent file belongs to a certain category
     # return bool
     def judge(self, category, files_list, display_name=''):
+        return self._judge(category, self._getFiles(files_list), set(self._getWords(display_name.lower())))
+
+    def _getFiles(self, files_list):
+        # (lowercase name, set of words, length) of every file
+        files = []
+        for name, length in files_list:
+            name = name.lower()
+            files.append((name, set(self._getWords(name)), length))
+        return files
+
+    def _judge(self, category, files, display_words):
+        keywords = category['keywords'].items()
+        suffixes = tuple(category['suffix'])
 
         # judge file keywords
-        display_name = display_name.lower()
         factor = 1.0
-        fileKeywords = self._getWords(display_name)
-
-        for ikeywords in category['keywords'].keys():
-            try:
-                fileKeywords.index(ikeywords)
-                factor *= 1 - category['keywords'][ikeywords]
-            except:
-                pass
+        for keyword, weight in keywords:
+            if keyword in display_words:
+                factor *= 1 - weight
         if (1 - factor) > 0.5:
             if 'strength' in category:
                 return (True, category['strength'])
@@ -136,33 +147,22 @@ class Category(object):
         # judge each file
         matchSize = 0
         totalSize = 1e-19
-        for name, length in files_list:
+        for name, words, length in files:
             totalSize += length
             # judge file size
             if length < category['minfilesize'] or 0 < category['maxfilesize'] < length:
                 continue
 
             # judge file suffix
-            OK = False
-            for isuffix in category['suffix']:
-                if name.lower().endswith(isuffix):
-                    OK = True
-                    break
-            if OK:
+            if name.endswith(suffixes):
                 matchSize += length
                 continue
 
             # judge file keywords
             factor = 1.0
-            fileKeywords = self._getWords(name.lower())
-
-            for ikeywords in category['keywords'].keys():
-                try:
-                    fileKeywords.index(ikeywords)
-                    # print ikeywords
-                    factor *= 1 - category['keywords'][ikeywords]
-                except:
-                    pass
+            for keyword, weight in keywords:
+                if keyword in words:
+                    factor *= 1 - weight
             if factor < 0.5:
                 matchSize += length
 
@@ -18,6 +18,7 @@ class XXXFilter(object):
 
         termfilename = os.path.join(install_dir, LIBRARYNAME, 'Category', 'filter_terms.filter')
         self.xxx_terms, self.xxx_searchterms = self.initTerms(termfilename)
+        self.xxx_searchterms_regexp = self.compileSearchTerms(self.xxx_searchterms)
 
     def initTerms(self, filename):
         terms = set()
@@ -39,6 +40,12 @@ class XXXFilter(object):
         self._logger.debug('Read %d XXX terms from file %s', len(terms) + len(searchterms), filename)
         return terms, searchterms
 
+    def compileSearchTerms(self, searchterms):
+        # a single regular expression finds any of the search terms in one pass over a string
+        if not searchterms:
+            return None
+        return re.compile('|'.join(re.escape(term) for term in sorted(searchterms, key=len, reverse=True)))
+
     def _getWords(self, string):
         return [a.lower() for a in WORDS_REGEXP.findall(string)]
 
@@ -75,10 +82,10 @@ class XXXFilter(object):
             return num_xxx > 0
 
     def foundXXXTerm(self, s):
-        for term in self.xxx_searchterms:
-            if term in s:
-                self._logger.debug('XXXFilter: Found term "%s" in %s', term, s)
-                return True
+        match = self.xxx_searchterms_regexp.search(s) if self.xxx_searchterms_regexp else None
+        if match:
+            self._logger.debug('XXXFilter: Found term "%s" in %s', match.group(), s)
+            return True
         return False
 
     def isXXXTerm(self, s, title=None):
@@ -8,6 +8,7 @@ import os
 import sys
 import time as timemod
 from glob import iglob
+from multiprocessing.pool import ThreadPool
 from threading import Event, enumerate as enumerate_threads
 from traceback import print_exc
 
@@ -21,7 +22,8 @@ from Tribler.Core.TorrentDef import TorrentDef, TorrentDefNoMetainfo
 from Tribler.Core.Utilities.configparser import CallbackConfigParser
 from Tribler.Core.Video.VideoPlayer import VideoPlayer
 from Tribler.Core.exceptions import DuplicateDownloadException
-from Tribler.Core.simpledefs import NTFY_DISPERSY, NTFY_STARTED, NTFY_TORRENTS, NTFY_UPDATE
+from Tribler.Core.simpledefs import (DLSTATUS_STOPPED, DLSTATUS_STOPPED_ON_ERROR, NTFY_DISPERSY, NTFY_INSERT,
+                                     NTFY_STARTED, NTFY_STARTUP_TICK, NTFY_TORRENTS, NTFY_UPDATE)
 from Tribler.Main.globals import DefaultDownloadStartupConfig
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import blockingCallFromThread, blocking_call_on_reactor_thread
@@ -41,6 +43,12 @@ else:
 # Internal classes
 #
 
+# number of threads that read the checkpoints of the downloads in parallel at startup
+RESUME_PSTATE_WORKERS = 4
+# the checkpointed downloads are added to libtorrent in batches of this size, one batch every interval seconds
+RESUME_BATCH_SIZE = 50
+RESUME_BATCH_INTERVAL = 0.5
+
 
 class TriblerLaunchMany(TaskManager):
 
@@ -67,6 +75,7 @@ class TriblerLaunchMany(TaskManager):
         self.threadpool = ThreadPoolManager()
         self.torrent_store = None
         self.metadata_store = None
+        self.download_state_store = None
         self.rtorrent_handler = None
         self.tftp_handler = None
 
@@ -103,6 +112,11 @@ class TriblerLaunchMany(TaskManager):
                 from Tribler.Core.leveldbstore import LevelDbStore
                 self.metadata_store = LevelDbStore(self.session.get_metadata_store_dir())
 
+            if self.session.get_libtorrent():
+                from Tribler.Core.Modules.download_state_store import DownloadStateStore
+                self.download_state_store = DownloadStateStore(self.session.get_download_state_store_dir(),
+                                                               self.torrent_store)
+
             # torrent collecting: RemoteTorrentHandler
             if self.session.get_torrent_collecting():
                 from Tribler.Core.RemoteTorrentHandler import RemoteTorrentHandler
@@ -155,7 +169,8 @@ class TriblerLaunchMany(TaskManager):
 
                 # register TFTP service
                 from Tribler.Core.TFTP.handler import TftpHandler
-                self.tftp_handler = TftpHandler(self.session, endpoint, "fffffffd".decode('hex'), block_size=1024)
+                self.tftp_handler = TftpHandler(self.session, endpoint, "fffffffd".decode('hex'), block_size=1024,
+                                                window_size=16)
                 self.tftp_handler.initialize()
 
             if self.session.get_enable_torrent_search() or self.session.get_enable_channel_search():
@@ -430,33 +445,112 @@ class TriblerLaunchMany(TaskManager):
         """ Called by any thread """
 
         def do_load_checkpoint(initialdlstatus, initialdlstatus_dict):
+            if self.download_state_store is None:
+                return
+
+            # checkpoints that were written as separate files are moved into the download state store first
+            unreadable_infohashes = self._import_pstate_files()
+
+            infohashes = list(set(self.download_state_store.get_infohashes()) | set(unreadable_infohashes))
+            if not infohashes:
+                return
+
+            # read the checkpoints in parallel, the session lock is not needed for that
+            pstates = self._map_in_pool(self.load_download_pstate_noexc, infohashes)
+
+            # resume the active downloads first
+            checkpoints = sorted(zip(infohashes, pstates), key=lambda (infohash, pstate):
+                                 self._is_checkpoint_stopped(infohash, pstate, initialdlstatus, initialdlstatus_dict))
+
             with self.sesslock:
-                for i, filename in enumerate(iglob(os.path.join(self.session.get_downloads_pstate_dir(), '*.state'))):
-                    self.resume_download(filename, initialdlstatus, initialdlstatus_dict, setupDelay=i * 0.1)
+                for i, (infohash, pstate) in enumerate(checkpoints):
+                    batch_delay = (i // RESUME_BATCH_SIZE) * RESUME_BATCH_INTERVAL
+                    self.resume_download(infohash, initialdlstatus, initialdlstatus_dict, setupDelay=batch_delay,
+                                         pstate=pstate)
+
+                    if (i + 1) % RESUME_BATCH_SIZE == 0 or i + 1 == len(checkpoints):
+                        self.threadpool.add_task(lambda num_resumed=i + 1: self.session.notifier.notify(
+                            NTFY_STARTUP_TICK, NTFY_INSERT, None,
+                            'Resuming downloads (%d/%d)' % (num_resumed, len(checkpoints))), batch_delay)
 
         if self.initComplete:
             do_load_checkpoint(initialdlstatus, initialdlstatus_dict)
         else:
-            self.register_task("load_checkpoint", reactor.callLater(1, do_load_checkpoint))
+            self.register_task("load_checkpoint", reactor.callLater(1, do_load_checkpoint,
+                                                                    initialdlstatus, initialdlstatus_dict))
 
-    def load_download_pstate_noexc(self, infohash):
-        """ Called by any thread, assume sesslock already held """
+    def _map_in_pool(self, func, items):
+        pool = ThreadPool(min(RESUME_PSTATE_WORKERS, len(items)))
         try:
-            basename = binascii.hexlify(infohash) + '.state'
-            filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-            if os.path.exists(filename):
-                return self.load_download_pstate(filename)
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _import_pstate_files(self):
+        """
+        Moves the checkpoints from the pstate directory into the download state store. The checkpoints that can't be
+        read are left on disk.
+        :return: the infohashes of the checkpoints that could not be read, these are resumed from the torrent store.
+        """
+        filenames = list(iglob(os.path.join(self.session.get_downloads_pstate_dir(), '*.state')))
+        if not filenames:
+            return []
+
+        imported_filenames = []
+        unreadable_infohashes = []
+        for filename, pstate in zip(filenames, self._map_in_pool(self._load_pstate_file_noexc, filenames)):
+            try:
+                infohash = binascii.unhexlify(os.path.basename(filename)[:-6])
+            except TypeError:
+                self._logger.warning("tlm: ignoring checkpoint with an invalid name %s", filename)
+                continue
+
+            if pstate is not None:
+                self.download_state_store.put(infohash, pstate)
+                imported_filenames.append(filename)
             else:
-                self._logger.info("%s not found", basename)
+                unreadable_infohashes.append(infohash)
+
+        # the files are only removed once their checkpoints have been written to the download state store
+        self.download_state_store.flush()
+        for filename in imported_filenames:
+            os.remove(filename)
+
+        self._logger.info("tlm: moved %d checkpoints into the download state store", len(imported_filenames))
+        return unreadable_infohashes
 
+    def _load_pstate_file_noexc(self, filename):
+        """ Called by the resume worker threads """
+        try:
+            return self.load_download_pstate(filename)
         except Exception:
-            self._logger.exception("Exception while loading pstate: %s", infohash)
+            return None
+
+    def _is_checkpoint_stopped(self, infohash, pstate, initialdlstatus=None, initialdlstatus_dict={}):
+        if initialdlstatus_dict.get(infohash, initialdlstatus) == DLSTATUS_STOPPED:
+            return True
 
-    def resume_download(self, filename, initialdlstatus=None, initialdlstatus_dict={}, setupDelay=0):
-        tdef = dscfg = pstate = None
+        dlstate = pstate.get('state', 'dlstate') if pstate and pstate.has_option('state', 'dlstate') else None
+        return isinstance(dlstate, dict) and dlstate.get('status') in (DLSTATUS_STOPPED, DLSTATUS_STOPPED_ON_ERROR)
 
+    def load_download_pstate_noexc(self, infohash):
+        """ Called by any thread """
         try:
-            pstate = self.load_download_pstate(filename)
+            pstate = self.download_state_store.get(infohash)
+            if pstate is None:
+                self._logger.info("pstate of %s not found", binascii.hexlify(infohash))
+            return pstate
+
+        except Exception:
+            self._logger.exception("Exception while loading pstate: %s", binascii.hexlify(infohash))
+
+    def resume_download(self, infohash, initialdlstatus=None, initialdlstatus_dict={}, setupDelay=0, pstate=None):
+        tdef = dscfg = None
+
+        try:
+            if pstate is None:
+                pstate = self.download_state_store.get(infohash)
 
             # SWIFTPROC
             metainfo = pstate.get('state', 'metainfo')
@@ -473,11 +567,7 @@ class TriblerLaunchMany(TaskManager):
 
         except:
             # pstate is invalid or non-existing
-            _, file = os.path.split(filename)
-
-            infohash = binascii.unhexlify(file[:-6])
-
-            torrent_data = self.torrent_store.get(infohash)
+            torrent_data = self.torrent_store.get(binascii.hexlify(infohash)) if self.torrent_store else None
             if torrent_data:
                 tdef = TorrentDef.load_from_memory(torrent_data)
 
@@ -490,8 +580,6 @@ class TriblerLaunchMany(TaskManager):
                         if os.path.isdir(dest_dir) or dest_dir == '':
                             dscfg.set_dest_dir(dest_dir)
 
-        self._logger.debug("tlm: load_checkpoint: pstate is %s %s",
-                           pstate.get('dlstate', 'status'), pstate.get('dlstate', 'progress'))
         if pstate is None or pstate.get('state', 'engineresumedata') is None:
             self._logger.debug("tlm: load_checkpoint: resumedata None")
         else:
@@ -509,10 +597,11 @@ class TriblerLaunchMany(TaskManager):
                 except Exception as e:
                     self._logger.exception("tlm: load check_point: exception while adding download %s", tdef)
             else:
-                self._logger.info("tlm: removing checkpoint %s destdir is %s", filename, dscfg.get_dest_dir())
-                os.remove(filename)
+                self._logger.info("tlm: removing checkpoint %s destdir is %s", binascii.hexlify(infohash),
+                                  dscfg.get_dest_dir())
+                self.download_state_store.remove(infohash)
         else:
-            self._logger.info("tlm: could not resume checkpoint %s %s %s", filename, tdef, dscfg)
+            self._logger.info("tlm: could not resume checkpoint %s %s %s", binascii.hexlify(infohash), tdef, dscfg)
 
     def checkpoint(self, stop=False, checkpoint=True, gracetime=2.0):
         """ Called by any thread, assume sesslock already held """
@@ -549,6 +638,9 @@ class TriblerLaunchMany(TaskManager):
                 except Exception as e:
                     self._logger.exception("Exception while checkpointing: %s", d.get_def().get_name())
 
+            if self.download_state_store is not None:
+                self.download_state_store.flush()
+
         if stop:
             # Some grace time for early shutdown tasks
             if self.shutdownstarttime is not None:
@@ -566,16 +658,10 @@ class TriblerLaunchMany(TaskManager):
     def remove_pstate(self, infohash):
         def do_remove():
             if not self.download_exists(infohash):
-                dlpstatedir = self.session.get_downloads_pstate_dir()
-
                 # Remove checkpoint
-                hexinfohash = binascii.hexlify(infohash)
                 try:
-                    basename = hexinfohash + '.state'
-                    filename = os.path.join(dlpstatedir, basename)
-                    self._logger.debug("remove pstate: removing dlcheckpoint entry %s", filename)
-                    if os.access(filename, os.F_OK):
-                        os.remove(filename)
+                    self._logger.debug("remove pstate: removing dlcheckpoint entry %s", binascii.hexlify(infohash))
+                    self.download_state_store.remove(infohash)
                 except:
                     # Show must go on
                     self._logger.exception("Could not remove state")
@@ -656,10 +742,6 @@ class TriblerLaunchMany(TaskManager):
             mainlineDHT.deinit(self.mainline_dht)
             self.mainline_dht = None
 
-        if self.torrent_store is not None:
-            self.torrent_store.close()
-            self.torrent_store = None
-
     def network_shutdown(self):
         try:
             self._logger.info("tlm: network_shutdown")
@@ -679,17 +761,23 @@ class TriblerLaunchMany(TaskManager):
             self.ltmgr.shutdown()
             self.ltmgr = None
 
+        # the stores are closed after the final checkpoint, which references the torrent store
+        if self.download_state_store is not None:
+            self.download_state_store.close()
+            self.download_state_store = None
+
+        if self.torrent_store is not None:
+            self.torrent_store.close()
+            self.torrent_store = None
+
         if self.threadpool:
             self.threadpool.cancel_all_pending_tasks()
             self.threadpool = None
 
     def save_download_pstate(self, infohash, pstate):
         """ Called by network thread """
-        basename = binascii.hexlify(infohash) + '.state'
-        filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-
-        self._logger.debug("tlm: network checkpointing: to file %s", filename)
-        pstate.write_file(filename)
+        if self.download_state_store.put(infohash, pstate):
+            self._logger.debug("tlm: network checkpointing: stored state of %s", binascii.hexlify(infohash))
 
     def load_download_pstate(self, filename):
         """ Called by any thread """
@@ -8,6 +8,8 @@ import os
 import logging
 from hashlib import sha1
 from copy import copy
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 from time import time
 from types import LongType
 from libtorrent import bencode
@@ -20,6 +22,16 @@ from Tribler.Core.Utilities.utilities import validTorrentFile
 
 logger = logging.getLogger(__name__)
 
+# files are read in blocks of at least this many bytes
+READ_BUFFER_SIZE = 4 * 1024 * 1024
+# the pieces are hashed in batches of roughly this many bytes, while the next batch is being read
+HASH_BATCH_SIZE = 64 * 1024 * 1024
+
+try:
+    HASH_THREADS = cpu_count()
+except NotImplementedError:
+    HASH_THREADS = 4
+
 
 def make_torrent_file(input, userabortflag=None, userprogresscallback=lambda x: None):
     """ Create a torrent file from the supplied input.
@@ -86,8 +98,6 @@ def makeinfo(input, userabortflag, userprogresscallback):
     encoding = input['encoding']
 
     pieces = []
-    sh = sha1()
-    done = 0
     fs = []
     totalsize = 0
     totalhashed = 0
@@ -134,50 +144,35 @@ def makeinfo(input, userabortflag, userprogresscallback):
     else:
         piece_length = input['piece length']
 
-    # 4. Read files and calc hashes
-    for p, f, size in subs:
-        pos = 0
-
-        h = open(f, 'rb')
-
-        while pos < size:
-            a = min(size - pos, piece_length - done)
-
-            # See if the user cancelled
-            if userabortflag is not None and userabortflag.isSet():
-                return None, None
-
-            readpiece = h.read(a)
-
+    # 4. Read files and calc hashes. A batch of pieces is hashed by the thread pool while the next batch is read.
+    pool = ThreadPool(HASH_THREADS)
+    try:
+        hashing = None
+        for batch in read_piece_batches(subs, piece_length):
             # See if the user cancelled
             if userabortflag is not None and userabortflag.isSet():
+                # drop the batches that are still queued for hashing
+                pool.terminate()
                 return None, None
 
-            sh.update(readpiece)
+            batch_hashing = (pool.map_async(hash_piece, batch), sum(len(piece) for piece in batch))
+            if hashing:
+                totalhashed += collect_piece_hashes(hashing, pieces, totalhashed, totalsize, userprogresscallback)
+            hashing = batch_hashing
 
-            done += a
-            pos += a
-            totalhashed += a
-
-            if done == piece_length:
-                pieces.append(sh.digest())
-                done = 0
-                sh = sha1()
-
-            if userprogresscallback is not None:
-                userprogresscallback(float(totalhashed) / float(totalsize))
+        if hashing:
+            collect_piece_hashes(hashing, pieces, totalhashed, totalsize, userprogresscallback)
+    finally:
+        pool.close()
+        pool.join()
 
+    for p, f, size in subs:
         newdict = {'length': num2num(size),
                    'path': uniconvertl(p, encoding),
                    'path.utf-8': uniconvertl(p, 'utf-8')}
 
         fs.append(newdict)
 
-        h.close()
-
-    if done > 0:
-        pieces.append(sh.digest())
-
     # 5. Create info dict
     if len(subs) == 1:
         flkey = 'length'
@@ -204,6 +199,61 @@ def makeinfo(input, userabortflag, userprogresscallback):
     return infodict, piece_length
 
 
+def hash_piece(piece):
+    # hashlib releases the GIL while hashing, so pieces are hashed in parallel
+    return sha1(piece).digest()
+
+
+def collect_piece_hashes(hashing, pieces, totalhashed, totalsize, userprogresscallback):
+    """ Waits for a batch of pieces to be hashed and adds the hashes to pieces.
+    Returns the number of bytes that have been hashed. """
+    result, batchsize = hashing
+    pieces.extend(result.get())
+
+    if userprogresscallback is not None:
+        userprogresscallback(float(totalhashed + batchsize) / float(totalsize))
+    return batchsize
+
+
+def read_pieces(subs, piece_length):
+    """ Yields the content of the files as pieces of piece_length bytes, only
+    the last piece can be shorter. The files are read in large blocks that
+    hold a whole number of pieces, a piece is a buffer into such a block. """
+    readsize = piece_length * max(1, READ_BUFFER_SIZE // piece_length)
+    leftover = ''
+    for _, f, _ in subs:
+        with open(f, 'rb') as h:
+            while True:
+                data = h.read(readsize)
+                if not data:
+                    break
+                if leftover:
+                    # a piece that spans multiple files
+                    data = leftover + data
+
+                end = len(data) - len(data) % piece_length
+                for offset in xrange(0, end, piece_length):
+                    yield buffer(data, offset, piece_length)
+                leftover = data[end:]
+
+    if leftover:
+        yield leftover
+
+
+def read_piece_batches(subs, piece_length):
+    """ Yields lists of consecutive pieces of about HASH_BATCH_SIZE bytes. """
+    batchlength = max(1, HASH_BATCH_SIZE // piece_length)
+    batch = []
+    for piece in read_pieces(subs, piece_length):
+        batch.append(piece)
+        if len(batch) == batchlength:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
 def subfiles(d):
     """ Return list of (pathlist,local filename) tuples for all the files in
     directory 'd' """
@@ -309,7 +359,7 @@ def get_length_filepieceranges_from_metainfo(metainfo, selectedfiles):
         return total, filepieceranges
 
 
-def copy_metainfo_to_input(metainfo, input):
+def copy_metainfo_to_input(metainfo, input, copy_files=True):
     keys = tdefdictdefaults.keys()
     # Arno: For magnet link support
     keys.append("initial peers")
@@ -322,6 +372,18 @@ def copy_metainfo_to_input(metainfo, input):
         if key in metainfo['info']:
             input[key] = metainfo['info'][key]
 
+    if copy_files:
+        copy_metainfo_files_to_input(metainfo, input)
+
+    # Diego : we want web seeding
+    if 'url-list' in metainfo:
+        input['url-list'] = metainfo['url-list']
+
+    if 'httpseeds' in metainfo:
+        input['httpseeds'] = metainfo['httpseeds']
+
+
+def copy_metainfo_files_to_input(metainfo, input):
     # Note: don't know inpath, set to outpath
     if 'length' in metainfo['info']:
         outpath = metainfo['info']['name']
@@ -336,13 +398,6 @@ def copy_metainfo_to_input(metainfo, input):
             d = {'inpath': outpath, 'outpath': outpath, 'length': length}
             input['files'].append(d)
 
-    # Diego : we want web seeding
-    if 'url-list' in metainfo:
-        input['url-list'] = metainfo['url-list']
-
-    if 'httpseeds' in metainfo:
-        input['httpseeds'] = metainfo['httpseeds']
-
 
 def get_files(metainfo, exts):
     # 01/02/10 Boudewijn: now returns (file, length) tuples instead of files
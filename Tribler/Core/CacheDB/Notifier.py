@@ -4,6 +4,8 @@
 import logging
 import threading
 
+from twisted.internet import reactor
+
 from Tribler.Core.Utilities.twisted_utils import callInThreadPool
 from Tribler.Core.simpledefs import (NTFY_TORRENTS, NTFY_PLAYLISTS, NTFY_COMMENTS,
                                      NTFY_MODIFICATIONS, NTFY_MODERATIONS, NTFY_MARKINGS, NTFY_MYPREFERENCES,
@@ -12,6 +14,7 @@ from Tribler.Core.simpledefs import (NTFY_TORRENTS, NTFY_PLAYLISTS, NTFY_COMMENT
                                      NTFY_STARTUP_TICK, NTFY_CLOSE_TICK,NTFY_UPGRADER,
                                      SIGNAL_ALLCHANNEL_COMMUNITY, SIGNAL_SEARCH_COMMUNITY, SIGNAL_TORRENT,
                                      SIGNAL_CHANNEL, SIGNAL_CHANNEL_COMMUNITY, SIGNAL_RSS_FEED)
+from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_reactor_thread
 
 
 class Notifier(object):
@@ -27,11 +30,18 @@ class Notifier(object):
 
         self.use_pool = use_pool
 
-        self.observers = []
+        # {(subject, changeType): [(func, id, cache)]}, the lists are replaced rather than changed, so notify can use
+        # them without holding the lock
+        self.observers = {}
+        # {func: [events]} of the cached observers, and {func: DelayedCall} that delivers them
         self.observerscache = {}
         self.observertimers = {}
         self.observerLock = threading.Lock()
 
+        # {(subject, changeType): [(func, args)]} of the calls to uncached observers that are waiting for a thread from
+        # the pool
+        self.pending_calls = {}
+
     def add_observer(self, func, subject, changeTypes=[NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE], id=None, cache=0):
         """
         Add observer function which will be called upon certain event
@@ -45,81 +55,107 @@ class Notifier(object):
         assert isinstance(changeTypes, list)
         assert subject in self.SUBJECTS, 'Subject %s not in SUBJECTS' % subject
 
-        obs = (func, subject, changeTypes, id, cache)
-        self.observerLock.acquire()
-        self.observers.append(obs)
-        self.observerLock.release()
+        obs = (func, id, cache)
+        with self.observerLock:
+            for changeType in changeTypes:
+                key = (subject, changeType)
+                self.observers[key] = self.observers.get(key, []) + [obs]
 
     def remove_observer(self, func):
         """ Remove all observers with function func
         """
         with self.observerLock:
-            i = 0
-            while i < len(self.observers):
-                ofunc = self.observers[i][0]
-                if ofunc == func:
-                    del self.observers[i]
+            for key, observers in self.observers.items():
+                observers = [obs for obs in observers if obs[0] != func]
+                if observers:
+                    self.observers[key] = observers
                 else:
-                    i += 1
+                    del self.observers[key]
 
+    @blocking_call_on_reactor_thread
     def remove_observers(self):
         with self.observerLock:
             for timer in self.observertimers.values():
                 timer.cancel()
             self.observerscache = {}
             self.observertimers = {}
-            self.observers = []
+            self.observers = {}
+            self.pending_calls = {}
 
     def notify(self, subject, changeType, obj_id, *args):
         """
         Notify all interested observers about an event with threads from the pool
         """
-        tasks = []
         assert subject in self.SUBJECTS, 'Subject %s not in SUBJECTS' % subject
 
+        observers = self.observers.get((subject, changeType))
+        if not observers:
+            return
+
         args = [subject, changeType, obj_id] + list(args)
 
-        self.observerLock.acquire()
-        for ofunc, osubject, ochangeTypes, oid, cache in self.observers:
-            try:
-                if (subject == osubject and
-                    changeType in ochangeTypes and
-                        (oid is None or oid == obj_id)):
-
-                    if not cache:
-                        tasks.append(ofunc)
-                    else:
-                        if ofunc not in self.observerscache:
-                            def doQueue(ofunc):
-                                self.observerLock.acquire()
-                                if ofunc in self.observerscache:
-                                    events = self.observerscache[ofunc]
-                                    del self.observerscache[ofunc]
-                                    del self.observertimers[ofunc]
-                                else:
-                                    events = []
-                                self.observerLock.release()
-
-                                if events:
-                                    if self.use_pool:
-                                        callInThreadPool(ofunc, events)
-                                    else:
-                                        ofunc(events)
-
-                            t = threading.Timer(cache, doQueue, (ofunc,))
-                            t.setName("Notifier-timer-%s" % subject)
-                            t.start()
-
-                            self.observerscache[ofunc] = []
-                            self.observertimers[ofunc] = t
-
-                        self.observerscache[ofunc].append(args)
-            except:
-                self._logger.exception("OIDs were %s %s", repr(oid), repr(obj_id))
+        tasks = []
+        for ofunc, oid, cache in observers:
+            if oid is not None and oid != obj_id:
+                continue
+
+            if not cache:
+                tasks.append(ofunc)
+                continue
+
+            with self.observerLock:
+                events = self.observerscache.get(ofunc)
+                if events is None:
+                    self.observerscache[ofunc] = [args]
+                else:
+                    events.append(args)
+            if events is None:
+                self._start_timer(ofunc, cache)
+
+        if not tasks:
+            return
+
+        if not self.use_pool:
+            for task in tasks:
+                task(*args)  # call observer function in this thread
+            return
 
-        self.observerLock.release()
-        for task in tasks:
+        # the calls are queued per subject and change type, and a single pool thread makes all calls for that key that
+        # have been queued by then, rather than using a thread from the pool for every call. Other keys don't have to
+        # wait for a slow observer when the pool has threads to spare.
+        key = (subject, changeType)
+        with self.observerLock:
+            calls = self.pending_calls.get(key)
+            if calls is None:
+                self.pending_calls[key] = [(task, args) for task in tasks]
+            else:
+                calls.extend((task, args) for task in tasks)
+        if calls is None:
+            callInThreadPool(self._call_pending, key)
+
+    @call_on_reactor_thread
+    def _start_timer(self, ofunc, cache):
+        # the events may have been delivered, or the observers removed, before this runs
+        if ofunc in self.observerscache and ofunc not in self.observertimers:
+            self.observertimers[ofunc] = reactor.callLater(cache, self._deliver_cached, ofunc)
+
+    def _deliver_cached(self, ofunc):
+        with self.observerLock:
+            self.observertimers.pop(ofunc, None)
+            events = self.observerscache.pop(ofunc, None)
+
+        if events:
             if self.use_pool:
-                callInThreadPool(task, *args)
+                callInThreadPool(ofunc, events)
             else:
-                task(*args)  # call observer function in this thread
+                ofunc(events)
+
+    def _call_pending(self, key):
+        with self.observerLock:
+            calls = self.pending_calls.pop(key, [])
+
+        for task, args in calls:
+            try:
+                task(*args)
+            except:
+                self._logger.exception("observer %s failed on %s", task, args[:3])
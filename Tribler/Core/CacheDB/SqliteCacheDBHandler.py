@@ -7,6 +7,7 @@ import logging
 import os
 import threading
 import json
+from binascii import hexlify
 from copy import deepcopy
 from pprint import pformat
 from struct import unpack_from
@@ -18,7 +19,8 @@ from twisted.internet.task import LoopingCall
 
 from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin
 from Tribler.Core.TorrentDef import TorrentDef
-from Tribler.Core.Utilities.search_utils import split_into_keywords, filter_keywords
+from Tribler.Core.Utilities.search_utils import (split_into_keywords, filter_keywords, get_trigrams,
+                                                  get_term_trigram_rows, levenshtein_distance)
 from Tribler.Core.Utilities.unicode import dunno2unicode
 from Tribler.Core.simpledefs import (INFOHASH_LENGTH, NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE, NTFY_CREATE,
                                      NTFY_MODIFIED, NTFY_TRACKERINFO, NTFY_MYPREFERENCES, NTFY_VOTECAST, NTFY_TORRENTS,
@@ -33,6 +35,22 @@ VOTECAST_FLUSH_DB_INTERVAL = 15
 
 DEFAULT_ID_CACHE_SIZE = 1024 * 5
 
+# number of ranked rows fetched for a remote search (a torrent can be in several channels),
+# and the number of results returned
+REMOTE_SEARCH_MAX_ROWS = 100
+REMOTE_SEARCH_MAX_RESULTS = 25
+# number of full text matches, best seeded first, that are ranked for a remote search
+REMOTE_SEARCH_MAX_CANDIDATES = 2500
+
+# number of terms sharing the most trigrams with a keyword that are compared when looking for a suggestion
+SEARCH_SUGGESTION_CANDIDATES = 50
+# number of terms looked up per trigram, common trigrams like "ing" occur in a large part of all terms
+SEARCH_SUGGESTION_TRIGRAM_TERMS = 1000
+SEARCH_SUGGESTION_MAX_TRIGRAMS = 100
+
+# shorter prefixes match too large a part of the search terms to sort them by frequency while the user is typing
+AUTOCOMPLETE_MIN_PREFIX_LENGTH = 3
+
 
 class LimitedOrderedDict(OrderedDict):
 
@@ -254,14 +272,14 @@ class TorrentDBHandler(BasicDBHandler):
             if infohash in self.infohash_id:
                 to_return[infohash] = self.infohash_id[infohash]
             else:
-                to_select.append(bin2str(infohash))
+                to_select.append(buffer(infohash))
 
         parameters = '?,' * len(to_select)
         parameters = parameters[:-1]
         sql_stmt = u"SELECT torrent_id, infohash FROM Torrent WHERE infohash IN (%s)" % parameters
         torrents = self._db.fetchall(sql_stmt, to_select)
         for torrent_id, infohash in torrents:
-            self.infohash_id[str2bin(infohash)] = torrent_id
+            self.infohash_id[str(infohash)] = torrent_id
 
         for infohash in unique_infohashes:
             if infohash not in to_return:
@@ -272,7 +290,7 @@ class TorrentDBHandler(BasicDBHandler):
             self._logger.error("to_return:")
             self._logger.error(pformat(to_return))
             self._logger.error("infohashes:")
-            self._logger.error(pformat([bin2str(infohash) for infohash in unique_infohashes]))
+            self._logger.error(pformat([hexlify(infohash) for infohash in unique_infohashes]))
             assert len(to_return) == len(unique_infohashes), (len(to_return), len(unique_infohashes))
 
         return to_return
@@ -281,7 +299,7 @@ class TorrentDBHandler(BasicDBHandler):
         sql_get_infohash = "SELECT infohash FROM Torrent WHERE torrent_id==?"
         ret = self._db.fetchone(sql_get_infohash, (torrent_id,))
         if ret:
-            ret = str2bin(ret)
+            ret = str(ret)
         return ret
 
     def hasTorrent(self, infohash):
@@ -289,8 +307,7 @@ class TorrentDBHandler(BasicDBHandler):
         assert len(infohash) == INFOHASH_LENGTH, "INFOHASH has invalid length: %d" % len(infohash)
         if infohash in self.existed_torrents:  # to do: not thread safe
             return True
-        infohash_str = bin2str(infohash)
-        existed = self._db.getOne('CollectedTorrent', 'torrent_id', infohash=infohash_str)
+        existed = self._db.getOne('CollectedTorrent', 'torrent_id', infohash=buffer(infohash))
         if existed is None:
             return False
         else:
@@ -341,7 +358,7 @@ class TorrentDBHandler(BasicDBHandler):
 
                 insert_files = [(torrent_id, unicode(path), length) for path, length in files]
                 sql_insert_files = "INSERT OR IGNORE INTO TorrentFiles (torrent_id, path, length) VALUES (?,?,?)"
-                self._db.executemany(sql_insert_files, insert_files)
+                self._db.queue_writemany(sql_insert_files, insert_files)
             except:
                 self._logger.error("Could not create a TorrentDef instance %r %r %r %r %r %r", infohash, timestamp, name, files, trackers, extra_info)
                 print_exc()
@@ -352,7 +369,7 @@ class TorrentDBHandler(BasicDBHandler):
 
         torrent_id = self.getTorrentID(infohash)
         if torrent_id is None:
-            self._db.insert('Torrent', infohash=bin2str(infohash), status=u'unknown')
+            self._db.insert('Torrent', infohash=buffer(infohash), status=u'unknown')
             torrent_id = self.getTorrentID(infohash)
         return torrent_id
 
@@ -364,7 +381,7 @@ class TorrentDBHandler(BasicDBHandler):
                 to_be_inserted.add(infohash)
 
         sql = "INSERT INTO Torrent (infohash, status) VALUES (?, ?)"
-        self._db.executemany(sql, [(bin2str(infohash), u'unknown') for infohash in to_be_inserted])
+        self._db.executemany(sql, [(buffer(infohash), u'unknown') for infohash in to_be_inserted])
 
         torrent_id_results = self.getTorrentIDS(infohashes)
         torrent_ids = []
@@ -377,7 +394,7 @@ class TorrentDBHandler(BasicDBHandler):
         assert isinstance(torrentdef, TorrentDef), "TORRENTDEF has invalid type: %s" % type(torrentdef)
         assert torrentdef.is_finalized(), "TORRENTDEF is not finalized"
 
-        dict = {"infohash": bin2str(torrentdef.get_infohash()),
+        dict = {"infohash": buffer(torrentdef.get_infohash()),
                 "name": torrentdef.get_name_as_unicode(),
                 "length": torrentdef.get_length(),
                 "creation_date": torrentdef.get_creation_date(),
@@ -451,6 +468,8 @@ class TorrentDBHandler(BasicDBHandler):
 
         values = (torrent_id, swarm_keywords, " ".join(filenames), " ".join(fileextensions))
         try:
+            old_swarmname = self._db.fetchone(u"SELECT swarmname FROM FullTextIndex WHERE rowid = ?", (torrent_id,))
+
             # INSERT OR REPLACE not working for fts3 table
             self._db.execute_write(u"DELETE FROM FullTextIndex WHERE rowid = ?", (torrent_id,))
             self._db.execute_write(
@@ -458,6 +477,24 @@ class TorrentDBHandler(BasicDBHandler):
         except:
             # this will fail if the fts3 module cannot be found
             print_exc()
+        else:
+            self._update_search_terms(old_swarmname, swarm_keywords)
+
+    def _update_search_terms(self, old_swarmname, new_swarmname):
+        """
+        Keeps the SearchTerm frequencies and the SearchTermTrigram index in sync with a changed swarmname.
+        """
+        old_terms = set(split_into_keywords(old_swarmname or u""))
+        new_terms = set(split_into_keywords(new_swarmname))
+
+        removed_terms = [(term,) for term in old_terms - new_terms]
+        added_terms = [(term,) for term in new_terms - old_terms]
+
+        self._db.queue_writemany(u"UPDATE SearchTerm SET frequency = frequency - 1 WHERE term = ?", removed_terms)
+        self._db.queue_writemany(u"INSERT OR IGNORE INTO SearchTerm (term, frequency) VALUES (?, 0)", added_terms)
+        self._db.queue_writemany(u"UPDATE SearchTerm SET frequency = frequency + 1 WHERE term = ?", added_terms)
+        self._db.queue_writemany(u"INSERT OR IGNORE INTO SearchTermTrigram (trigram, term) VALUES (?, ?)",
+                                 get_term_trigram_rows(new_terms - old_terms))
 
     # ------------------------------------------------------------
     # Adds the trackers of a given torrent into the database.
@@ -506,32 +543,30 @@ class TorrentDBHandler(BasicDBHandler):
                 kw.pop(key)
 
         if len(kw) > 0:
-            infohash_str = bin2str(infohash)
-            where = "infohash='%s'" % infohash_str
-            self._db.update(self.table_name, where, **kw)
+            torrent_id = self.getTorrentID(infohash)
+            if torrent_id is not None:
+                self._db.update(self.table_name, "torrent_id = %d" % torrent_id, **kw)
 
         if notify:
             self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, infohash)
 
     def on_torrent_collect_response(self, infohashes):
-        infohash_list = [(bin2str(infohash)) for infohash in infohashes]
-
-        i_parameters = u"?," * len(infohash_list)
+        i_parameters = u"?," * len(infohashes)
         i_parameters = i_parameters[:-1]
 
         sql = u"SELECT torrent_id, infohash FROM Torrent WHERE infohash in (%s)" % i_parameters
-        results = self._db.fetchall(sql, infohash_list)
+        results = self._db.fetchall(sql, map(buffer, infohashes))
 
         info_dict = {}
         for torrent_id, infohash in results:
             if infohash:
-                info_dict[infohash] = torrent_id
+                info_dict[str(infohash)] = torrent_id
 
         to_be_inserted = []
-        for infohash in infohash_list:
+        for infohash in infohashes:
             if infohash in info_dict:
                 continue
-            to_be_inserted.append((infohash,))
+            to_be_inserted.append((buffer(infohash),))
 
         if len(to_be_inserted) > 0:
             sql = u"INSERT OR IGNORE INTO Torrent (infohash) VALUES (?)"
@@ -540,9 +575,9 @@ class TorrentDBHandler(BasicDBHandler):
     def on_search_response(self, torrents):
         status = u'unknown'
 
-        torrents = [(bin2str(torrent[0]), torrent[1], torrent[2], torrent[3], torrent[4][0],
+        torrents = [(torrent[0], torrent[1], torrent[2], torrent[3], torrent[4][0],
                      torrent[5]) for torrent in torrents]
-        infohash = [(torrent[0],) for torrent in torrents]
+        infohash = [(buffer(torrent[0]),) for torrent in torrents]
 
         sql = u"SELECT torrent_id, infohash, is_collected, name FROM Torrent WHERE infohash == ?"
         results = self._db.executemany(sql, infohash) or []
@@ -569,22 +604,22 @@ class TorrentDBHandler(BasicDBHandler):
 
             if tid:  # we know this torrent
                 if tid not in tid_collected and swarmname != tid_name.get(tid, ''):  # if not collected and name not equal then do fullupdate
-                    update.append((swarmname, length, nrfiles, category, creation_date, infohash, status, tid))
+                    update.append((swarmname, length, nrfiles, category, creation_date, buffer(infohash), status, tid))
                     to_be_indexed.append((tid, swarmname))
 
                 elif infohash and infohash not in infohash_tid:
-                    update_infohash.append((infohash, tid))
+                    update_infohash.append((buffer(infohash), tid))
             else:
-                insert.append((swarmname, length, nrfiles, category, creation_date, infohash, status))
+                insert.append((swarmname, length, nrfiles, category, creation_date, buffer(infohash), status))
 
         if len(update) > 0:
             sql = u"UPDATE Torrent SET name = ?, length = ?, num_files = ?, category = ?, creation_date = ?," \
                   u" infohash = ?, status = ? WHERE torrent_id = ?"
-            self._db.executemany(sql, update)
+            self._db.queue_writemany(sql, update)
 
         if len(update_infohash) > 0:
             sql = u"UPDATE Torrent SET infohash = ? WHERE torrent_id = ?"
-            self._db.executemany(sql, update_infohash)
+            self._db.queue_writemany(sql, update_infohash)
 
         if len(insert) > 0:
             sql = u"INSERT INTO Torrent (name, length, num_files, category, creation_date, infohash," \
@@ -612,9 +647,9 @@ class TorrentDBHandler(BasicDBHandler):
         sql = u"UPDATE Torrent SET num_seeders = ?, num_leechers = ?, last_tracker_check = ?, next_tracker_check = ?," \
               u" status = ?, tracker_check_retries = ? WHERE torrent_id = ?"
 
-        self._db.execute_write(sql, (seeders, leechers, last_check, next_check, status, retries, torrent_id))
+        self._db.queue_write(sql, (seeders, leechers, last_check, next_check, status, retries, torrent_id))
 
-        self._logger.debug(u"update result %d/%d for %s/%d", seeders, leechers, bin2str(infohash), torrent_id)
+        self._logger.debug(u"update result %d/%d for %s/%d", seeders, leechers, hexlify(infohash), torrent_id)
 
         # notify
         self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, infohash)
@@ -674,16 +709,22 @@ class TorrentDBHandler(BasicDBHandler):
                 # have to use bencode to get around the TorrentDef.is_finalized() check in TorrentDef.encode()
                 self.session.save_collected_torrent(infohash, bencode(tdef.metainfo))
 
-    def getTorrentsOnTracker(self, tracker, current_time):
+    def getTorrentsOnTracker(self, tracker, current_time, limit=-1):
+        """
+        Returns the torrents on the given tracker that are due for a check, the most overdue ones first.
+        """
         sql = """
-            SELECT T.torrent_id, T.infohash, T.last_tracker_check
+            SELECT T.torrent_id, T.infohash, T.last_tracker_check, T.next_tracker_check, T.num_seeders
               FROM Torrent T, TrackerInfo TI, TorrentTrackerMapping TTM
               WHERE TI.tracker = ?
               AND TI.tracker_id = TTM.tracker_id AND T.torrent_id = TTM.torrent_id
               AND next_tracker_check < ?
+              ORDER BY next_tracker_check
+              LIMIT ?
             """
-        infohash_list = self._db.fetchall(sql, (tracker, current_time))
-        return [(torrent_id, str2bin(infohash), last_tracker_check) for torrent_id, infohash, last_tracker_check in infohash_list]
+        infohash_list = self._db.fetchall(sql, (tracker, current_time, limit))
+        return [(torrent_id, str(infohash), last_tracker_check, next_tracker_check, num_seeders or 0)
+                for torrent_id, infohash, last_tracker_check, next_tracker_check, num_seeders in infohash_list]
 
     def getTrackerListByTorrentID(self, torrent_id):
         sql = 'SELECT TR.tracker FROM TrackerInfo TR, TorrentTrackerMapping MP'\
@@ -736,7 +777,7 @@ class TorrentDBHandler(BasicDBHandler):
         else:
             keys = list(keys)
 
-        res = self._db.getOne('Torrent C', keys, infohash=bin2str(infohash))
+        res = self._db.getOne('Torrent C', keys, infohash=buffer(infohash))
 
         if not res:
             return None
@@ -772,7 +813,7 @@ class TorrentDBHandler(BasicDBHandler):
                 for i in range(len(results)):
                     result = list(results[i])
                     if result[key_index]:
-                        result[key_index] = str2bin(result[key_index])
+                        result[key_index] = str(result[key_index])
                         results[i] = result
         fix_value('infohash')
         return results
@@ -789,7 +830,7 @@ class TorrentDBHandler(BasicDBHandler):
              AND T.secret is not 1 ORDER BY CT.insert_time DESC LIMIT ?
              """
         results = self._db.fetchall(sql, (limit,))
-        return [[str2bin(result[0]), result[1], result[2], result[3] or 0, result[4]] for result in results]
+        return [[str(result[0]), result[1], result[2], result[3] or 0, result[4]] for result in results]
 
     def getRandomlyCollectedTorrents(self, insert_time, limit):
         sql = u"""
@@ -800,7 +841,7 @@ class TorrentDBHandler(BasicDBHandler):
              AND T.secret is not 1 ORDER BY RANDOM() DESC LIMIT ?
             """
         results = self._db.fetchall(sql, (insert_time, limit))
-        return [[str2bin(result[0]), result[1], result[2], result[3] or 0] for result in results]
+        return [[str(result[0]), result[1], result[2], result[3] or 0] for result in results]
 
     def select_torrents_to_collect(self, hashes):
         parameters = '?,' * len(hashes)
@@ -809,8 +850,8 @@ class TorrentDBHandler(BasicDBHandler):
         # TODO: bias according to votecast, popular first
 
         sql = u"SELECT infohash FROM Torrent WHERE is_collected == 0 AND infohash IN (%s)" % parameters
-        results = self._db.fetchall(sql, map(bin2str, hashes))
-        return [str2bin(infohash) for infohash, in results]
+        results = self._db.fetchall(sql, map(buffer, hashes))
+        return [str(infohash) for infohash, in results]
 
     def getTorrentsStats(self):
         return self._db.getOne('CollectedTorrent', ['count(torrent_id)', 'sum(length)', 'sum(num_files)'])
@@ -871,12 +912,24 @@ class TorrentDBHandler(BasicDBHandler):
         assert 'infohash' in keys
         assert not doSort or ('num_seeders' in keys or 'T.num_seeders' in keys)
 
-        infohash_index = keys.index('infohash')
-        num_seeders_index = keys.index('num_seeders') if 'num_seeders' in keys else -1
+        sql, args = self._get_search_names_sql(kws, local, keys)
+        results = self._db.fetchall(sql, args)
+        return self._process_search_names_results(results, kws, local, keys, doSort)
 
-        if num_seeders_index == -1:
-            doSort = False
+    def search_names_async(self, kws, local=True, keys=None, doSort=True):
+        """
+        Same as searchNames, but runs the full text query on the read connection pool.
+        Returns a Deferred firing with the results.
+        """
+        assert 'infohash' in keys
+        assert not doSort or ('num_seeders' in keys or 'T.num_seeders' in keys)
+
+        sql, args = self._get_search_names_sql(kws, local, keys)
+        deferred = self._db.fetchall_async(sql, args)
+        deferred.addCallback(self._process_search_names_results, kws, local, keys, doSort)
+        return deferred
 
+    def _get_search_names_sql(self, kws, local, keys):
         values = ", ".join(keys)
         mainsql = "SELECT " + values + ", C.channel_id, Matchinfo(FullTextIndex) FROM"
         if local:
@@ -886,16 +939,39 @@ class TorrentDBHandler(BasicDBHandler):
 
         mainsql += """, FullTextIndex
                     LEFT OUTER JOIN _ChannelTorrents C ON T.torrent_id = C.torrent_id
-                    WHERE t.name IS NOT NULL AND t.torrent_id = FullTextIndex.rowid AND C.deleted_at IS NULL AND FullTextIndex MATCH ?
                     """
-
         if not local:
-            mainsql += "AND T.secret is not 1 LIMIT 250"
+            mainsql += "LEFT OUTER JOIN _Channels CH ON C.channel_id = CH.id\n"
+
+        mainsql += """WHERE t.name IS NOT NULL AND t.torrent_id = FullTextIndex.rowid AND C.deleted_at IS NULL AND FullTextIndex MATCH ?
+                    """
 
         query = " ".join(filter_keywords(kws))
-        not_negated = [kw for kw in filter_keywords(kws) if kw[0] != '-']
+        if local:
+            return mainsql, (query,)
+
+        # only the best matches are returned to remote peers, so let SQLite rank them and stop after the top rows.
+        # Common keywords match a large part of the index, so only the best seeded matches are ranked. The seeders
+        # weigh most in the rank, the newest torrents go first among matches with equally many seeders.
+        mainsql += """AND T.secret is not 1
+                    AND T.torrent_id IN (SELECT torrent_id FROM CollectedTorrent
+                                         WHERE name IS NOT NULL AND secret IS NOT 1
+                                         AND torrent_id IN (SELECT rowid FROM FullTextIndex
+                                                            WHERE FullTextIndex MATCH ?)
+                                         ORDER BY num_seeders DESC, torrent_id DESC LIMIT ?)
+                    ORDER BY search_rank(Matchinfo(FullTextIndex), (SELECT max(torrent_id) FROM Torrent),
+                                         T.num_seeders, CH.nr_favorite, CH.nr_spam) DESC
+                    LIMIT ?"""
+        return mainsql, (query, query, REMOTE_SEARCH_MAX_CANDIDATES, REMOTE_SEARCH_MAX_ROWS)
+
+    def _process_search_names_results(self, results, kws, local, keys, doSort):
+        infohash_index = keys.index('infohash')
+        num_seeders_index = keys.index('num_seeders') if 'num_seeders' in keys else -1
 
-        results = self._db.fetchall(mainsql, (query,))
+        if num_seeders_index == -1:
+            doSort = False
+
+        not_negated = [kw for kw in filter_keywords(kws) if kw[0] != '-']
 
         channels = set()
         channel_dict = {}
@@ -913,7 +989,8 @@ class TorrentDBHandler(BasicDBHandler):
 
         myChannelId = self.channelcast_db._channel_id or 0
 
-        result_dict = {}
+        # remote results are ranked by SQLite, keep them in that order
+        result_dict = OrderedDict()
 
         # step 1, merge torrents keep one with best channel
         for result in results:
@@ -956,7 +1033,7 @@ class TorrentDBHandler(BasicDBHandler):
         for i in xrange(len(results) - 1, -1, -1):
             result = results[i]
 
-            result[infohash_index] = str2bin(result[infohash_index])
+            result[infohash_index] = str(result[infohash_index])
 
             matches = {'swarmname': set(), 'filenames': set(), 'fileextensions': set()}
 
@@ -989,78 +1066,72 @@ class TorrentDBHandler(BasicDBHandler):
 
 
         if doSort:
-            def compare(a, b):
-                return cmp(a[num_seeders_index], b[num_seeders_index])
-            results.sort(compare, reverse=True)
+            results.sort(key=lambda result: result[num_seeders_index], reverse=True)
         results.extend(dont_sort_list)
 
         if not local:
-            results = results[:25]
+            results = results[:REMOTE_SEARCH_MAX_RESULTS]
 
         return results
 
     def getAutoCompleteTerms(self, keyword, max_terms, limit=100):
-        sql = "SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? LIMIT ?"
-        result = self._db.fetchall(sql, (keyword + '*', limit))
-
-        all_terms = set()
-        for line, in result:
-            if len(all_terms) >= max_terms:
-                break
-            i1 = line.find(keyword)
-            i2 = line.find(' ', i1 + len(keyword))
-            all_terms.add(line[i1:i2] if i2 >= 0 else line[i1:])
-
-        if keyword in all_terms:
-            all_terms.remove(keyword)
-        if '' in all_terms:
-            all_terms.remove('')
+        """
+        Returns up to max_terms known search terms that start with keyword, most frequent first.
+        The prefix is resolved as a range scan on the SearchTerm primary key, so only matching terms are visited.
+        Keywords shorter than AUTOCOMPLETE_MIN_PREFIX_LENGTH aren't completed.
+        """
+        if not isinstance(keyword, unicode):
+            keyword = keyword.decode('utf-8')
+        keyword = keyword.lower()
+        if len(keyword) < AUTOCOMPLETE_MIN_PREFIX_LENGTH:
+            return []
 
-        return list(all_terms)
+        # All terms starting with keyword sort between keyword and keyword followed by 0xFFFF, as terms are stored as
+        # UTF-8 and 0xFF bytes don't occur in UTF-8
+        sql = u"SELECT term FROM SearchTerm WHERE term > ? AND term < ? || X'FFFF' AND frequency > 0" \
+              u" ORDER BY frequency DESC LIMIT ?"
+        result = self._db.fetchall(sql, (keyword, keyword, min(max_terms, limit)))
+        return [term for term, in result]
 
     def getSearchSuggestion(self, keywords, limit=1):
         match = [keyword.lower() for keyword in keywords if len(keyword) > 3]
 
-        def lev(a, b):
-            "Calculates the Levenshtein distance between a and b."
-            n, m = len(a), len(b)
-            if n > m:
-                # Make sure n <= m, to use O(min(n,m)) space
-                a, b = b, a
-                n, m = m, n
-
-            current = range(n + 1)
-            for i in range(1, m + 1):
-                previous, current = current, [i] + [0] * n
-                for j in range(1, n + 1):
-                    add, delete = previous[j] + 1, current[j - 1] + 1
-                    change = previous[j - 1]
-                    if a[j - 1] != b[i - 1]:
-                        change = change + 1
-                    current[j] = min(add, delete, change)
-
-            return current[n]
-
-        def levcollate(s1, s2):
-            l1 = sum(sorted([lev(a, b) for a in s1.split() for b in match])[:len(match)])
-            l2 = sum(sorted([lev(a, b) for a in s2.split() for b in match])[:len(match)])
-
-            # return -1 if s1<s2, +1 if s1>s2 else 0
-            if l1 < l2:
-                return -1
-            if l1 > l2:
-                return 1
-            return 0
+        terms = []
+        for keyword in match:
+            term = self._get_closest_search_term(keyword)
+            if term and term not in terms:
+                terms.append(term)
 
-        cursor = self._db.get_cursor()
-        connection = cursor.getconnection()
-        connection.createcollation("leven", levcollate)
+        if not terms:
+            return []
 
-        sql = "SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? ORDER By swarmname collate leven ASC LIMIT ?"
-        results = self._db.fetchall(sql, (' OR '.join(['*%s*' % m for m in match]), limit))
-        connection.createcollation("leven", None)
+        sql = "SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? LIMIT ?"
+        results = self._db.fetchall(sql, (' OR '.join(terms), limit))
         return [result[0] for result in results]
 
+    def _get_closest_search_term(self, keyword):
+        """
+        Returns the indexed term with the smallest edit distance to keyword, preferring frequent terms on a tie.
+        Only the terms sharing the most trigrams with keyword are considered.
+        """
+        # SQLite limits the number of terms of a compound select, so only part of the trigrams of long keywords is used
+        trigrams = list(get_trigrams(keyword))[:SEARCH_SUGGESTION_MAX_TRIGRAMS]
+
+        # a bounded number of terms is taken from every trigram, so common trigrams don't make this a table scan
+        trigram_sql = "SELECT term FROM (SELECT term FROM SearchTermTrigram WHERE trigram = ? LIMIT ?)"
+        sql = "SELECT T.term, S.frequency FROM (" + " UNION ALL ".join([trigram_sql] * len(trigrams)) + ") T," + \
+              " SearchTerm S WHERE S.term = T.term AND S.frequency > 0" + \
+              " GROUP BY T.term ORDER BY count(*) DESC, S.frequency DESC LIMIT ?"
+        args = []
+        for trigram in trigrams:
+            args.extend((trigram, SEARCH_SUGGESTION_TRIGRAM_TERMS))
+        candidates = self._db.fetchall(sql, args + [SEARCH_SUGGESTION_CANDIDATES])
+        if not candidates:
+            return None
+
+        term, _ = min(candidates, key=lambda candidate: (levenshtein_distance(keyword, candidate[0]), -candidate[1]))
+        return term
+
 
 class MyPreferenceDBHandler(BasicDBHandler):
 
@@ -1091,7 +1162,7 @@ class MyPreferenceDBHandler(BasicDBHandler):
 
         res = self._db.fetchall(sql)
         res = [item for sublist in res for item in sublist]
-        return [str2bin(p) if p else '' for p in res]
+        return [str(p) if p else '' for p in res]
 
     def getMyPrefStats(self, torrent_id=None):
         value_name = ('torrent_id', 'destination_path',)
@@ -1211,7 +1282,7 @@ class VoteCastDBHandler(BasicDBHandler):
 
             updates = [(positive_votes.get(channel_id, 0), negative_votes.get(channel_id, 0), channel_id)
                        for channel_id in channel_ids]
-            self._db.executemany("UPDATE OR IGNORE _Channels SET nr_favorite = ?, nr_spam = ? WHERE id = ?", updates)
+            self._db.queue_writemany("UPDATE OR IGNORE _Channels SET nr_favorite = ?, nr_spam = ? WHERE id = ?", updates)
 
             for channel_id in channel_ids:
                 self.notifier.notify(NTFY_VOTECAST, NTFY_UPDATE, channel_id)
@@ -1325,7 +1396,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         torrent_list = []
         for torrent_id, info_hash, name, length, category, status, num_seeders, num_leechers, metadata_json in result_list:
             torrent_dict = {'id': torrent_id,
-                            'info_hash': str2bin(info_hash),
+                            'info_hash': str(info_hash),
                             'name': name,
                             'length': length,
                             'category': category,
@@ -1445,7 +1516,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
 
         sql_update_channel = "UPDATE _Channels SET modified = strftime('%s','now'), nr_torrents = nr_torrents+? WHERE id = ?"
         update_channels = [(new_torrents, channel_id) for channel_id, new_torrents in updated_channels.iteritems()]
-        self._db.executemany(sql_update_channel, update_channels)
+        self._db.queue_writemany(sql_update_channel, update_channels)
 
         for channel_id in updated_channels.keys():
             self.notifier.notify(NTFY_CHANNELCAST, NTFY_UPDATE, channel_id)
@@ -1474,7 +1545,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             infohash = self._db.fetchone(sql, (channeltorrent_id,))
 
             if infohash:
-                infohash = str2bin(infohash)
+                infohash = str(infohash)
                 self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, infohash)
 
         elif modification_type in ['swift-url']:
@@ -1557,9 +1628,9 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
 
         # try fo fix loose reply_to and reply_after pointers
         sql = "UPDATE _Comments SET reply_to_id = ? WHERE reply_to_id = ?"
-        self._db.execute_write(sql, (dispersy_id, mid_global_time))
+        self._db.queue_write(sql, (dispersy_id, mid_global_time))
         sql = "UPDATE _Comments SET reply_after_id = ? WHERE reply_after_id = ?"
-        self._db.execute_write(sql, (dispersy_id, mid_global_time))
+        self._db.queue_write(sql, (dispersy_id, mid_global_time))
 
         self.notifier.notify(NTFY_COMMENTS, NTFY_INSERT, channel_id)
         if playlist_dispersy_id:
@@ -1630,7 +1701,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         if playlist_id:
             get_channeltorent_id = """SELECT id FROM _ChannelTorrents, Torrent
             WHERE _ChannelTorrents.torrent_id = Torrent.torrent_id AND Torrent.infohash = ?"""
-            channeltorrent_id = self._db.fetchone(get_channeltorent_id, (bin2str(infohash),))
+            channeltorrent_id = self._db.fetchone(get_channeltorent_id, (buffer(infohash),))
 
             if channeltorrent_id:
                 sql = "UPDATE _PlaylistTorrents SET deleted_at = ? WHERE playlist_id = ? AND channeltorrent_id = ?"
@@ -1784,7 +1855,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         AND ChannelTorrents.channel_id==? and ChannelTorrents.dispersy_id <> -1 order by time_stamp desc limit ?"""
         myrecenttorrents = self._db.fetchall(sql, (self._channel_id, NUM_OWN_RECENT_TORRENTS))
         for cid, infohash, timestamp in myrecenttorrents:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+            torrent_dict.setdefault(str(cid), set()).add(str(infohash))
             least_recent = timestamp
 
         if len(myrecenttorrents) == NUM_OWN_RECENT_TORRENTS and least_recent != -1:
@@ -1794,10 +1865,10 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?"""
             myrandomtorrents = self._db.fetchall(sql, (self._channel_id, least_recent, NUM_OWN_RANDOM_TORRENTS))
             for cid, infohash, _ in myrecenttorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+                torrent_dict.setdefault(str(cid), set()).add(str(infohash))
 
             for cid, infohash in myrandomtorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+                torrent_dict.setdefault(str(cid), set()).add(str(infohash))
 
         nr_records = sum(len(torrents) for torrents in torrent_dict.values())
         additionalSpace = (NUM_OWN_RECENT_TORRENTS + NUM_OWN_RANDOM_TORRENTS) - nr_records
@@ -1818,7 +1889,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         WHERE voter_id ISNULL AND vote=2) and ChannelTorrents.dispersy_id <> -1 ORDER BY time_stamp desc limit ?"""
         othersrecenttorrents = self._db.fetchall(sql, (NUM_OTHERS_RECENT_TORRENTS,))
         for cid, infohash, timestamp in othersrecenttorrents:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+            torrent_dict.setdefault(str(cid), set()).add(str(infohash))
             least_recent = timestamp
 
         if othersrecenttorrents and len(othersrecenttorrents) == NUM_OTHERS_RECENT_TORRENTS and least_recent != -1:
@@ -1829,7 +1900,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             AND ChannelTorrents.dispersy_id <> -1 order by random() limit ?"""
             othersrandomtorrents = self._db.fetchall(sql, (least_recent, NUM_OTHERS_RANDOM_TORRENTS))
             for cid, infohash in othersrandomtorrents:
-                torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+                torrent_dict.setdefault(str(cid), set()).add(str(infohash))
 
         twomonthsago = long(time() - 5259487)
         nr_records = sum(len(torrents) for torrents in torrent_dict.values())
@@ -1844,7 +1915,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         AND ChannelTorrents.dispersy_id <> -1 and Channels.modified > ? order by time_stamp desc limit ?"""
         interesting_records = self._db.fetchall(sql, (twomonthsago, NUM_OTHERS_DOWNLOADED))
         for cid, infohash in interesting_records:
-            torrent_dict.setdefault(str(cid), set()).add(str2bin(infohash))
+            torrent_dict.setdefault(str(cid), set()).add(str(infohash))
 
         return torrent_dict
 
@@ -1854,20 +1925,20 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
 
         returnar = []
         for infohash, in self._db.fetchall(sql, (channel_id, limit)):
-            returnar.append(str2bin(infohash))
+            returnar.append(str(infohash))
         return returnar
 
     def getTorrentFromChannelId(self, channel_id, infohash, keys):
         sql = "SELECT " + ", ".join(keys) + """ FROM Torrent, ChannelTorrents
               WHERE Torrent.torrent_id = ChannelTorrents.torrent_id AND channel_id = ? AND infohash = ?"""
-        result = self._db.fetchone(sql, (channel_id, bin2str(infohash)))
+        result = self._db.fetchone(sql, (channel_id, buffer(infohash)))
 
         return self.__fixTorrent(keys, result)
 
     def getChannelTorrents(self, infohash, keys):
         sql = "SELECT " ", ".join(keys) + """ FROM Torrent, ChannelTorrents
               WHERE Torrent.torrent_id = ChannelTorrents.torrent_id AND infohash = ?"""
-        results = self._db.fetchall(sql, (bin2str(infohash),))
+        results = self._db.fetchall(sql, (buffer(infohash),))
 
         return self.__fixTorrents(keys, results)
 
@@ -1965,7 +2036,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
               WHERE Torrent.torrent_id = ChannelTorrents.torrent_id
               AND ChannelTorrents.id = PlaylistTorrents.channeltorrent_id
               AND playlist_id = ? AND infohash = ?"""
-        result = self._db.fetchone(sql, (playlist_id, bin2str(infohash)))
+        result = self._db.fetchone(sql, (playlist_id, buffer(infohash)))
 
         return self.__fixTorrent(keys, result)
 
@@ -2062,14 +2133,14 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
     def __fixTorrent(self, keys, torrent):
         if len(keys) == 1:
             if keys[0] == 'infohash':
-                return str2bin(torrent)
+                return str(torrent) if torrent else torrent
             return torrent
 
         def fix_value(key, torrent):
             if key in keys:
                 key_index = keys.index(key)
                 if torrent[key_index]:
-                    torrent[key_index] = str2bin(torrent[key_index])
+                    torrent[key_index] = str(torrent[key_index])
         if torrent:
             torrent = list(torrent)
             fix_value('infohash', torrent)
@@ -2082,7 +2153,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
                 for i in range(len(results)):
                     result = list(results[i])
                     if result[key_index]:
-                        result[key_index] = str2bin(result[key_index])
+                        result[key_index] = str(result[key_index])
                         results[i] = result
         fix_value('infohash')
         return results
@@ -2166,7 +2237,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
                 sql += " name like '%" + keyword + "%' and"
 
             if dispersyOnly:
-                sql += " dispersy_cid != '-1'"
+                sql += " dispersy_cid != -1"
             else:
                 sql = sql[:-3]
 
@@ -2186,7 +2257,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
                 dispersy_cid = str(dispersy_cid)
                 torrents = self._db.fetchall(select_torrents, (channel_id, limitTorrents))
                 for infohash, ChTname, CoTname, time_stamp in torrents:
-                    infohash = str2bin(infohash)
+                    infohash = str(infohash)
                     results.append((channel_id, dispersy_cid, name, infohash, ChTname or CoTname, time_stamp))
             return results
         return []
@@ -2349,7 +2420,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
               FROM Channels, ChannelTorrents, Torrent
               WHERE Channels.id = ChannelTorrents.channel_id
               AND ChannelTorrents.torrent_id = Torrent.torrent_id AND infohash = ?"""
-        channels = self._db.fetchall(sql, (bin2str(infohash),))
+        channels = self._db.fetchall(sql, (buffer(infohash),))
 
         if len(channels) > 0:
             channel_ids = set()
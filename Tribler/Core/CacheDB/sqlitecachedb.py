@@ -7,13 +7,18 @@ from threading import currentThread, RLock
 
 import apsw
 from apsw import CantOpenError, SQLError
+from twisted.internet import reactor
+from twisted.internet.defer import maybeDeferred
+from twisted.internet.threads import deferToThreadPool
 from twisted.python.threadable import isInIOThread
+from twisted.python.threadpool import ThreadPool
 
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_reactor_thread
 
 from Tribler import LIBRARYNAME
 from Tribler.Core.CacheDB.db_versions import LATEST_DB_VERSION
+from Tribler.Core.Utilities.search_utils import fts_search_rank
 
 
 DB_SCRIPT_NAME = u"schema_sdb_v%s.sql" % str(LATEST_DB_VERSION)
@@ -26,6 +31,14 @@ DB_FILE_RELATIVE_PATH = os.path.join(DB_DIR_NAME, DB_FILE_NAME)
 
 DEFAULT_BUSY_TIMEOUT = 10000
 
+# number of read-only connections (and threads) serving the *_async read functions
+DEFAULT_READ_POOL_SIZE = 4
+
+# queued writes are executed and committed at most this many seconds after the first one was queued
+DEFAULT_WRITE_QUEUE_INTERVAL = 5.0
+# number of queued rows after which the write queue is flushed right away
+DEFAULT_WRITE_QUEUE_SIZE = 5000
+
 TRHEADING_DEBUG = False
 
 forceDBThread = call_on_reactor_thread
@@ -44,9 +57,17 @@ def str2bin(str_data):
     return decodestring(str_data)
 
 
+def sql_str2bin(str_data):
+    """ str2bin for SQL statements, turns a base64 encoded column value into a BLOB.
+    """
+    return buffer(str2bin(str(str_data))) if str_data else str_data
+
+
 class SQLiteCacheDB(TaskManager):
 
-    def __init__(self, db_path, db_script_path=None, busytimeout=DEFAULT_BUSY_TIMEOUT):
+    def __init__(self, db_path, db_script_path=None, busytimeout=DEFAULT_BUSY_TIMEOUT,
+                 read_pool_size=DEFAULT_READ_POOL_SIZE, write_queue_interval=DEFAULT_WRITE_QUEUE_INTERVAL,
+                 write_queue_size=DEFAULT_WRITE_QUEUE_SIZE):
         super(SQLiteCacheDB, self).__init__()
 
         self._logger = logging.getLogger(self.__class__.__name__)
@@ -54,6 +75,18 @@ class SQLiteCacheDB(TaskManager):
         self._cursor_lock = RLock()
         self._cursor_table = {}
 
+        # read-only connections used by the *_async functions, one per read pool thread
+        self._read_pool_size = read_pool_size
+        self._read_threadpool = None
+        self._read_connection_lock = RLock()
+        self._read_connection_table = {}
+
+        # write-behind queue, a list of [sql, [args, ...], on_error] executed in order by _flush_write_queue
+        self._write_queue = []
+        self._write_queue_rows = 0
+        self._write_queue_interval = write_queue_interval
+        self._write_queue_size = write_queue_size
+
         self._connection = None
         self.sqlite_db_path = db_path
         self.db_script_path = db_script_path
@@ -77,10 +110,16 @@ class SQLiteCacheDB(TaskManager):
 
         # open a connection to the database
         self._open_connection()
+        self._start_read_pool()
 
     @blocking_call_on_reactor_thread
     def close(self):
         self.cancel_all_pending_tasks()
+        if self._write_queue:
+            self._flush_write_queue()
+            if not self._connection.getautocommit():
+                self.commit_now(exiting=True)
+        self._stop_read_pool()
         with self._cursor_lock:
             for cursor in self._cursor_table.itervalues():
                 cursor.close()
@@ -113,6 +152,7 @@ class SQLiteCacheDB(TaskManager):
         except CantOpenError as e:
             msg = u"Failed to open connection to %s: %s" % (self.sqlite_db_path, e)
             raise CantOpenError(msg)
+        self._register_sql_functions(self._connection)
 
         cursor = self.get_cursor()
 
@@ -177,6 +217,47 @@ class SQLiteCacheDB(TaskManager):
         else:
             self._version = 1
 
+    def _register_sql_functions(self, connection):
+        """ Registers the Python functions available in SQL statements on a connection.
+        """
+        connection.createscalarfunction(u"search_rank", fts_search_rank, 5)
+        connection.createscalarfunction(u"str2bin", sql_str2bin, 1)
+
+    def _start_read_pool(self):
+        """ Starts the thread pool serving the asynchronous read functions. An in-memory database cannot be shared
+            between connections, so in that case (or if the pool size is 0) reads fall back to the main connection.
+        """
+        if self.sqlite_db_path == u":memory:" or self._read_pool_size <= 0:
+            return
+
+        self._read_threadpool = ThreadPool(minthreads=0, maxthreads=self._read_pool_size,
+                                           name=u"SQLiteCacheDB-read")
+        self._read_threadpool.start()
+
+    def _stop_read_pool(self):
+        if self._read_threadpool is not None:
+            self._read_threadpool.stop()
+            self._read_threadpool = None
+
+        with self._read_connection_lock:
+            for connection in self._read_connection_table.itervalues():
+                connection.close()
+            self._read_connection_table = {}
+
+    def _get_read_cursor(self):
+        """ Returns a cursor on the read-only connection of the calling read pool thread, opening it if needed.
+        """
+        thread_name = currentThread().getName()
+
+        with self._read_connection_lock:
+            connection = self._read_connection_table.get(thread_name)
+            if connection is None:
+                connection = apsw.Connection(self.sqlite_db_path, flags=apsw.SQLITE_OPEN_READONLY)
+                connection.setbusytimeout(self._busytimeout)
+                self._register_sql_functions(connection)
+                self._read_connection_table[thread_name] = connection
+        return connection.cursor()
+
     def get_cursor(self):
         thread_name = currentThread().getName()
 
@@ -208,6 +289,8 @@ class SQLiteCacheDB(TaskManager):
 
     @call_on_reactor_thread
     def commit_now(self, vacuum=False, exiting=False):
+        self._flush_write_queue()
+
         if self._should_commit and isInIOThread():
             try:
                 self._logger.info(u"Start committing...")
@@ -249,6 +332,9 @@ class SQLiteCacheDB(TaskManager):
 
     @blocking_call_on_reactor_thread
     def execute(self, sql, args=None):
+        # keep the order of queued and direct statements, and make queued writes visible to reads
+        self._flush_write_queue()
+
         cur = self.get_cursor()
 
         if self._show_execute:
@@ -274,6 +360,7 @@ class SQLiteCacheDB(TaskManager):
 
     @blocking_call_on_reactor_thread
     def executemany(self, sql, args=None):
+        self._flush_write_queue()
         self._should_commit = True
 
         cur = self.get_cursor()
@@ -303,6 +390,88 @@ class SQLiteCacheDB(TaskManager):
 
         self.execute(sql, args)
 
+    @call_on_reactor_thread
+    def queue_write(self, sql, args=None, on_error=None):
+        """ Queues a write statement instead of executing it right away. Consecutive statements with the same sql
+            are merged into a single executemany. Queued writes are executed in order before any other statement on
+            the main connection, and are committed in one transaction after at most write_queue_interval seconds.
+            When a row can't be written, on_error(exception, args) is called on the reactor thread, or the failure is
+            logged if no on_error is given. The other rows are written nonetheless.
+        """
+        self.queue_writemany(sql, [args or ()], on_error)
+
+    @call_on_reactor_thread
+    def queue_writemany(self, sql, args_list, on_error=None):
+        """ Same as queue_write, but for a list of argument tuples.
+        """
+        args_list = list(args_list)
+        if not args_list:
+            return
+
+        last = self._write_queue[-1] if self._write_queue else None
+        if last and last[0] == sql and last[2] == on_error:
+            last[1].extend(args_list)
+        else:
+            self._write_queue.append([sql, args_list, on_error])
+        self._write_queue_rows += len(args_list)
+
+        if self._write_queue_rows >= self._write_queue_size:
+            # back-pressure: the producer waits until the queue has been written out
+            self._commit_write_queue()
+        elif not self.is_pending_task_active(u"commit_write_queue"):
+            self.register_task(u"commit_write_queue",
+                               reactor.callLater(self._write_queue_interval, self._commit_write_queue))
+
+    def _flush_write_queue(self):
+        """ Executes all queued writes on the main connection, without committing them.
+        """
+        if not self._write_queue:
+            return
+
+        write_queue = self._write_queue
+        self._write_queue = []
+        self._write_queue_rows = 0
+        self.cancel_pending_task(u"commit_write_queue")
+
+        self._should_commit = True
+        cur = self.get_cursor()
+        for sql, args_list, on_error in write_queue:
+            if self._show_execute:
+                thread_name = currentThread().getName()
+                self._logger.info(u"===%s===\n%s\n-----\n%s\n======\n", thread_name, sql, args_list)
+
+            # the rows before a failing row have already been executed, so undo them before retrying row by row
+            cur.execute(u"SAVEPOINT write_queue")
+            try:
+                cur.executemany(sql, args_list)
+            except Exception:
+                cur.execute(u"ROLLBACK TO write_queue")
+                cur.execute(u"RELEASE write_queue")
+                self._write_rows(cur, sql, args_list, on_error)
+            else:
+                cur.execute(u"RELEASE write_queue")
+
+    def _write_rows(self, cur, sql, args_list, on_error):
+        for args in args_list:
+            try:
+                cur.execute(sql, args)
+            except Exception as e:
+                if on_error is None:
+                    self._logger.error(u"cachedb: queued write failed: %s\n%s\n-----\n%s", e, sql, args)
+                    continue
+
+                try:
+                    on_error(e, args)
+                except Exception:
+                    self._logger.exception(u"cachedb: failed to handle a failed queued write %s", sql)
+
+    def _commit_write_queue(self):
+        self._flush_write_queue()
+
+        # a database without an open transaction (e.g. before initial_begin) is in autocommit mode
+        if not self._connection.getautocommit():
+            self.commit_now()
+
     def insert_or_ignore(self, table_name, **argv):
         if len(argv) == 1:
             sql = u'INSERT OR IGNORE INTO %s (%s) VALUES (?);' % (table_name, argv.keys()[0])
@@ -394,6 +563,59 @@ class SQLiteCacheDB(TaskManager):
         else:
             return []  # should it return None?
 
+    # -------- Asynchronous Read Operations --------
+    # These run on a pool of read-only connections outside of the reactor thread. Since the main connection always
+    # keeps a transaction open, they only see data up to the last commit_now().
+
+    def fetchone_async(self, sql, args=None):
+        """ Same as fetchone, but returns a Deferred firing (on the reactor thread) with the result.
+        """
+        return self._read_async(self.fetchone, self._fetchone_on_read_connection, sql, args)
+
+    def fetchall_async(self, sql, args=None):
+        """ Same as fetchall, but returns a Deferred firing (on the reactor thread) with the result.
+        """
+        return self._read_async(self.fetchall, self._fetchall_on_read_connection, sql, args)
+
+    def _read_async(self, fallback, read_function, sql, args):
+        if self._read_threadpool is None:
+            return maybeDeferred(fallback, sql, args)
+        return deferToThreadPool(reactor, self._read_threadpool, read_function, sql, args)
+
+    def _execute_on_read_connection(self, sql, args):
+        cur = self._get_read_cursor()
+        if self._show_execute:
+            thread_name = currentThread().getName()
+            self._logger.info(u"===%s===\n%s\n-----\n%s\n======\n", thread_name, sql, args)
+
+        try:
+            if args is None:
+                return cur.execute(sql)
+            else:
+                return cur.execute(sql, args)
+
+        except Exception:
+            thread_name = currentThread().getName()
+            self._logger.exception(u"cachedb: ===%s===\nSQL Type: %s\n-----\n%s\n-----\n%s\n======\n",
+                                   thread_name, type(sql), sql, args)
+            raise
+
+    def _fetchone_on_read_connection(self, sql, args):
+        find = list(self._execute_on_read_connection(sql, args) or [])
+        if not find:
+            return
+        if len(find) > 1:
+            self._logger.debug(
+                u"FetchONE resulted in many more rows than one, consider putting a LIMIT 1 in the sql statement %s, %s", sql, len(find))
+        find = find[0]
+        if len(find) > 1:
+            return find
+        else:
+            return find[0]
+
+    def _fetchall_on_read_connection(self, sql, args):
+        return list(self._execute_on_read_connection(sql, args) or [])
+
     def getOne(self, table_name, value_name, where=None, conj=u"AND", **kw):
         """ value_name could be a string, a tuple of strings, or '*'
         """
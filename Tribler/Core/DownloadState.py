@@ -6,6 +6,7 @@ import sys
 
 from Tribler.Core.simpledefs import (DLSTATUS_DOWNLOADING, DLSTATUS_SEEDING, DLSTATUS_STOPPED,
                                      DLSTATUS_STOPPED_ON_ERROR, DLSTATUS_WAITING4HASHCHECK, UPLOAD)
+from Tribler.Core.Utilities.bitfield_utils import count_pieces, merge_bitfields, to_bitfield
 
 
 class DownloadState(object):
@@ -40,6 +41,7 @@ class DownloadState(object):
         self.haveslice = None
         self.stats = None
         self.length = None
+        self.availability = None
 
         name = self.download.get_def().get_name()
 
@@ -88,34 +90,22 @@ class DownloadState(object):
             self.stats = stats
 
         if stats and stats.get('stats', None):
-            # for pieces complete
+            # for pieces complete, as a bitfield with a byte per piece
             if not self.filepieceranges:
-                self.haveslice = stats['stats'].have  # is copy of network engine list
+                self.haveslice = to_bitfield(stats['stats'].have)
             else:
                 # For get_files_completion()
-                self.haveslice_total = stats['stats'].have
+                self.haveslice_total = to_bitfield(stats['stats'].have)
 
                 selected_files = self.download.get_selected_files()
                 # Show only pieces complete for the selected ranges of files
-                totalpieces = 0
+                haveslice = bytearray()
                 for t, tl, o, f in self.filepieceranges:
                     if f in selected_files or not selected_files:
-                        diff = tl - t
-                        totalpieces += diff
+                        haveslice += self.haveslice_total[t:tl]
 
-                haveslice = [False] * totalpieces
-                have = 0
-                index = 0
-                for t, tl, o, f in self.filepieceranges:
-                    if f in selected_files or not selected_files:
-                        for piece in range(t, tl):
-                            haveslice[index] = stats['stats'].have[piece]
-                            if haveslice[index]:
-                                have += 1
-
-                            index += 1
                 self.haveslice = haveslice
-                if have == len(haveslice) and self.status == DLSTATUS_DOWNLOADING:
+                if count_pieces(haveslice) == len(haveslice) and self.status == DLSTATUS_DOWNLOADING:
                     # we have all pieces of the selected files
                     self.status = DLSTATUS_SEEDING
                     self.progress = 1.0
@@ -265,7 +255,7 @@ class DownloadState(object):
         if self.haveslice is None:
             return []
         else:
-            return self.haveslice
+            return map(bool, self.haveslice)
 
     def get_pieces_total_complete(self):
         """ Returns the number of total and completed pieces
@@ -274,7 +264,7 @@ class DownloadState(object):
         if self.haveslice is None:
             return (0, 0)
         else:
-            return (len(self.haveslice), sum(self.haveslice))
+            return (len(self.haveslice), count_pieces(self.haveslice))
 
     def get_files_completion(self):
         """ Returns a list of filename, progress tuples indicating the progress
@@ -295,11 +285,7 @@ class DownloadState(object):
                     # niels: ranges are from-to (inclusive ie if a file consists one piece t and tl will be the same)
                     total_pieces = tl - t
                     if total_pieces and getattr(self, 'haveslice_total', False):
-                        completed = 0
-                        for index in range(t, tl):
-                            if self.haveslice_total[index]:
-                                completed += 1
-
+                        completed = count_pieces(self.haveslice_total, t, tl)
                         completion.append((f, completed / (total_pieces * 1.0)))
                     elif f in files:
                         completion.append((f, 0.0))
@@ -329,31 +315,34 @@ class DownloadState(object):
         increment the availability by 1. Leechers provide a subset of piece thus we count the
         overall availability of all pieces provided by the connected peers and use the minimum
         of this + the average of all additional pieces.
+
+        The availability is computed once per state.
         """
+        if self.availability is None:
+            self.availability = self._compute_availability()
+        return self.availability
+
+    def _compute_availability(self):
         nr_seeders_complete = 0
-        merged_bitfields = None
+        leecher_bitfields = []
 
         peers = self.get_peerlist()
         for peer in peers:
             completed = peer.get('completed', 0)
-            have = peer.get('have', [])
+            have = to_bitfield(peer.get('have', []))
 
-            if completed == 1 or have and all(have):
+            if completed == 1 or have and count_pieces(have) == len(have):
                 nr_seeders_complete += 1
             else:
-                if merged_bitfields is None:
-                    merged_bitfields = [0] * len(have)
-
-                for i in range(len(have)):
-                    if have[i]:
-                        merged_bitfields[i] += 1
+                leecher_bitfields.append(have)
 
+        merged_bitfields = merge_bitfields(leecher_bitfields)
         if merged_bitfields:
             # count the number of complete copies due to overlapping leecher bitfields
             nr_leechers_complete = min(merged_bitfields)
 
             # detect remainder of bitfields which are > 0
-            nr_more_than_min = len([x for x in merged_bitfields if x > nr_leechers_complete])
+            nr_more_than_min = len(merged_bitfields) - merged_bitfields.count(nr_leechers_complete)
             fraction_additonal = float(nr_more_than_min) / len(merged_bitfields)
 
             return nr_seeders_complete + nr_leechers_complete + fraction_additonal
@@ -4,6 +4,7 @@ import os
 import sys
 import time
 from binascii import hexlify
+from threading import Condition, Lock
 from traceback import print_exc
 
 import libtorrent as lt
@@ -14,6 +15,7 @@ from Tribler.Core.DownloadConfig import DownloadStartupConfig, DownloadConfigInt
 from Tribler.Core.DownloadState import DownloadState
 from Tribler.Core.Libtorrent import checkHandleAndSynchronize, waitForHandleAndSynchronize
 from Tribler.Core.TorrentDef import TorrentDefNoMetainfo, TorrentDef
+from Tribler.Core.Utilities.bitfield_utils import get_pieces_progress, to_bitfield
 from Tribler.Core.Utilities.torrent_utils import get_info_from_handle
 from Tribler.Core.osutils import fix_filebasename
 from Tribler.Core.simpledefs import (DLSTATUS_WAITING4HASHCHECK, DLSTATUS_HASHCHECKING, DLSTATUS_METADATA,
@@ -21,6 +23,18 @@ from Tribler.Core.simpledefs import (DLSTATUS_WAITING4HASHCHECK, DLSTATUS_HASHCH
                                      DLSTATUS_CIRCUITS, DLSTATUS_STOPPED, DLMODE_VOD, DLSTATUS_STOPPED_ON_ERROR,
                                      UPLOAD, DOWNLOAD, DLMODE_NORMAL, PERSISTENTSTATE_CURRENTVERSION, dlstatus_strings)
 
+# the alerts that have an on_<alert type> handler, all other alerts only update the statistics of a download
+HANDLED_ALERT_TYPES = ('tracker_reply_alert', 'tracker_error_alert', 'tracker_warning_alert', 'metadata_received_alert',
+                       'file_renamed_alert', 'performance_alert', 'torrent_checked_alert', 'torrent_finished_alert',
+                       'piece_finished_alert')
+
+LOGGED_ALERT_CATEGORIES = (lt.alert.category_t.error_notification, lt.alert.category_t.performance_warning)
+
+# the number of pieces after the read position of a VOD stream that get a deadline, and the deadline step per piece
+VOD_READAHEAD_PIECES = 10
+VOD_DEADLINE_STEP = 500
+# seconds a VOD read waits for a finished piece before it checks its bytes again
+VOD_READ_WAIT_TIMEOUT = 1.0
 
 if sys.platform == "win32":
     try:
@@ -46,13 +60,21 @@ class VODFile(object):
         self.endpiece = get_info_from_handle(self._download.handle).map_file(
             self._download.get_vod_fileindex(), self._download.get_vod_filesize(), 0)
 
+        # the pieces that have been given a deadline and may not have been downloaded yet
+        self._deadline_pieces = set()
+
+        # reads are woken up by piece_finished alerts, which libtorrent only sends while VOD streams are open
+        self._ltmgr = self._download.ltmgr
+        self._hops = self._download.get_hops()
+        if self._ltmgr:
+            self._ltmgr.add_vod_stream(self._hops)
+
     def read(self, *args):
         oldpos = self._file.tell()
 
         self._logger.debug('VODFile: get bytes %s - %s', oldpos, oldpos + args[0])
 
-        while not self._file.closed and self._download.get_byte_progress([(self._download.get_vod_fileindex(), oldpos, oldpos + args[0])]) < 1 and self._download.vod_seekpos is not None:
-            time.sleep(1)
+        self._wait_for_bytes(oldpos, oldpos + args[0])
 
         if self._file.closed:
             self._logger.debug('VODFile: got no bytes, file is closed')
@@ -61,8 +83,9 @@ class VODFile(object):
         result = self._file.read(*args)
 
         newpos = self._file.tell()
-        if self._download.vod_seekpos == oldpos:
-            self._download.vod_seekpos = newpos
+        seekpos = self._set_position(newpos)
+        if self._download.vod_seekpos is not None:
+            self._download.vod_seekpos = seekpos
 
         self._logger.debug('VODFile: got bytes %s - %s', oldpos, newpos)
 
@@ -74,17 +97,126 @@ class VODFile(object):
 
         self._logger.debug('VODFile: seek %s %s', newpos, args)
 
-        if self._download.vod_seekpos is None or abs(newpos - self._download.vod_seekpos) < 1024 * 1024:
-            self._download.vod_seekpos = newpos
-        self._download.set_byte_priority([(self._download.get_vod_fileindex(), 0, newpos)], 0)
-        self._download.set_byte_priority([(self._download.get_vod_fileindex(), newpos, -1)], 1)
+        # the other open streams of the download still need the pieces from their own positions onwards
+        seekpos = self._set_position(newpos)
+        self._download.vod_seekpos = seekpos
+        self._download.set_byte_priority([(self._download.get_vod_fileindex(), 0, seekpos)], 0)
+        self._download.set_byte_priority([(self._download.get_vod_fileindex(), seekpos, -1)], 1)
+        self._reset_piece_deadlines()
 
         self._logger.debug('VODFile: seek, get pieces %s', self._download.handle.piece_priorities())
         self._logger.debug('VODFile: seek, got pieces %s', [
                            int(piece) for piece in self._download.handle.status().pieces])
 
+    def _set_position(self, position):
+        """
+        Records the position of this stream, or forgets it if position is None.
+        :return: the earliest position of the open streams of the download.
+        """
+        with self._download.vod_stream_lock:
+            positions = self._download.vod_stream_positions
+            if position is None:
+                positions.pop(self, None)
+            else:
+                positions[self] = position
+            return min(positions.itervalues()) if positions else None
+
+    def wait_available(self, nbytes, timeout):
+        """
+        Waits until the next nbytes bytes have been downloaded, for at most timeout seconds.
+        :return: whether the bytes can be read without waiting.
+        """
+        if self._file.closed:
+            return True
+        pos = self._file.tell()
+        return self._wait_for_bytes(pos, pos + nbytes, timeout)
+
+    def _wait_for_bytes(self, bytes_begin, bytes_end, timeout=None):
+        pieces = self._get_pieces(bytes_begin, bytes_end)
+        if pieces:
+            self._set_piece_deadlines(pieces[0])
+
+        end_time = time.time() + timeout if timeout is not None else None
+
+        # piece_finished alerts wake us up as soon as a piece has been downloaded
+        with self._download.vod_piece_condition:
+            while not self._file.closed and self._download.vod_seekpos is not None and not self._have_pieces(pieces):
+                wait_time = VOD_READ_WAIT_TIMEOUT
+                if end_time is not None:
+                    wait_time = min(wait_time, end_time - time.time())
+                    if wait_time <= 0:
+                        return False
+                self._download.vod_piece_condition.wait(wait_time)
+        return True
+
+    def is_available(self, nbytes):
+        """
+        Returns whether the next nbytes bytes have been downloaded, so reading them won't have to wait.
+        """
+        if self._file.closed:
+            return True
+        pos = self._file.tell()
+        return self._have_pieces(self._get_pieces(pos, pos + nbytes))
+
+    def _get_pieces(self, bytes_begin, bytes_end):
+        """
+        Returns the pieces that hold the given bytes of the VOD file.
+        """
+        handle = self._download.handle
+        if not handle or not handle.is_valid():
+            return []
+
+        fileindex = self._download.get_vod_fileindex()
+        filesize = self._download.get_vod_filesize()
+        bytes_begin = min(bytes_begin, filesize)
+        bytes_end = min(bytes_end, filesize)
+        if bytes_end <= bytes_begin:
+            return []
+
+        torrent_info = get_info_from_handle(handle)
+        startpiece = torrent_info.map_file(fileindex, bytes_begin, 0).piece
+        endpiece = torrent_info.map_file(fileindex, bytes_end - 1, 0).piece + 1
+        return range(max(startpiece, 0), min(endpiece, torrent_info.num_pieces()))
+
+    def _have_pieces(self, pieces):
+        handle = self._download.handle
+        if not handle or not handle.is_valid():
+            return False
+        return all(handle.have_piece(piece) for piece in pieces)
+
+    def _set_piece_deadlines(self, first_piece):
+        """
+        Asks libtorrent to download the pieces that are about to be read first, the nearest ones most urgently.
+        """
+        handle = self._download.handle
+        if not handle or not handle.is_valid():
+            return
+
+        last_piece = min(first_piece + VOD_READAHEAD_PIECES, get_info_from_handle(handle).num_pieces())
+        for index, piece in enumerate(xrange(first_piece, last_piece)):
+            if piece not in self._deadline_pieces and not handle.have_piece(piece):
+                handle.set_piece_deadline(piece, (index + 1) * VOD_DEADLINE_STEP)
+                self._deadline_pieces.add(piece)
+
+    def _reset_piece_deadlines(self):
+        handle = self._download.handle
+        if handle and handle.is_valid():
+            for piece in self._deadline_pieces:
+                handle.reset_piece_deadline(piece)
+        self._deadline_pieces.clear()
+
     def close(self, *args):
+        was_closed = self._file.closed
         self._file.close(*args)
+        self._reset_piece_deadlines()
+        self._set_position(None)
+
+        if self._ltmgr and not was_closed:
+            self._ltmgr.remove_vod_stream(self._hops)
+
+        # wake up a read that is waiting for pieces
+        with self._download.vod_piece_condition:
+            self._download.vod_piece_condition.notify_all()
 
     @property
     def closed(self):
@@ -130,10 +262,18 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
         self.pause_after_next_hashcheck = False
         self.checkpoint_after_next_hashcheck = False
         self.tracker_status = {}  # {url: [num_peers, status_str]}
+        # {alert class: handler}, looked up for every alert of this download
+        self.alert_handlers = dict((getattr(lt, alert_type), getattr(self, 'on_' + alert_type))
+                                   for alert_type in HANDLED_ALERT_TYPES)
 
         self.prebuffsize = 5 * 1024 * 1024
         self.endbuffsize = 0
         self.vod_seekpos = 0
+        # notified every time a piece has been downloaded, VOD reads wait on it
+        self.vod_piece_condition = Condition()
+        # {VOD stream: position} of the open VOD streams, vod_seekpos is the earliest of them
+        self.vod_stream_positions = {}
+        self.vod_stream_lock = Lock()
 
         self.max_prebuffsize = 5 * 1024 * 1024
 
@@ -338,15 +478,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
 
         status = self.handle.status()
         if status:
-            pieces_have = 0
-            pieces_all = len(pieces)
-            bitfield = status.pieces
-            for pieceindex in pieces:
-                if pieceindex < len(bitfield) and bitfield[pieceindex]:
-                    pieces_have += 1
-                elif consecutive:
-                    break
-            return float(pieces_have) / pieces_all
+            return get_pieces_progress(to_bitfield(status.pieces), pieces, consecutive)
         return 0.0
 
     @checkHandleAndSynchronize(0.0)
@@ -415,16 +547,15 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
             self.set_piece_priority(pieces, priority)
 
     @checkHandleAndSynchronize()
-    def process_alert(self, alert, alert_type):
-        if alert.category() in [lt.alert.category_t.error_notification, lt.alert.category_t.performance_warning]:
-            self._logger.debug("LibtorrentDownloadImpl: alert %s with message %s", alert_type, alert)
-
-        alert_types = ('tracker_reply_alert', 'tracker_error_alert', 'tracker_warning_alert', 'metadata_received_alert',
-                       'file_renamed_alert', 'performance_alert', 'torrent_checked_alert', 'torrent_finished_alert')
-
-        if alert_type in alert_types:
-            getattr(self, 'on_' + alert_type)(alert)
-        else:
+    def process_alert(self, alert):
+        if alert.category() in LOGGED_ALERT_CATEGORIES:
+            self._logger.debug("LibtorrentDownloadImpl: alert %s with message %s", type(alert).__name__, alert)
+
+        handler = self.alert_handlers.get(type(alert))
+        if handler:
+            handler(alert)
+        elif not alert.category() & lt.alert.category_t.progress_notification:
+            # progress alerts come in for every block, they are only used to wake up VOD reads
             self.update_lt_stats()
 
     def on_tracker_reply_alert(self, alert):
@@ -508,6 +639,10 @@ class LibtorrentDownloadImpl(DownloadConfigInterface):
             self.checkpoint_after_next_hashcheck = False
             self.checkpoint()
 
+    def on_piece_finished_alert(self, alert):
+        with self.vod_piece_condition:
+            self.vod_piece_condition.notify_all()
+
     @checkHandleAndSynchronize()
     def on_torrent_finished_alert(self, alert):
         self.update_lt_stats()
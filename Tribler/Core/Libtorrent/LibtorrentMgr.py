@@ -5,13 +5,13 @@ from urllib import url2pathname
 import tempfile
 import threading
 import os
-import time
 from binascii import hexlify
-from copy import deepcopy
+from collections import defaultdict
 from shutil import rmtree
 
 from twisted.internet import reactor
 import libtorrent as lt
+from Tribler.Core.Libtorrent.metainfo_cache import MetainfoCache
 from Tribler.Core.Utilities.torrent_utils import get_info_from_handle
 from Tribler.Core.TorrentDef import TorrentDef, TorrentDefNoMetainfo
 
@@ -27,8 +27,9 @@ from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_react
 
 
 LTSTATE_FILENAME = "lt.state"
-METAINFO_CACHE_PERIOD = 5 * 60
 DHT_CHECK_RETRIES = 1
+# milliseconds an alert pump thread blocks on a session before checking whether it should stop
+ALERT_WAIT_TIMEOUT = 500
 
 
 class LibtorrentMgr(TaskManager):
@@ -54,7 +55,14 @@ class LibtorrentMgr(TaskManager):
         self.metadata_tmpdir = None
         self.metainfo_requests = {}
         self.metainfo_lock = threading.RLock()
-        self.metainfo_cache = {}
+        self.metainfo_cache = MetainfoCache()
+
+        self.alert_pump_stop = threading.Event()
+        self.alert_pump_threads = []
+
+        # {hops: number of open VOD streams}, progress alerts are only enabled on sessions that have VOD streams
+        self.vod_streams = defaultdict(int)
+        self.vod_streams_lock = threading.Lock()
 
     @blocking_call_on_reactor_thread
     def initialize(self):
@@ -65,7 +73,6 @@ class LibtorrentMgr(TaskManager):
         self.metadata_tmpdir = tempfile.mkdtemp(suffix=u'tribler_metainfo_tmpdir')
 
         # register tasks
-        self.register_task(u'process_alerts', reactor.callLater(1, self._task_process_alerts))
         self.register_task(u'check_reachability', reactor.callLater(1, self._task_check_reachability))
         self._schedule_next_check(5, DHT_CHECK_RETRIES)
 
@@ -76,6 +83,12 @@ class LibtorrentMgr(TaskManager):
     def shutdown(self):
         self.cancel_all_pending_tasks()
 
+        # stop the alert pumps before the sessions go away
+        self.alert_pump_stop.set()
+        for alert_pump in self.alert_pump_threads:
+            alert_pump.join(ALERT_WAIT_TIMEOUT / 1000.0 * 2)
+        self.alert_pump_threads = []
+
         # remove all upnp mapping
         for upnp_handle in self.upnp_mapping_dict.itervalues():
             self.get_session().delete_port_mapping(upnp_handle)
@@ -131,12 +144,7 @@ class LibtorrentMgr(TaskManager):
             ltsession.add_extension(lt.create_smart_ban_plugin)
 
         ltsession.set_settings(settings)
-        ltsession.set_alert_mask(lt.alert.category_t.stats_notification |
-                                 lt.alert.category_t.error_notification |
-                                 lt.alert.category_t.status_notification |
-                                 lt.alert.category_t.storage_notification |
-                                 lt.alert.category_t.performance_warning |
-                                 lt.alert.category_t.tracker_notification)
+        ltsession.set_alert_mask(self.get_alert_mask())
 
         # Load proxy settings
         if hops == 0:
@@ -179,9 +187,40 @@ class LibtorrentMgr(TaskManager):
 
         return ltsession
 
+    def get_alert_mask(self, progress=False):
+        """
+        Returns the alert mask of the sessions. Progress alerts come in for every block of every torrent, so they are
+        only enabled while VOD streams are waiting for pieces.
+        """
+        alert_mask = lt.alert.category_t.stats_notification | \
+            lt.alert.category_t.error_notification | \
+            lt.alert.category_t.status_notification | \
+            lt.alert.category_t.storage_notification | \
+            lt.alert.category_t.performance_warning | \
+            lt.alert.category_t.tracker_notification
+        return alert_mask | lt.alert.category_t.progress_notification if progress else alert_mask
+
+    def add_vod_stream(self, hops):
+        """
+        Enables the piece_finished alerts, which wake up VOD reads, on the session with the given hops.
+        """
+        with self.vod_streams_lock:
+            self.vod_streams[hops] += 1
+            if self.vod_streams[hops] == 1:
+                self.get_session(hops).set_alert_mask(self.get_alert_mask(progress=True))
+
+    def remove_vod_stream(self, hops):
+        with self.vod_streams_lock:
+            self.vod_streams[hops] -= 1
+            if self.vod_streams[hops] <= 0:
+                del self.vod_streams[hops]
+                if self.ltsessions and hops in self.ltsessions:
+                    self.ltsessions[hops].set_alert_mask(self.get_alert_mask())
+
     def get_session(self, hops=0):
         if hops not in self.ltsessions:
             self.ltsessions[hops] = self.create_session(hops)
+            self._start_alert_pump(self.ltsessions[hops], hops)
 
         return self.ltsessions[hops]
 
@@ -306,13 +345,12 @@ class LibtorrentMgr(TaskManager):
             self._logger.warning("port mapping method not exposed in libtorrent")
 
     def process_alert(self, alert):
-        alert_type = str(type(alert)).split("'")[1].split(".")[-1]
         handle = getattr(alert, 'handle', None)
         if handle:
             if handle.is_valid():
                 infohash = str(handle.info_hash())
                 if infohash in self.torrents:
-                    self.torrents[infohash][0].process_alert(alert, alert_type)
+                    self.torrents[infohash][0].process_alert(alert)
                 elif infohash in self.metainfo_requests:
                     if isinstance(alert, lt.metadata_received_alert):
                         self.got_metainfo(infohash)
@@ -322,25 +360,31 @@ class LibtorrentMgr(TaskManager):
                 self._logger.debug("alert for invalid torrent")
 
     def get_metainfo(self, infohash_or_magnet, callback, timeout=30, timeout_callback=None, notify=True):
+        """
+        Looks up the metainfo of a torrent in the DHT. Once found, callback is called with the metainfo, or
+        timeout_callback with the infohash if the lookup times out.
+        :return: False if the torrent is being downloaded, so no lookup is started and no callback will be called, True
+        otherwise.
+        """
         if not self.is_dht_ready() and timeout > 5:
             self._logger.info("DHT not ready, rescheduling get_metainfo")
             self.trsession.lm.threadpool.add_task(lambda i=infohash_or_magnet, c=callback, t=timeout - 5,
                                                   tcb=timeout_callback, n=notify: self.get_metainfo(i, c, t, tcb, n), 5)
-            return
+            return True
 
         magnet = infohash_or_magnet if infohash_or_magnet.startswith('magnet') else None
         infohash_bin = infohash_or_magnet if not magnet else parse_magnetlink(magnet)[1]
         infohash = binascii.hexlify(infohash_bin)
 
         if infohash in self.torrents:
-            return
+            return False
 
         with self.metainfo_lock:
             self._logger.debug('get_metainfo %s %s %s', infohash_or_magnet, callback, timeout)
 
-            cache_result = self._get_cached_metainfo(infohash)
+            cache_result = self.metainfo_cache.get(infohash)
             if cache_result:
-                self.trsession.lm.threadpool.call_in_thread(0, callback, deepcopy(cache_result))
+                self.trsession.lm.threadpool.call_in_thread(0, callback, cache_result)
 
             elif infohash not in self.metainfo_requests:
                 # Flags = 4 (upload mode), should prevent libtorrent from creating files
@@ -376,6 +420,11 @@ class LibtorrentMgr(TaskManager):
                     callbacks.append(callback)
                 else:
                     self._logger.debug('get_metainfo duplicate detected, ignoring')
+                timeout_callbacks = self.metainfo_requests[infohash]['timeout_callbacks']
+                if timeout_callback and timeout_callback not in timeout_callbacks:
+                    timeout_callbacks.append(timeout_callback)
+
+        return True
 
     def got_metainfo(self, infohash, timeout=False):
         with self.metainfo_lock:
@@ -393,7 +442,8 @@ class LibtorrentMgr(TaskManager):
                 assert handle
                 if handle:
                     if callbacks and not timeout:
-                        metainfo = {"info": lt.bdecode(get_info_from_handle(handle).metadata())}
+                        metadata = get_info_from_handle(handle).metadata()
+                        metainfo = {"info": lt.bdecode(metadata)}
                         trackers = [tracker.url for tracker in get_info_from_handle(handle).trackers()]
                         peers = []
                         leechers = 0
@@ -417,15 +467,16 @@ class LibtorrentMgr(TaskManager):
                         metainfo["leechers"] = leechers
                         metainfo["seeders"] = seeders
 
-                        self._add_cached_metainfo(infohash, metainfo)
+                        metainfo = self.metainfo_cache.put(infohash, metainfo, len(metadata))
 
                         for callback in callbacks:
-                            self.trsession.lm.threadpool.call_in_thread(0, callback, deepcopy(metainfo))
+                            self.trsession.lm.threadpool.call_in_thread(0, callback, dict(metainfo))
 
-                        # let's not print the hashes of the pieces
-                        debuginfo = deepcopy(metainfo)
-                        del debuginfo['info']['pieces']
-                        self._logger.debug('got_metainfo result %s', debuginfo)
+                        if self._logger.isEnabledFor(logging.DEBUG):
+                            # let's not print the hashes of the pieces
+                            debuginfo = dict(metainfo, info=dict((key, value) for key, value in
+                                                                 metainfo['info'].iteritems() if key != 'pieces'))
+                            self._logger.debug('got_metainfo result %s', debuginfo)
 
                     elif timeout_callbacks and timeout:
                         for callback in timeout_callbacks:
@@ -436,29 +487,45 @@ class LibtorrentMgr(TaskManager):
                     if notify:
                         self.notifier.notify(NTFY_TORRENTS, NTFY_MAGNET_CLOSE, infohash_bin)
 
-    def _get_cached_metainfo(self, infohash):
-        if infohash in self.metainfo_cache:
-            return self.metainfo_cache[infohash]['meta_info']
-
-    def _add_cached_metainfo(self, infohash, metainfo):
-        self.metainfo_cache[infohash] = {'time': time.time(),
-                                         'meta_info': metainfo}
-
     def _task_cleanup_metainfo_cache(self):
-        oldest_time = time.time() - METAINFO_CACHE_PERIOD
-
-        for info_hash, values in self.metainfo_cache.items():
-            last_time, metainfo = values
-            if last_time < oldest_time:
-                del self.metainfo_cache[info_hash]
-
-    def _task_process_alerts(self):
-        for ltsession in self.ltsessions.itervalues():
-            if ltsession:
-                for alert in ltsession.pop_alerts():
+        with self.metainfo_lock:
+            self.metainfo_cache.remove_expired()
+        self._logger.debug("metainfo cache statistics: %s", self.metainfo_cache.get_statistics())
+
+    def _start_alert_pump(self, ltsession, hops):
+        alert_pump = threading.Thread(target=self._pump_alerts, args=(ltsession,),
+                                      name="LibtorrentAlertPump-%d" % hops)
+        alert_pump.setDaemon(True)
+        alert_pump.start()
+        self.alert_pump_threads.append(alert_pump)
+
+    def _pump_alerts(self, ltsession):
+        """
+        Runs on a thread of its own: waits until libtorrent posts alerts on the given session and hands every batch
+        of alerts to the reactor, so alerts are handled as soon as they arrive instead of once per second.
+
+        Since libtorrent 1.1, the alerts returned by pop_alerts are freed by the next call to pop_alerts. So the next
+        batch is only popped after the reactor is done with the current one, and alert handlers must not keep alerts
+        around after they return.
+        """
+        while not self.alert_pump_stop.is_set():
+            if ltsession.wait_for_alert(ALERT_WAIT_TIMEOUT) is None:
+                continue
+            alerts = ltsession.pop_alerts()
+            if alerts:
+                processed = threading.Event()
+                reactor.callFromThread(self._process_alerts, alerts, processed)
+                while not processed.wait(ALERT_WAIT_TIMEOUT / 1000.0) and not self.alert_pump_stop.is_set():
+                    pass
+
+    def _process_alerts(self, alerts, processed):
+        try:
+            # once the pumps are stopping, the sessions and their alerts may go away at any time
+            if not self.alert_pump_stop.is_set():
+                for alert in alerts:
                     self.process_alert(alert)
-
-        self.register_task(u'process_alerts', reactor.callLater(1, self._task_process_alerts))
+        finally:
+            processed.set()
 
     def _task_check_reachability(self):
         if self.get_session() and self.get_session().status().has_incoming_connections:
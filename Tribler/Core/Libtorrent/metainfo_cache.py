@@ -0,0 +1,109 @@
+import time
+from collections import OrderedDict
+from copy import deepcopy
+
+METAINFO_CACHE_PERIOD = 5 * 60
+METAINFO_CACHE_MAX_ENTRIES = 1000
+METAINFO_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ReadOnlyDict(dict):
+    """
+    A dictionary that can't be modified, so it can be shared with every user of a cached metainfo.
+    Copies of it are regular dictionaries.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("%s is read-only" % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class MetainfoCache(object):
+    """
+    LRU cache of the metainfo that has been fetched through the DHT, bounded by the number of entries, the size of the
+    metadata and the age of an entry.
+
+    The info dictionary of a cached metainfo is read-only and shared between all the metainfo handed out for it, only
+    the small top-level dictionary is copied.
+    """
+
+    def __init__(self, max_entries=METAINFO_CACHE_MAX_ENTRIES, max_bytes=METAINFO_CACHE_MAX_BYTES,
+                 max_age=METAINFO_CACHE_PERIOD):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        # {infohash: (insert time, size, metainfo)}, least recently used first
+        self._entries = OrderedDict()
+        self._num_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, infohash):
+        return infohash in self._entries
+
+    def get(self, infohash):
+        """
+        Returns a copy of the cached metainfo that shares the read-only info dictionary, or None if not cached.
+        """
+        entry = self._entries.pop(infohash, None)
+        if entry is None or entry[0] < time.time() - self.max_age:
+            if entry is not None:
+                self._num_bytes -= entry[1]
+            self.misses += 1
+            return None
+
+        self._entries[infohash] = entry
+        self.hits += 1
+        return dict(entry[2])
+
+    def put(self, infohash, metainfo, size):
+        """
+        Caches the metainfo of the given infohash, size is the number of bytes of its metadata.
+        :return: a copy of the cached metainfo, like get returns it.
+        """
+        self.remove(infohash)
+
+        info = metainfo.get('info')
+        metainfo = ReadOnlyDict(metainfo, info=ReadOnlyDict(info)) if isinstance(info, dict) else ReadOnlyDict(metainfo)
+
+        if size <= self.max_bytes:
+            self._entries[infohash] = (time.time(), size, metainfo)
+            self._num_bytes += size
+
+            while len(self._entries) > self.max_entries or self._num_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._num_bytes -= evicted_size
+
+        return dict(metainfo)
+
+    def remove(self, infohash):
+        entry = self._entries.pop(infohash, None)
+        if entry is not None:
+            self._num_bytes -= entry[1]
+
+    def remove_expired(self):
+        oldest_time = time.time() - self.max_age
+        for infohash, (insert_time, _, _) in self._entries.items():
+            if insert_time < oldest_time:
+                self.remove(infohash)
+
+    def get_statistics(self):
+        return {'entries': len(self._entries),
+                'bytes': self._num_bytes,
+                'hits': self.hits,
+                'misses': self.misses}
@@ -0,0 +1,121 @@
+import logging
+from binascii import hexlify
+from hashlib import sha1
+from StringIO import StringIO
+
+from libtorrent import bdecode, bencode
+
+from Tribler.Core.Utilities.configparser import CallbackConfigParser
+from Tribler.Core.leveldbstore import LevelDbStore
+
+
+class DownloadStateStore(object):
+    """
+    Keeps the persistent state (pstate) of all downloads in a single LevelDB store, keyed by infohash.
+
+    The metainfo of a download is not duplicated in its state when the torrent store has an identical copy of it. The
+    torrent store is keyed by hexlified infohash, like it is everywhere else, so collected torrents are shared. A
+    collected torrent can have other trackers than the download, its metainfo is then kept in the state. A state is only
+    written when it differs from the last one that was stored, so a checkpoint only costs I/O for the downloads that
+    changed.
+    """
+
+    _store_class = LevelDbStore
+
+    def __init__(self, store_dir, torrent_store=None):
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        self._store = self._store_class(store_dir)
+        self._torrent_store = torrent_store
+
+        # {infohash: sha1 of the stored state}
+        self._stored_digests = {}
+        # {infohash: sha1 of the bencoded metainfo in the torrent store}
+        self._torrent_digests = {}
+
+    def get_infohashes(self):
+        # keys that are waiting to be written can also be in the database already
+        return list(set(self._store.iterkeys()))
+
+    def get(self, infohash):
+        """
+        Returns the pstate of the download with the given infohash, or None if it has not been stored.
+        """
+        data = self._store.get(infohash)
+        if data is None:
+            return None
+        self._stored_digests[infohash] = sha1(data).digest()
+
+        pstate = CallbackConfigParser()
+        pstate.readfp(StringIO(data.decode('utf-8')))
+
+        if pstate.get('state', 'metainfo') is None:
+            torrent_data = self._torrent_store.get(hexlify(infohash)) if self._torrent_store is not None else None
+            if torrent_data is None:
+                self._logger.warning("metainfo of %s is missing from the torrent store", hexlify(infohash))
+                return None
+            pstate.set('state', 'metainfo', bdecode(torrent_data))
+            self._torrent_digests[infohash] = sha1(torrent_data).digest()
+
+        return pstate
+
+    def put(self, infohash, pstate):
+        """
+        Stores the pstate of the download with the given infohash.
+        :return: True if the state has been written, False if the stored state was up to date.
+        """
+        stored_pstate = pstate.copy()
+
+        metainfo = pstate.get('state', 'metainfo')
+        if isinstance(metainfo, dict) and 'info' in metainfo and self._put_torrent(infohash, metainfo):
+            # the metainfo is read back from the torrent store
+            stored_pstate.set('state', 'metainfo', None)
+
+        fp = StringIO()
+        stored_pstate.write(fp)
+        data = fp.getvalue().encode('utf-8')
+
+        digest = sha1(data).digest()
+        if self._stored_digests.get(infohash) == digest:
+            return False
+
+        self._store.put(infohash, data)
+        self._stored_digests[infohash] = digest
+        return True
+
+    def remove(self, infohash):
+        self._stored_digests.pop(infohash, None)
+        self._torrent_digests.pop(infohash, None)
+        if infohash in self._store:
+            del self._store[infohash]
+
+    def _put_torrent(self, infohash, metainfo):
+        """
+        Makes sure the torrent store has the metainfo of the given infohash.
+        :return: True if the torrent store has this exact metainfo, False if there is no torrent store or if it has a
+        different copy, e.g. one that was collected with other trackers.
+        """
+        if self._torrent_store is None:
+            return False
+
+        torrent_data = bencode(metainfo)
+        digest = sha1(torrent_data).digest()
+
+        stored_digest = self._torrent_digests.get(infohash)
+        if stored_digest is None:
+            stored_data = self._torrent_store.get(hexlify(infohash))
+            if stored_data is None:
+                self._torrent_store.put(hexlify(infohash), torrent_data)
+                stored_digest = digest
+            else:
+                stored_digest = sha1(stored_data).digest()
+            self._torrent_digests[infohash] = stored_digest
+        return stored_digest == digest
+
+    def flush(self):
+        self._store.flush()
+
+    def close(self):
+        self._store.close()
+        self._store = None
+        self._torrent_store = None
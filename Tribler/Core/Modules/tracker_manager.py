@@ -8,6 +8,11 @@ from Tribler.Core.Utilities.tracker_utils import get_uniformed_tracker_url
 MAX_TRACKER_FAILURES = 5
 TRACKER_RETRY_INTERVAL = 60    # A "dead" tracker will be retired every 60 seconds
 
+TRACKER_LATENCY_SMOOTHING = 0.3     # weight of the newest sample in the moving average of the scrape latency
+TRACKER_TARGET_LATENCY = 2.0        # a tracker answering faster than this may get more concurrent scrapes
+DEFAULT_CONCURRENT_SCRAPES = 2
+MAX_CONCURRENT_SCRAPES = 16
+
 
 class TrackerManager(object):
 
@@ -89,22 +94,28 @@ class TrackerManager(object):
         return self._tracker_dict.get(sanitized_tracker_url)
 
     @call_on_reactor_thread
-    def update_tracker_info(self, tracker_url, is_successful):
+    def update_tracker_info(self, tracker_url, is_successful, latency=None):
         """
         Updates a tracker information.
         :param tracker_url: The given tracker_url.
         :param is_successful: If the check was successful.
+        :param latency: The time in seconds the tracker took to answer, if known.
         """
         tracker_info = self._tracker_dict[tracker_url]
 
         current_time = int(time.time())
         failures = 0 if is_successful else tracker_info[u'failures'] + 1
-        is_alive = tracker_info[u'failures'] < self._max_tracker_failures
+        is_alive = failures < self._max_tracker_failures
 
         # update the dict
         tracker_info[u'last_check'] = current_time
         tracker_info[u'failures'] = failures
         tracker_info[u'is_alive'] = is_alive
+        if is_successful and latency is not None:
+            # the latency is only kept in memory, it is relearned quickly after a restart
+            old_latency = tracker_info.get(u'latency')
+            tracker_info[u'latency'] = latency if old_latency is None else \
+                TRACKER_LATENCY_SMOOTHING * latency + (1 - TRACKER_LATENCY_SMOOTHING) * old_latency
 
         # update the database
         sql_stmt = u"UPDATE TrackerInfo SET last_check = ?, failures = ?, is_alive = ? WHERE tracker_id = ?"
@@ -127,31 +138,36 @@ class TrackerManager(object):
         next_check_time = tracker_info[u'last_check'] + self._tracker_retry_interval * (2**tracker_info[u'failures'])
         return next_check_time <= current_time
 
+    @call_on_reactor_thread
+    def get_max_concurrent_scrapes(self, tracker_url):
+        """
+        Gets the number of scrape requests that may run on the given tracker at the same time.
+        Failing trackers get a single request, fast trackers get more the faster they answered recently.
+        :param tracker_url: The given tracker URL.
+        :return: The number of concurrent scrape requests.
+        """
+        tracker_info = self._tracker_dict.get(tracker_url)
+        if tracker_info is not None and tracker_info[u'failures'] > 0:
+            return 1
+        if tracker_info is None or tracker_info.get(u'latency') is None:
+            return DEFAULT_CONCURRENT_SCRAPES
+
+        return max(1, min(MAX_CONCURRENT_SCRAPES, int(TRACKER_TARGET_LATENCY / max(tracker_info[u'latency'], 0.01))))
+
     @call_on_reactor_thread
     def get_next_tracker_for_auto_check(self):
         """
         Gets the next tracker for automatic tracker-checking.
+        Trackers are visited round-robin, trackers that are backing off after failures are skipped.
         :return: The next tracker for automatic tracker-checking.
         """
-        if len(self._tracker_dict) == 0:
-            return
-
-        if self._tracker_check_idx >= len(self._tracker_dict):
-            self._tracker_dict = 0
-
-        next_tracker_url = None
-        next_tracker_info = None
-        for idx in xrange(self._tracker_check_idx, len(self._tracker_dict)):
-            tracker_url = self._tracker_dict.keys()[idx]
+        tracker_url_list = self._tracker_dict.keys()
+        for offset in xrange(len(tracker_url_list)):
+            idx = (self._tracker_check_idx + offset) % len(tracker_url_list)
+            tracker_url = tracker_url_list[idx]
             if tracker_url == u'DHT':
-                next_tracker_url = tracker_url
-                next_tracker_info = {u'is_alive': True, u'last_check': int(time.time())}
-                break
+                self._tracker_check_idx = idx + 1
+                return tracker_url, {u'is_alive': True, u'last_check': int(time.time())}
             elif tracker_url != u'no-DHT' and self.should_check_tracker(tracker_url):
-                next_tracker_url = tracker_url
-                next_tracker_info = self._tracker_dict[next_tracker_url]
-                break
-
-        if next_tracker_url is None:
-            return
-        return next_tracker_url, next_tracker_info
+                self._tracker_check_idx = idx + 1
+                return tracker_url, self._tracker_dict[tracker_url]
@@ -145,9 +145,6 @@ class RemoteTorrentHandler(TaskManager):
             self._logger.error("Torrent store is not loaded")
             return
 
-        # TODO(emilon): could we check the database instead of the store?
-        # Checking if a key is present fetches the whole torrent from disk if its
-        # not on the writeback cache.
         if infohash_str not in self.session.lm.torrent_store:
             # save torrent to file
             try:
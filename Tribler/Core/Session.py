@@ -16,7 +16,8 @@ from Tribler.Core.Upgrade.upgrade import TriblerUpgrader
 from Tribler.Core.exceptions import NotYetImplementedException, OperationNotEnabledByConfigurationException
 from Tribler.Core.simpledefs import (NTFY_CHANNELCAST, NTFY_DELETE, NTFY_INSERT, NTFY_METADATA, NTFY_MYPREFERENCES,
                                      NTFY_PEERS, NTFY_TORRENTS, NTFY_UPDATE, NTFY_VOTECAST, STATEDIR_DLPSTATE_DIR,
-                                     STATEDIR_METADATA_STORE_DIR, STATEDIR_PEERICON_DIR, STATEDIR_TORRENT_STORE_DIR)
+                                     STATEDIR_DLSTATE_STORE_DIR, STATEDIR_METADATA_STORE_DIR, STATEDIR_PEERICON_DIR,
+                                     STATEDIR_TORRENT_STORE_DIR)
 
 GOTM2CRYPTO = False
 try:
@@ -464,6 +465,10 @@ class Session(SessionConfigInterface):
         # Called by network thread
         return os.path.join(self.get_state_dir(), STATEDIR_DLPSTATE_DIR)
 
+    def get_download_state_store_dir(self):
+        """ Returns the directory of the store that holds the persistent state of all Downloads in this Session. """
+        return os.path.join(self.get_state_dir(), STATEDIR_DLSTATE_STORE_DIR)
+
     def download_torrentfile(self, infohash=None, usercallback=None, prio=0):
         """ Try to download the torrentfile without a known source.
         A possible source could be the DHT.
@@ -11,7 +11,7 @@ from twisted.internet import reactor
 from Tribler.dispersy.taskmanager import TaskManager, LoopingCall
 from Tribler.dispersy.candidate import Candidate
 from Tribler.dispersy.util import call_on_reactor_thread, blocking_call_on_reactor_thread, attach_runtime_statistics
-from .session import Session, DEFAULT_BLOCK_SIZE, DEFAULT_TIMEOUT
+from .session import Session, DEFAULT_BLOCK_SIZE, DEFAULT_TIMEOUT, DEFAULT_WINDOW_SIZE, MAX_WINDOW_SIZE
 from .packet import (encode_packet, decode_packet, OPCODE_RRQ, OPCODE_WRQ, OPCODE_ACK, OPCODE_DATA, OPCODE_OACK,
                      OPCODE_ERROR, ERROR_DICT)
 from .exception import InvalidPacketException, FileNotFound
@@ -24,6 +24,10 @@ METADATA_PREFIX = "metadata" + SEPARATOR
 
 DEFAULT_RETIES = 5
 
+# the receive buffer is allocated up front from the tsize a peer sends, so larger files are refused. libtorrent doesn't
+# load torrent files larger than this either.
+MAX_FILE_SIZE = 10 * 1024 * 1024
+
 
 class TftpHandler(TaskManager):
 
@@ -32,7 +36,7 @@ class TftpHandler(TaskManager):
     """
 
     def __init__(self, session, endpoint, prefix, block_size=DEFAULT_BLOCK_SIZE, timeout=DEFAULT_TIMEOUT,
-                 max_retries=DEFAULT_RETIES):
+                 max_retries=DEFAULT_RETIES, window_size=DEFAULT_WINDOW_SIZE, max_file_size=MAX_FILE_SIZE):
         """ The constructor.
         :param session:     The tribler session.
         :param endpoint:    The endpoint to use.
@@ -40,6 +44,8 @@ class TftpHandler(TaskManager):
         :param block_size:  Transmission block size.
         :param timeout:     Transmission timeout.
         :param max_retries: Transmission maximum retries.
+        :param window_size: Number of blocks per ACK we ask for when downloading.
+        :param max_file_size: Largest file we accept when downloading.
         """
         super(TftpHandler, self).__init__()
         self._logger = logging.getLogger(self.__class__.__name__)
@@ -52,6 +58,8 @@ class TftpHandler(TaskManager):
         self._block_size = block_size
         self._timeout = timeout
         self._max_retries = max_retries
+        self._window_size = window_size
+        self._max_file_size = max_file_size
 
         self._timeout_check_interval = 0.5
 
@@ -126,7 +134,8 @@ class TftpHandler(TaskManager):
         self._logger.debug(u"start downloading %s from %s:%s, sid = %s", file_name, ip, port, session_id)
         session = Session(True, session_id, (ip, port), OPCODE_RRQ, file_name, '', None, None,
                           extra_info=extra_info, block_size=self._block_size, timeout=self._timeout,
-                          success_callback=success_callback, failure_callback=failure_callback)
+                          window_size=self._window_size, success_callback=success_callback,
+                          failure_callback=failure_callback)
 
         self._add_new_session(session)
         self._send_request_packet(session)
@@ -168,7 +177,18 @@ class TftpHandler(TaskManager):
         if session.last_contact_time + timeout < time():
             # we do NOT resend packets that are not data-related
             if session.retries < self._max_retries and session.last_sent_packet['opcode'] in (OPCODE_ACK, OPCODE_DATA):
-                self._send_packet(session, session.last_sent_packet)
+                if session.last_sent_packet['opcode'] == OPCODE_DATA:
+                    # resend the whole unacknowledged window
+                    self._send_data_window(session)
+                else:
+                    self._send_packet(session, session.last_sent_packet)
+                session.retries += 1
+            elif session.retries < self._max_retries and session.last_sent_packet['opcode'] == OPCODE_RRQ \
+                    and session.window_size > DEFAULT_WINDOW_SIZE:
+                # peers without windowsize support drop the request, so ask again in lock-step mode
+                self._logger.info(u"%s no answer to windowed request, falling back to lock-step", session)
+                session.window_size = DEFAULT_WINDOW_SIZE
+                self._send_request_packet(session)
                 session.retries += 1
             else:
                 has_failed = True
@@ -284,6 +304,11 @@ class TftpHandler(TaskManager):
         file_name = packet['file_name'].decode('utf8')
         block_size = packet['options']['blksize']
         timeout = packet['options']['timeout']
+        # we may send fewer blocks per ACK than requested, the OACK tells the client
+        window_size = min(packet['options'].get('windowsize', DEFAULT_WINDOW_SIZE), MAX_WINDOW_SIZE)
+        if window_size < 1:
+            self._logger.error(u"Invalid 'windowsize' from %s:%s, packet=%s", ip, port, repr(packet))
+            return
 
         # check session_id
         if (ip, port, packet['session_id']) in self._session_dict:
@@ -315,7 +340,8 @@ class TftpHandler(TaskManager):
 
         # create a session object
         session = Session(False, packet['session_id'], (ip, port), packet['opcode'],
-                          file_name, file_data, file_size, checksum, block_size=block_size, timeout=timeout)
+                          file_name, file_data, file_size, checksum, block_size=block_size, timeout=timeout,
+                          window_size=window_size)
 
         # insert session_id and session
         self._add_new_session(session)
@@ -350,20 +376,24 @@ class TftpHandler(TaskManager):
 
         return file_data, len(file_data)
 
-    def _get_next_data(self, session):
-        """ Gets the next block of data to be uploaded. This method is only used for data uploading.
-        :return The data to transfer.
+    def _send_data_window(self, session):
+        """ Sends the blocks following the last acknowledged one, up to the window size.
+        This method is only used for data uploading.
         """
-        start_idx = session.block_number * session.block_size
-        end_idx = start_idx + session.block_size
-        data = session.file_data[start_idx:end_idx]
-        session.block_number += 1
+        block_number = session.block_number
+        for _ in xrange(session.window_size):
+            block_number += 1
+            # DATA block n carries the n-th block_size bytes of the file, block 0 is the OACK
+            start_idx = (block_number - 1) * session.block_size
+            data = session.file_data[start_idx:start_idx + session.block_size]
+            self._send_data_packet(session, block_number, data)
 
-        # check if we are done
-        if len(data) < session.block_size:
-            session.is_waiting_for_last_ack = True
+            # check if we are done
+            if len(data) < session.block_size:
+                session.is_waiting_for_last_ack = True
+                break
 
-        return data
+        session.last_sent_block = max(session.last_sent_block, block_number)
 
     def _process_packet(self, session, packet):
         """ processes an incoming packet.
@@ -405,6 +435,27 @@ class TftpHandler(TaskManager):
                     self._handle_error(session, 0, error_msg=msg)  # Error: timeout mismatch
                     return
 
+                # peers without windowsize support leave it out of the OACK
+                window_size = packet['options'].get('windowsize', DEFAULT_WINDOW_SIZE)
+                if not 1 <= window_size <= session.window_size:
+                    msg = "%s OACK windowsize mismatch: %s > %s (requested)" %\
+                          (session, window_size, session.window_size)
+                    self._logger.error(msg)
+                    self._handle_error(session, 8, error_msg=msg)  # Error: failed to negotiate options
+                    return
+
+                if packet['options']['tsize'] < 0:
+                    self._handle_error(session, 8)  # Error: failed to negotiate options
+                    return
+
+                if packet['options']['tsize'] > self._max_file_size:
+                    msg = "%s OACK tsize too large: %s > %s (maximum)" %\
+                          (session, packet['options']['tsize'], self._max_file_size)
+                    self._logger.error(msg)
+                    self._handle_error(session, 3, error_msg=msg)  # Error: allocation exceeded
+                    return
+
+                session.window_size = window_size
                 session.file_size = packet['options']['tsize']
                 session.checksum = packet['options']['checksum']
 
@@ -412,7 +463,8 @@ class TftpHandler(TaskManager):
                     # send ACK
                     self._send_ack_packet(session, session.block_number)
                     session.block_number += 1
-                    session.file_data = ""
+                    # the blocks are written into place, so the transfer stays linear in the file size
+                    session.file_data = bytearray(session.file_size)
 
             else:
                 self._logger.error(u"%s Got OPCODE %s which is not expected", session, packet['opcode'])
@@ -435,6 +487,16 @@ class TftpHandler(TaskManager):
             return
 
         if packet['block_number'] != session.block_number:
+            if session.window_size > DEFAULT_WINDOW_SIZE:
+                # a block of this window got lost, acknowledge the blocks we have once so the sender resends the rest
+                if not session.is_gap_acked:
+                    self._logger.debug(u"%s missing block# %s, got %s",
+                                       session, session.block_number, packet['block_number'])
+                    self._send_ack_packet(session, session.block_number - 1)
+                    session.blocks_since_ack = 0
+                    session.is_gap_acked = True
+                return
+
             msg = "%s Got ACK with block# %s while expecting %s" %\
                   (session, packet['block_number'], session.block_number)
             self._logger.error(msg)
@@ -442,19 +504,34 @@ class TftpHandler(TaskManager):
             return
 
         # save data
-        session.file_data += packet['data']
-        self._send_ack_packet(session, session.block_number)
+        data = packet['data']
+        end_idx = session.received_size + len(data)
+        if end_idx > session.file_size:
+            self._logger.error(u"%s received more data than the expected file size %s", session, session.file_size)
+            session.is_failed = True
+            return
+        session.file_data[session.received_size:end_idx] = data
+        session.received_size = end_idx
+        session.is_gap_acked = False
+
+        # only the last block of a window, or of the file, is acknowledged
+        is_last_block = len(data) < session.block_size
+        session.blocks_since_ack += 1
+        if is_last_block or session.blocks_since_ack >= session.window_size:
+            self._send_ack_packet(session, session.block_number)
+            session.blocks_since_ack = 0
         session.block_number += 1
 
         # check if it is the end
-        if len(packet['data']) < session.block_size:
+        if is_last_block:
             self._logger.info(u"%s transfer finished. checking data integrity...", session)
             # check file size and checksum
-            if session.file_size != len(session.file_data):
+            if session.file_size != session.received_size:
                 self._logger.error(u"%s file size %s doesn't match expectation %s",
-                                   session, len(session.file_data), session.file_size)
+                                   session, session.received_size, session.file_size)
                 session.is_failed = True
                 return
+            session.file_data = str(session.file_data)
 
             # compare checksum
             data_checksum = b64encode(sha1(session.file_data).digest())
@@ -483,20 +560,20 @@ class TftpHandler(TaskManager):
                               session, packet['block_number'], session.block_number)
             return
 
-        if packet['block_number'] != session.block_number:
-            msg = "%s got ACK with block# %s while expecting %s" %\
-                  (session, packet['block_number'], session.block_number)
+        if packet['block_number'] > session.last_sent_block:
+            msg = "%s got ACK with block# %s while the last sent block is %s" %\
+                  (session, packet['block_number'], session.last_sent_block)
             self._logger.error(msg)
             self._handle_error(session, 0, error_msg=msg)  # Error: block_number mismatch
             return
 
-        if session.is_waiting_for_last_ack:
+        session.block_number = packet['block_number']
+        if session.is_waiting_for_last_ack and session.block_number == session.last_sent_block:
             session.is_done = True
             return
 
-        data = self._get_next_data(session)
-        # send DATA
-        self._send_data_packet(session, session.block_number, data)
+        # send the next window of DATA, after a gap this resends the blocks the receiver is missing
+        self._send_data_window(session)
 
     def _handle_error(self, session, error_code, error_msg=""):
         """ Handles an error during packet processing.
@@ -528,6 +605,8 @@ class TftpHandler(TaskManager):
                   'options': {'blksize': session.block_size,
                               'timeout': session.timeout,
                               }}
+        if session.window_size > DEFAULT_WINDOW_SIZE:
+            packet['options']['windowsize'] = session.window_size
         self._send_packet(session, packet)
 
     def _send_data_packet(self, session, block_number, data):
@@ -560,4 +639,6 @@ class TftpHandler(TaskManager):
                               'tsize': session.file_size,
                               'checksum': session.checksum,
                               }}
+        if session.window_size > DEFAULT_WINDOW_SIZE:
+            packet['options']['windowsize'] = session.window_size
         self._send_packet(session, packet)
@@ -7,12 +7,16 @@ DEFAULT_BLOCK_SIZE = 512
 # default timeout and maximum retries
 DEFAULT_TIMEOUT = 2
 
+# number of DATA blocks sent per ACK (RFC 7440), 1 is plain lock-step TFTP
+DEFAULT_WINDOW_SIZE = 1
+MAX_WINDOW_SIZE = 64
+
 
 class Session(object):
 
     def __init__(self, is_client, session_id, address, request, file_name, file_data, file_size, checksum,
                  extra_info=None, block_size=DEFAULT_BLOCK_SIZE, timeout=DEFAULT_TIMEOUT,
-                 success_callback=None, failure_callback=None):
+                 window_size=DEFAULT_WINDOW_SIZE, success_callback=None, failure_callback=None):
         self.is_client = is_client
         self.session_id = session_id
         self.address = address
@@ -27,6 +31,13 @@ class Session(object):
         self.block_number = 0
         self.block_size = block_size
         self.timeout = timeout
+        self.window_size = window_size
+        # the sender's last transmitted block, and the blocks the receiver got since its last ACK
+        self.last_sent_block = 0
+        self.blocks_since_ack = 0
+        self.is_gap_acked = False
+        # the number of bytes written into the receive buffer
+        self.received_size = 0
         self.success_callback = success_callback
         self.failure_callback = failure_callback
 
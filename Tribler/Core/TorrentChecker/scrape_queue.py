@@ -0,0 +1,78 @@
+from collections import defaultdict
+from heapq import heappop, heappush
+from itertools import count
+from math import log
+
+# every doubling of the number of seeders moves a torrent this many seconds forward in its tracker queue
+POPULARITY_BONUS = 1800
+
+# GUI requests sort before any regular torrent, in the order they were made
+GUI_REQUEST_KEY = float('-inf')
+
+
+class ScrapeQueue(object):
+    """
+    Per-tracker min-heaps of the torrents that are waiting to be scraped.
+
+    Torrents are keyed on their next check time, popular torrents are moved forward and GUI requests always go first.
+    Re-queuing a torrent only keeps its most urgent entry, superseded heap entries are skipped when popping.
+    """
+
+    def __init__(self):
+        self._heap_dict = defaultdict(list)
+        self._key_dict = defaultdict(dict)
+        self._counter = count()
+
+    def push(self, tracker_url, infohash, next_check, num_seeders=0, is_gui_request=False):
+        """
+        Queues a torrent for the given tracker.
+        :return: True if the torrent was added or moved forward, False if it was already queued with a lower key.
+        """
+        if is_gui_request:
+            key = GUI_REQUEST_KEY
+        else:
+            key = next_check - POPULARITY_BONUS * log(1 + max(num_seeders, 0), 2)
+
+        queued_key_dict = self._key_dict[tracker_url]
+        if infohash in queued_key_dict and queued_key_dict[infohash] <= key:
+            return False
+
+        queued_key_dict[infohash] = key
+        # the counter keeps equal keys in insertion order and avoids comparing infohashes
+        heappush(self._heap_dict[tracker_url], (key, next(self._counter), infohash))
+        return True
+
+    def pop(self, tracker_url, max_count):
+        """
+        Removes and returns up to max_count of the most urgent torrents of the given tracker.
+        """
+        heap = self._heap_dict.get(tracker_url)
+        if not heap:
+            return []
+
+        queued_key_dict = self._key_dict[tracker_url]
+        infohash_list = []
+        while heap and len(infohash_list) < max_count:
+            key, _, infohash = heappop(heap)
+            if queued_key_dict.get(infohash) != key:
+                # superseded by a more urgent entry
+                continue
+            del queued_key_dict[infohash]
+            infohash_list.append(infohash)
+
+        if not heap:
+            self.remove_tracker(tracker_url)
+        return infohash_list
+
+    def is_queued(self, tracker_url, infohash):
+        return infohash in self._key_dict.get(tracker_url, ())
+
+    def get_queue_size(self, tracker_url):
+        return len(self._key_dict.get(tracker_url, ()))
+
+    def get_tracker_urls(self):
+        return self._key_dict.keys()
+
+    def remove_tracker(self, tracker_url):
+        self._heap_dict.pop(tracker_url, None)
+        self._key_dict.pop(tracker_url, None)
@@ -1,14 +1,17 @@
 import logging
 import random
-import socket
 import struct
 import time
 import urllib
 from abc import ABCMeta, abstractmethod, abstractproperty
 
 from libtorrent import bdecode
+from twisted.internet import reactor
+from twisted.internet.protocol import DatagramProtocol
+from twisted.web.client import getPage
 
 from Tribler.Core.Utilities.tracker_utils import parse_tracker_url
+from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import call_on_reactor_thread
 
 
@@ -33,25 +36,31 @@ DHT_TRACKER_MAX_RETRIES = 8
 MAX_TRACKER_MULTI_SCRAPE = 74
 
 
-def create_tracker_session(tracker_url, on_result_callback):
+def create_tracker_session(tracker_url, on_result_callback, on_finished_callback, udp_protocol):
     """
     Creates a tracker session with the given tracker URL.
     :param tracker_url: The given tracker URL.
     :param on_result_callback: The on_result callback.
+    :param on_finished_callback: The callback invoked once the session has finished or failed.
+    :param udp_protocol: The UdpTrackerProtocol shared by all UDP tracker sessions.
     :return: The tracker session.
     """
     tracker_type, tracker_address, announce_page = parse_tracker_url(tracker_url)
 
     if tracker_type == u'UDP':
-        return UdpTrackerSession(tracker_url, tracker_address, announce_page, on_result_callback)
+        return UdpTrackerSession(tracker_url, tracker_address, announce_page, on_result_callback,
+                                 on_finished_callback, udp_protocol)
     else:
-        return HttpTrackerSession(tracker_url, tracker_address, announce_page, on_result_callback)
+        return HttpTrackerSession(tracker_url, tracker_address, announce_page, on_result_callback,
+                                  on_finished_callback)
 
 
-class TrackerSession(object):
+class TrackerSession(TaskManager):
     __meta__ = ABCMeta
 
-    def __init__(self, tracker_type, tracker_url, tracker_address, announce_page, on_result_callback):
+    def __init__(self, tracker_type, tracker_url, tracker_address, announce_page, on_result_callback,
+                 on_finished_callback):
+        super(TrackerSession, self).__init__()
         self._logger = logging.getLogger(self.__class__.__name__)
         self._tracker_type = tracker_type
         self._tracker_url = tracker_url
@@ -59,20 +68,19 @@ class TrackerSession(object):
         self._announce_page = announce_page
 
         self._infohash_list = []
-        self._socket = None
 
         self._on_result_callback = on_result_callback
+        self._on_finished_callback = on_finished_callback
 
         self._retries = 0
 
+        self._start_time = None
         self._last_contact = None
-        self._action = None
 
         # some flags
         self._is_initiated = False  # you cannot add requests to a session if it has been initiated
         self._is_finished = False
         self._is_failed = False
-        self._is_timed_out = False
 
     def __str__(self):
         return "Tracker[%s, %s]" % (self._tracker_type, self._tracker_url)
@@ -81,10 +89,10 @@ class TrackerSession(object):
         return u"Tracker[%s, %s]" % (self._tracker_type, self._tracker_url)
 
     def cleanup(self):
-        if self._socket is not None:
-            self._socket.close()
-            self._socket = None
+        self.cancel_all_pending_tasks()
         self._infohash_list = None
+        self._on_result_callback = None
+        self._on_finished_callback = None
 
     def can_add_request(self):
         """
@@ -105,30 +113,26 @@ class TrackerSession(object):
         assert not self.has_request(infohash), u"Must not add duplicate requests"
         self._infohash_list.append(infohash)
 
-    def process_request(self):
-        if self._action == TRACKER_ACTION_CONNECT:
-            return self._handle_connection()
-        else:
-            return self._handle_response()
-
     @abstractmethod
-    def create_connection(self):
-        """Creates a connection to the tracker."""
+    def connect_to_tracker(self):
+        """
+        Starts scraping the tracker. The outcome is reported through the on_finished callback.
+        """
         pass
 
-    def recreate_connection(self):
-        """Re-creates a connection to the tracker."""
-        self._is_timed_out = False
-
-    @abstractmethod
-    def _handle_connection(self):
-        """Does some work when a connection has been established."""
-        pass
+    def _finish(self, success):
+        """
+        Marks this session as finished or failed and reports it, this happens at most once per session.
+        """
+        if self._is_finished or self._is_failed or self._on_finished_callback is None:
+            return
 
-    @abstractmethod
-    def _handle_response(self):
-        """Processes a response message."""
-        pass
+        self.cancel_all_pending_tasks()
+        if success:
+            self._is_finished = True
+        else:
+            self._is_failed = True
+        self._on_finished_callback(self, self._infohash_list, success)
 
     @abstractproperty
     def max_retries(self):
@@ -153,24 +157,17 @@ class TrackerSession(object):
         return self._infohash_list
 
     @property
-    def last_contact(self):
-        return self._last_contact
+    def start_time(self):
+        return self._start_time
 
     @property
-    def socket(self):
-        return self._socket
-
-    @property
-    def action(self):
-        return self._action
+    def last_contact(self):
+        return self._last_contact
 
     @property
     def retries(self):
         return self._retries
 
-    def increase_retries(self):
-        self._retries += 1
-
     @property
     def is_initiated(self):
         return self._is_initiated
@@ -183,218 +180,79 @@ class TrackerSession(object):
     def is_failed(self):
         return self._is_failed
 
-    @property
-    def is_timed_out(self):
-        return self._is_timed_out
-
 
 class HttpTrackerSession(TrackerSession):
 
-    def __init__(self, tracker_url, tracker_address, announce_page, on_result_callback):
+    def __init__(self, tracker_url, tracker_address, announce_page, on_result_callback, on_finished_callback):
         super(HttpTrackerSession, self).__init__(u'HTTP', tracker_url, tracker_address, announce_page,
-                                                 on_result_callback)
-        self._header_buffer = None
-        self._message_buffer = None
-        self._content_encoding = None
-        self._content_length = None
-        self._received_length = None
+                                                 on_result_callback, on_finished_callback)
+        self._scrape_deferred = None
 
+    def cleanup(self):
+        scrape_deferred, self._scrape_deferred = self._scrape_deferred, None
+        if scrape_deferred is not None and not scrape_deferred.called:
+            scrape_deferred.cancel()
+        super(HttpTrackerSession, self).cleanup()
+
+    @property
     def max_retries(self):
         return HTTP_TRACKER_MAX_RETRIES
 
+    @property
     def retry_interval(self):
         return HTTP_TRACKER_RECHECK_INTERVAL
 
-    def create_connection(self):
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._socket.setblocking(0)
-
-        return self.recreate_connection()
-
-    def recreate_connection(self):
-        super(HttpTrackerSession, self).recreate_connection()
-
-        # an exception may be raised if the socket is non-blocking
-        try:
-            self._socket.connect(self._tracker_address)
-        except Exception as e:
-            # Error 115 means the operation is in progress.
-            # Error 10035 is WSAEWOULDBLOCK on Windows.
-            if e[0] not in (115, 10035):
-                self._logger.debug(u"%s Failed to connect to HTTP tracker [%s, %s]: %s",
-                                   self, self._tracker_url, self._tracker_address, e)
-                self._is_failed = True
-                return False
-
-        self._action = TRACKER_ACTION_CONNECT
-        self._last_contact = int(time.time())
-        return True
-
-    def _handle_connection(self):
-        # create the HTTP GET message
+    def get_scrape_url(self):
+        """
+        Builds the scrape URL that requests all infohashes of this session.
+        """
         # Note: some trackers have strange URLs, e.g.,
         #       http://moviezone.ws/announce.php?passkey=8ae51c4b47d3e7d0774a720fa511cc2a
         #       which has some sort of 'key' as parameter, so we need to check
         #       if there is already a parameter available
-        message = 'GET '
-        message += '/' + self._announce_page.replace(u'announce', u'scrape')
-        if message.find('?') == -1:
-            message += '?'
-        else:
-            message += '&'
-
-        # append the infohashes as parameters
-        for infohash in self._infohash_list:
-            message += 'info_hash='
-            message += urllib.quote(infohash)
-            message += '&'
-        message = message[:-1]  # remove the last AND '&'
-        message += ' HTTP/1.1\r\n'
-        message += '\r\n'
-
-        try:
-            self._socket.sendall(message)
-        except Exception as e:
-            self._logger.info(u"%s Failed to send HTTP SCRAPE message: %s", self, e)
-            self._is_failed = True
-            return
-
-        self._logger.debug(u"%s HTTP SCRAPE message sent", self)
+        scrape_page = self._announce_page.replace(u'announce', u'scrape')
+        url = u"http://%s:%d/%s" % (self._tracker_address[0], self._tracker_address[1], scrape_page)
+        url += u'&' if u'?' in scrape_page else u'?'
+        url += u'&'.join(u'info_hash=' + urllib.quote(infohash) for infohash in self._infohash_list)
+        return url.encode('utf-8')
 
+    def connect_to_tracker(self):
         # no more requests can be appended to this session
-        self._action = TRACKER_ACTION_SCRAPE
         self._is_initiated = True
+        self._start_time = time.time()
+        self._last_contact = int(self._start_time)
 
-    def _handle_response(self):
-        try:
-            # TODO: this buffer size may be changed
-            response = self._socket.recv(8192)
-        except Exception as e:
-            self._logger.info(u"%s Failed to receive HTTP SCRAPE response: %s", self, e)
-            self._is_failed = True
-            return
-
-        self._logger.debug(u"%s Got response", self)
+        # redirects are followed by getPage itself
+        self._scrape_deferred = getPage(self.get_scrape_url(), timeout=self.retry_interval)
+        self._scrape_deferred.addCallbacks(self._on_scrape_response, self._on_scrape_error)
+        self._logger.debug(u"%s HTTP SCRAPE message sent", self)
 
-        if not response:
-            self._is_failed = True
+    def _on_scrape_response(self, body):
+        self._scrape_deferred = None
+        if self._on_finished_callback is None:
             return
 
-        # for the header message, we need to parse the content length in case
-        # if the HTTP packets are partial.
-        if not self._message_buffer:
-            # append the header part
-            if not self._header_buffer:
-                self._header_buffer = response
-            else:
-                self._header_buffer += response
-
-            # check if the header part is over
-            if self._header_buffer.find('\r\n\r\n') != -1:
-                self._header_buffer, self._message_buffer = self._header_buffer.split('\r\n\r\n', 1)
-
-                self._received_length = len(self._message_buffer)
-                self._process_header()
-
-        # the remaining part
-        else:
-            self._message_buffer += response
-            self._received_length += len(response)
-
-        # check the read count
-        if self._received_length >= self._content_length:
-            # process the retrieved information
-            success = self._process_scrape_response()
-            if success:
-                self._is_finished = True
-            else:
-                self._is_failed = True
-
-        # wait for more
-        else:
-            pass
-
-    def _process_header(self):
-        # get and check HTTP response code
-        protocol, code, msg = self._header_buffer.split(' ', 2)
-        if code == '301' or code == '302':
-            idx = self._header_buffer.find('Location: ')
-            if idx == -1:
-                self._is_failed = True
-            else:
-                new_location = (self._header_buffer[idx:].split('\r\n')[0]).split(' ')[1]
-                try:
-                    idx = new_location.find('info_hash=')
-                    if idx != -1:
-                        new_location = new_location[:idx]
-                    if new_location[-1] != '/':
-                        new_location += "/"
-                    new_location += "announce"
-
-                    tracker_type, tracker_address, announce_page = parse_tracker_url(new_location)
-                    if tracker_type != self._tracker_type:
-                        raise RuntimeError(u"cannot redirect to a different tracker type: %s", new_location)
-
-                    else:
-                        self._logger.debug(u"%s being redirected to %s", self, new_location)
-
-                        self._tracker_address = tracker_address
-                        self._announce_page = announce_page
-                        self._socket.close()
-                        self._socket = None
-
-                        self.recreate_connection()
-
-                except RuntimeError as run_err:
-                    self._logger.info(u"%s: Runtime Error: %s, address: %s, announce: %s",
-                                      self, run_err, self._tracker_address, self._announce_page)
-                    self._is_failed = True
-
-                except Exception as err:
-                    self._logger.exception(u"Failed to process HTTP tracker header: [%s], Tracker: %s,"
-                                           u" Tracker Address: %s, Tracker Announce: %s",
-                                           err, self._tracker_url, self._tracker_address, self._announce_page)
-                    self._logger.debug(u"Header: %s", self._header_buffer)
-                    self._is_failed = True
-            return
+        self._logger.debug(u"%s Got response", self)
+        self._finish(self._process_scrape_response(body))
 
-        if code != '200':
-            # error response code
-            self._logger.debug(u"%s HTTP SCRAPE error response code [%s, %s]", self, code, msg)
-            self._is_failed = True
+    def _on_scrape_error(self, failure):
+        self._scrape_deferred = None
+        if self._on_finished_callback is None:
             return
 
-        # check the content type
-        idx = self._header_buffer.find('Content-Encoding: ')
-        if idx == -1:
-            # assuming it is plain text or something similar
-            self._content_encoding = 'plain'
-        else:
-            encoding = (self._header_buffer[idx:].split('\r\n')[0]).split(' ')[1]
-            self._content_encoding = encoding
-
-        # get the content length
-        idx = self._header_buffer.find('Content-Length: ')
-        if idx == -1:
-            # assume that the content is small
-
-            # process the retrieved information
-            success = self._process_scrape_response()
-            if success:
-                self._is_finished = True
-            else:
-                self._is_failed = True
-
-        else:
-            idx += len('Content-Length: ')
-            self._content_length = int(self._header_buffer[idx:].split('\r\n', 1)[0].strip())
+        self._logger.debug(u"%s HTTP SCRAPE failed: %s", self, failure.getErrorMessage())
+        self._finish(False)
 
-    def _process_scrape_response(self):
+    def _process_scrape_response(self, body):
         # parse the retrieved results
-        if self._message_buffer is None:
+        if not body:
             return False
-        response_dict = bdecode(self._message_buffer)
-        if response_dict is None:
+        try:
+            response_dict = bdecode(body)
+        except Exception as e:
+            self._logger.debug(u"%s Failed to decode HTTP SCRAPE response: %s", self, e)
+            return False
+        if not isinstance(response_dict, dict):
             return False
 
         unprocessed_infohash_list = self._infohash_list[:]
@@ -427,147 +285,176 @@ class HttpTrackerSession(TrackerSession):
         return True
 
 
-class UdpTrackerSession(TrackerSession):
-
-    # A list of transaction IDs that have been used in order to avoid conflict.
-    _active_session_dict = dict()
+class UdpTrackerProtocol(DatagramProtocol):
+    """
+    A single UDP endpoint shared by all UDP tracker sessions.
+    Incoming datagrams are dispatched to the session that owns their transaction ID.
+    """
 
-    def __init__(self, tracker_url, tracker_address, announce_page, on_result_callback):
-        super(UdpTrackerSession, self).__init__(u'UDP', tracker_url, tracker_address, announce_page, on_result_callback)
-        self._connection_id = 0
-        self._transaction_id = 0
+    def __init__(self):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._session_dict = {}
 
-    @staticmethod
-    def generate_transaction_id(session):
+    def register_session(self, session):
+        """
+        Hands out an unused transaction ID and routes the responses carrying it to the given session.
+        :return: The transaction ID.
+        """
         while True:
             # make sure there is no duplicated transaction IDs
             transaction_id = random.randint(0, MAX_INT32)
-            if transaction_id not in UdpTrackerSession._active_session_dict.items():
-                UdpTrackerSession._active_session_dict[session] = transaction_id
-                session.transactionId = transaction_id
-                break
+            if transaction_id not in self._session_dict:
+                self._session_dict[transaction_id] = session
+                return transaction_id
+
+    def unregister_session(self, transaction_id):
+        self._session_dict.pop(transaction_id, None)
+
+    def send(self, message, address):
+        self.transport.write(message, address)
+
+    def datagramReceived(self, data, address):
+        # every tracker response starts with the action and the transaction ID
+        if len(data) < 8:
+            self._logger.debug(u"Ignoring short UDP tracker packet from %s", address)
+            return
 
-    @staticmethod
-    def remove_transaction_id(session):
-        if session in UdpTrackerSession._active_session_dict:
-            del UdpTrackerSession._active_session_dict[session]
+        transaction_id = struct.unpack_from('!i', data, 4)[0]
+        session = self._session_dict.get(transaction_id)
+        if session is None:
+            self._logger.debug(u"Ignoring UDP tracker packet with unknown transaction ID from %s", address)
+            return
+
+        session.on_response(data)
+
+
+class UdpTrackerSession(TrackerSession):
+
+    def __init__(self, tracker_url, tracker_address, announce_page, on_result_callback, on_finished_callback,
+                 udp_protocol):
+        super(UdpTrackerSession, self).__init__(u'UDP', tracker_url, tracker_address, announce_page,
+                                                on_result_callback, on_finished_callback)
+        self._udp_protocol = udp_protocol
+        self._ip_address = None
+        self._connection_id = 0
+        self._transaction_id = None
+        self._action = None
 
     def cleanup(self):
-        UdpTrackerSession.remove_transaction_id(self)
+        self._renew_transaction_id(register=False)
+        self._udp_protocol = None
         super(UdpTrackerSession, self).cleanup()
 
+    @property
     def max_retries(self):
         return UDP_TRACKER_MAX_RETRIES
 
+    @property
     def retry_interval(self):
         return UDP_TRACKER_RECHECK_INTERVAL * (2 ** self._retries)
 
-    def create_connection(self):
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self._socket.setblocking(0)
-        self._socket.connect(self._tracker_address)
+    def _renew_transaction_id(self, register=True):
+        if self._transaction_id is not None:
+            self._udp_protocol.unregister_session(self._transaction_id)
+            self._transaction_id = None
+        if register:
+            self._transaction_id = self._udp_protocol.register_session(self)
 
-        return self.recreate_connection()
+    def connect_to_tracker(self):
+        self._start_time = time.time()
+        self._last_contact = int(self._start_time)
 
-    def recreate_connection(self):
-        super(UdpTrackerSession, self).recreate_connection()
+        hostname, _ = self._tracker_address
+        resolve_deferred = reactor.resolve(hostname)
+        resolve_deferred.addCallbacks(self._on_resolved, self._on_resolve_failed)
+
+    def _on_resolved(self, ip_address):
+        if self._on_finished_callback is None:
+            return
+
+        self._ip_address = ip_address
+        self._send_connect()
+
+    def _on_resolve_failed(self, failure):
+        if self._on_finished_callback is None:
+            return
 
+        self._logger.debug(u"%s Failed to resolve tracker: %s", self, failure.getErrorMessage())
+        self._finish(False)
+
+    def _send_connect(self):
         # prepare connection message
         self._connection_id = UDP_TRACKER_INIT_CONNECTION_ID
         self._action = TRACKER_ACTION_CONNECT
-        UdpTrackerSession.generate_transaction_id(self)
+        self._renew_transaction_id()
+
+        self._send(struct.pack('!qii', self._connection_id, self._action, self._transaction_id))
 
-        message = struct.pack('!qii', self._connection_id, self._action, self._transaction_id)
+    def _send(self, message):
         try:
-            self._socket.send(message)
+            self._udp_protocol.send(message, (self._ip_address, self._tracker_address[1]))
         except Exception as e:
             self._logger.debug(u"%s Failed to send message: %s", self, e)
-            self._is_failed = True
-            return False
+            self._finish(False)
+            return
 
         self._last_contact = int(time.time())
-        return True
-
-    def _handle_connection(self):
-        try:
-            # TODO: this number may be increased
-            response = self._socket.recv(32)
-        except Exception as e:
-            self._logger.info(u"%s Failed to receive UDP CONNECT response: %s", self, e)
-            self._is_failed = True
-            return
+        self.cancel_pending_task(u"timeout")
+        self.register_task(u"timeout", reactor.callLater(self.retry_interval, self._on_timeout))
 
-        # check message size
-        if len(response) < 16:
-            self._logger.info(u"%s Invalid response for UDP CONNECT: %s", self, repr(response))
-            self._is_failed = True
-            return
+    def _on_timeout(self):
+        self._retries += 1
+        if self._retries > self.max_retries:
+            self._logger.debug(u"%s max retry count hit", self)
+            self._finish(False)
+        else:
+            # the connection ID may have expired in the meantime, so start over from the handshake
+            self._logger.debug(u"%s retrying: %d/%d", self, self._retries, self.max_retries)
+            self._send_connect()
 
-        # check the response
+    def on_response(self, response):
+        """
+        Handles a datagram that the UdpTrackerProtocol routed to this session.
+        """
         action, transaction_id = struct.unpack_from('!ii', response, 0)
         if action != self._action or transaction_id != self._transaction_id:
             # get error message
-            errmsg_length = len(response) - 8
-            error_message = struct.unpack_from('!' + str(errmsg_length) + 's', response, 8)
+            error_message = response[8:]
 
-            self._logger.info(u"%s Error response for UDP CONNECT [%s]: %s",
-                              self, repr(response), repr(error_message))
-            self._is_failed = True
+            self._logger.info(u"%s Error response for UDP action %s [%s]: %s",
+                              self, self._action, repr(response), repr(error_message))
+            self._finish(False)
+            return
+
+        if self._action == TRACKER_ACTION_CONNECT:
+            self._handle_connection(response)
+        else:
+            self._handle_response(response)
+
+    def _handle_connection(self, response):
+        # check message size
+        if len(response) < 16:
+            self._logger.info(u"%s Invalid response for UDP CONNECT: %s", self, repr(response))
+            self._finish(False)
             return
 
         # update action and IDs
         self._connection_id = struct.unpack_from('!q', response, 8)[0]
         self._action = TRACKER_ACTION_SCRAPE
-        UdpTrackerSession.generate_transaction_id(self)
-
-        # pack and send the message
-        fmt = '!qii' + ('20s' * len(self._infohash_list))
-        message = struct.pack(fmt, self._connection_id, self._action, self._transaction_id, *self._infohash_list)
-
-        try:
-            self._socket.send(message)
-        except Exception as e:
-            self._logger.debug(u"%s Failed to send UDP SCRAPE message: %s", self, e)
-            self._is_failed = True
-            return
+        self._renew_transaction_id()
 
         # no more requests can be appended to this session
         self._is_initiated = True
-        self._last_contact = int(time.time())
 
-    def _handle_response(self):
-        try:
-            # 74 infohashes are roughly 896 bytes
-            # TODO: the receive number may be changed
-            response = self._socket.recv(1024)
-        except Exception as e:
-            self._logger.info(u"%s Failed to receive UDP SCRAPE response: %s", self, e)
-            self._is_failed = True
-            return
-
-        # check message size
-        if len(response) < 8:
-            self._logger.info(u"%s Invalid response for UDP SCRAPE: %s", self, repr(response))
-            self._is_failed = True
-            return
-
-        # check response
-        action, transaction_id = struct.unpack_from('!ii', response, 0)
-        if action != self._action or transaction_id != self._transaction_id:
-            # get error message
-            errmsg_length = len(response) - 8
-            error_message = \
-                struct.unpack_from('!' + str(errmsg_length) + 's', response, 8)
-
-            self._logger.info(u"%s Error response for UDP SCRAPE: [%s] [%s]",
-                              self, repr(response), repr(error_message))
-            self._is_failed = True
-            return
+        # pack and send the message
+        fmt = '!qii' + ('20s' * len(self._infohash_list))
+        self._send(struct.pack(fmt, self._connection_id, self._action, self._transaction_id, *self._infohash_list))
 
+    def _handle_response(self, response):
         # get results
         if len(response) - 8 != len(self._infohash_list) * 12:
             self._logger.info(u"%s UDP SCRAPE response mismatch: %s", self, repr(response))
-            self._is_failed = True
+            self._finish(False)
             return
 
         offset = 8
@@ -578,48 +465,47 @@ class UdpTrackerSession(TrackerSession):
             # handle the retrieved information
             self._on_result_callback(infohash, seeders, leechers)
 
-        # close this socket and remove its transaction ID from the list
-        UdpTrackerSession.remove_transaction_id(self)
-        self._is_finished = True
+        # remove its transaction ID from the protocol
+        self._renew_transaction_id(register=False)
+        self._finish(True)
 
 
 class FakeDHTSession(TrackerSession):
     """
     Fake TrackerSession that manages DHT requests
     """
-    def __init__(self, session, on_result_callback):
-        super(FakeDHTSession, self).__init__(u'DHT', u'DHT', u'DHT', u'DHT', on_result_callback)
+    def __init__(self, session, on_result_callback, on_finished_callback):
+        super(FakeDHTSession, self).__init__(u'DHT', u'DHT', u'DHT', u'DHT', on_result_callback, on_finished_callback)
 
-        self._socket = None
         self._session = session
 
     def cleanup(self):
-        self._infohash_list = None
+        super(FakeDHTSession, self).cleanup()
         self._session = None
 
     def can_add_request(self):
         return True
 
     def add_request(self, infohash):
+        # every DHT lookup completes on its own, so it is reported as a single-infohash session
         @call_on_reactor_thread
         def on_metainfo_received(metainfo):
-            self._on_result_callback(infohash, metainfo['seeders'], metainfo['leechers'])
+            if self._on_result_callback is not None:
+                self._on_result_callback(infohash, metainfo['seeders'], metainfo['leechers'])
+                self._on_finished_callback(self, [infohash], True)
 
         @call_on_reactor_thread
         def on_metainfo_timeout(result_info_hash):
-            self._on_result_callback(result_info_hash, seeders=0, leechers=0)
-
-        if self._session:
-            self._session.lm.ltmgr.get_metainfo(infohash, callback=on_metainfo_received,
-                                                timeout_callback=on_metainfo_timeout)
+            if self._on_result_callback is not None:
+                self._on_result_callback(result_info_hash, seeders=0, leechers=0)
+                self._on_finished_callback(self, [result_info_hash], True)
 
-    def create_connection(self):
-        pass
-
-    def _handle_connection(self):
-        pass
+        # a torrent that is being downloaded isn't looked up, it has to be reported as failed right away
+        if not self._session or not self._session.lm.ltmgr.get_metainfo(infohash, callback=on_metainfo_received,
+                                                                        timeout_callback=on_metainfo_timeout):
+            self._on_finished_callback(self, [infohash], False)
 
-    def _handle_response(self):
+    def connect_to_tracker(self):
         pass
 
     @property
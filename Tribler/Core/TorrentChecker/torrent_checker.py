@@ -1,8 +1,6 @@
 from binascii import hexlify
-from collections import deque
+from collections import defaultdict
 import logging
-import select
-from threading import Thread
 import time
 
 from twisted.internet import reactor
@@ -10,72 +8,25 @@ from twisted.internet import reactor
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_reactor_thread
 
+from Tribler.Core.Modules.tracker_manager import MAX_CONCURRENT_SCRAPES
 from Tribler.Core.simpledefs import NTFY_TORRENTS
-from Tribler.Core.TorrentChecker.session import TRACKER_ACTION_CONNECT, create_tracker_session
-from Tribler.Core.Utilities.network_utils import InterruptSocket
+from Tribler.Core.TorrentChecker.scrape_queue import ScrapeQueue
+from Tribler.Core.TorrentChecker.session import MAX_TRACKER_MULTI_SCRAPE, UdpTrackerProtocol, create_tracker_session
 
 from .session import FakeDHTSession
 
 # some settings
-DEFAULT_TORRENT_SELECTION_INTERVAL = 20  # every 20 seconds, the thread will select torrents to check
+DEFAULT_TORRENT_SELECTION_INTERVAL = 20  # every 20 seconds, the checker will select torrents to check
 DEFAULT_TORRENT_CHECK_INTERVAL = 900  # base multiplier for the check delay
 
 DEFAULT_MAX_TORRENT_CHECK_RETRIES = 8  # max check delay increments when failed.
 DEFAULT_TORRENT_CHECK_RETRY_INTERVAL = 30  # interval when the torrent was successfully checked for the last time
 
+# enough queued torrents per tracker to fill all its concurrent scrapes
+MAX_QUEUED_TORRENTS_PER_TRACKER = MAX_TRACKER_MULTI_SCRAPE * MAX_CONCURRENT_SCRAPES
 
-class TorrentCheckerThread(Thread):
-
-    """
-    Thread used to monitor for data arriving on the scrape sockets.
-    """
-
-    def __init__(self, tracker_checker):
-        super(TorrentCheckerThread, self).__init__(name=u"torrent_checker")
-        self._logger = logging.getLogger(self.__class__.__name__)
-        self._torrent_checker = tracker_checker
-
-        self._interrupt_socket = InterruptSocket()
-
-        self._session_dict = {}
-
-    def cleanup(self):
-        self._session_dict = None
-        self._interrupt_socket.close()
-        self._interrupt_socket = None
-
-    def interrupt(self):
-        self._interrupt_socket.interrupt()
-
-    def run(self):
-        """
-        Checks for data in the scrape sockets until it's time to stop.
-        Every time there's data on one of the sockets, TorrentChecker.check_sessions() will be called.
-        """
-        check_read_socket_list = []
-        check_write_socket_list = []
-        while not self._torrent_checker.should_stop:
-            check_read_socket_list.append(self._interrupt_socket.socket)
-
-            read_socket_list, write_socket_list, _ = select.select(check_read_socket_list,
-                                                                   check_write_socket_list,
-                                                                   [], 5)
-
-            if self._torrent_checker.should_stop:
-                break
-
-            if self._interrupt_socket.socket in read_socket_list:
-                self._interrupt_socket.clear()
-                read_socket_list = [sock for sock in read_socket_list if sock != self._interrupt_socket.socket]
-
-            result = self._torrent_checker.check_sessions(read_socket_list, write_socket_list, [])
-
-            if result is None:
-                break
-            check_read_socket_list, check_write_socket_list = result
-
-        self.cleanup()
-        self._logger.info(u"stopped")
+# seconds after which a torrent that is still waiting for responses is considered checked, so it can be checked again
+PENDING_RESPONSE_TIMEOUT = DEFAULT_TORRENT_CHECK_INTERVAL
 
 
 class TorrentChecker(TaskManager):
@@ -89,16 +40,20 @@ class TorrentChecker(TaskManager):
 
         self._should_stop = False
 
-        self._checker_thread = None
+        self._udp_protocol = None
+        self._udp_port = None
 
-        self._pending_request_queue = deque()
+        self._scrape_queue = ScrapeQueue()
         self._pending_response_dict = {}
 
         self._torrent_check_interval = DEFAULT_TORRENT_CHECK_INTERVAL
         self._torrent_check_retry_interval = DEFAULT_TORRENT_CHECK_RETRY_INTERVAL
         self._max_torrent_check_retries = DEFAULT_MAX_TORRENT_CHECK_RETRIES
 
-        self._session_list = [FakeDHTSession(session, self._on_result_from_session), ]
+        # the active sessions per tracker URL, so a request only looks at the sessions of its own tracker
+        self._session_dict = defaultdict(list)
+        self._session_dict[u'DHT'].append(FakeDHTSession(session, self._on_result_from_session,
+                                                         self._on_session_finished))
         self._last_torrent_selection_time = 0
 
     @property
@@ -109,36 +64,35 @@ class TorrentChecker(TaskManager):
     def initialize(self):
         self._torrent_db = self._session.open_dbhandler(NTFY_TORRENTS)
 
-        self._reschedule_torrent_select()
+        # all UDP tracker sessions share a single socket
+        self._udp_protocol = UdpTrackerProtocol()
+        self._udp_port = reactor.listenUDP(0, self._udp_protocol)
 
-        self._checker_thread = TorrentCheckerThread(self)
-        self._checker_thread.start()
+        self._reschedule_torrent_select()
 
+    @blocking_call_on_reactor_thread
     def shutdown(self):
         """
         Shutdown the torrent health checker.
 
         Once shut down it can't be started again.
         """
-        # stop the checking thread first because it can block on the reactor thread
-        join_timeout = 10.0  # 10 seconds should be way sufficient
-
         self._should_stop = True
-        self._checker_thread.interrupt()
-        self._checker_thread.join(join_timeout)  # do not block forever
-        if self._checker_thread.is_alive():
-            self._logger.critical("_checker_thread.join(%s) timed out.", join_timeout)
-        self._checker_thread = None
 
-        # it's now safe to block on the reactor thread
         self.cancel_all_pending_tasks()
 
         # kill all the tracker sessions
-        for session in self._session_list:
-            session.cleanup()
-        self._session_list = None
+        for session_list in self._session_dict.itervalues():
+            for session in session_list:
+                session.cleanup()
+        self._session_dict = None
+
+        if self._udp_port is not None:
+            self._udp_port.stopListening()
+            self._udp_port = None
+        self._udp_protocol = None
 
-        self._pending_request_queue = None
+        self._scrape_queue = None
         self._pending_response_dict = None
 
         self._torrent_db = None
@@ -172,6 +126,8 @@ class TorrentChecker(TaskManager):
         # start selecting torrents
         current_time = int(time.time())
 
+        self._expire_pending_responses(current_time)
+
         result = self._session.lm.tracker_manager.get_next_tracker_for_auto_check()
         if result is None:
             self._logger.warn(u"No tracker to select from, skip")
@@ -180,21 +136,27 @@ class TorrentChecker(TaskManager):
         tracker_url, _ = result
         self._logger.debug(u"Start selecting torrents on tracker %s.", tracker_url)
 
-        all_torrent_list = self._torrent_db.getTorrentsOnTracker(tracker_url, current_time)
+        # top up the queue of this tracker with the torrents that are most overdue
+        queue_room = MAX_QUEUED_TORRENTS_PER_TRACKER - self._scrape_queue.get_queue_size(tracker_url)
+        all_torrent_list = self._torrent_db.getTorrentsOnTracker(tracker_url, current_time, queue_room) \
+            if queue_room > 0 else []
 
         # get the torrents that should be checked
         scheduled_torrents = 0
-        for torrent_id, infohash, last_check in all_torrent_list:
+        for torrent_id, infohash, last_check, next_check, num_seeders in all_torrent_list:
             # recheck interval is: interval * 2^(retries)
             if current_time - last_check < self._torrent_check_interval:
                 continue
 
-            self._pending_request_queue.append((torrent_id, infohash, [tracker_url, ]))
-            scheduled_torrents += 1
+            # skip the torrents that are being checked right now
+            if infohash in self._pending_response_dict:
+                continue
+
+            if self._scrape_queue.push(tracker_url, infohash, next_check, num_seeders):
+                scheduled_torrents += 1
 
         self._logger.debug(u"Selected %d new torrents to check on tracker: %s", scheduled_torrents, tracker_url)
-        if scheduled_torrents > 0:
-            self._checker_thread.interrupt()
+        self._start_scrapes(tracker_url)
 
     @call_on_reactor_thread
     def add_gui_request(self, infohash):
@@ -229,199 +191,144 @@ class TorrentChecker(TaskManager):
             # TODO: add code to handle torrents with no tracker
             return
 
-        self._pending_request_queue.append((torrent_id, infohash, tracker_set))
-        self._checker_thread.interrupt()
-
-    @blocking_call_on_reactor_thread
-    def check_sessions(self, read_socket_list, write_socket_list, _):
-        if self._should_stop:
-            return
-
-        current_time = int(time.time())
-
-        session_dict = {}
-        for session in self._session_list:
-            session_dict[session.socket] = session
-
-        # >> Step 1: Check the sockets
-        self._logger.debug(u"got %d writable sockets, %d readable sockets",
-                           len(write_socket_list), len(read_socket_list))
-        # check writable sockets (TCP connections)
-        for write_socket in write_socket_list:
-            session = session_dict[write_socket]
-            session.process_request()
-
-        # check readable sockets
-        for read_socket in read_socket_list:
-            session = session_dict[read_socket]
-            session.process_request()
-
-        # >> Step 2: Handle timed out UDP sessions
-        for session in session_dict.values():
-            diff = current_time - session.last_contact
-            if diff > session.retry_interval:
-                session._is_timed_out = True
-
-                for infohash in session.infohash_list:
-                    self._pending_response_dict[infohash][u'updated'] = True
-
-                session.increase_retries()
-
-                if session.retries > session.max_retries:
-                    session._is_failed = True
-                    self._logger.debug(u"%s max retry count hit", session)
-                else:
-                    # re-establish the connection
-                    # Do it in a callLater so the timed out flag is not cleared until we are done with it.
-                    self._logger.debug(u"%s retrying: %d/%d", session, session.retries, self._max_torrent_check_retries)
-                    reactor.callLater(0, session.recreate_connection)
-
-        # >> Step 3: Remove completed sessions and update tracker info
-        if self._session_list:
-            for i in range(len(self._session_list) - 1, -1, -1):
-                session = self._session_list[i]
-
-                if session.is_failed or session.is_finished:
-                    self._logger.debug(u"%s is %s", session, u'failed' if session.is_failed else u'finished')
-
-                    # update tracker info
-                    self._session.lm.tracker_manager.update_tracker_info(session.tracker_url, not session.is_failed)
-
-                    # set torrent remaining responses
-                    for infohash in session.infohash_list:
-                        self._pending_response_dict[infohash][u'remaining_responses'] -= 1
-
-                    session.cleanup()
-                    self._session_list.pop(i)
-
-        # >> Step 4. check and update new results
-        for infohash, response in self._pending_response_dict.items():
-            if response[u'updated']:
-                response[u'updated'] = False
-                self._update_torrent_result(response)
-
-            if self._pending_response_dict[infohash][u'remaining_responses'] == 0:
-                del self._pending_response_dict[infohash]
-
-        self._logger.debug(u"total sessions: %d", len(self._session_list))
-        for session in self._session_list:
-            self._logger.debug(u"%s, finished: %d, failed: %d", session, session.is_finished, session.is_failed)
-
-        # ---------------------------------------------------
-        # Start processing pending requests and make select socket lists
-
-        # process all pending request
-        self._process_pending_requests()
-
-        # create read and write socket check list
-        # check non-blocking connection TCP sockets if they are writable
-        # check UDP and TCP response sockets if they are readable
-        check_read_socket_list = []
-        check_write_socket_list = []
-
-        session_dict = {}
-        for session in self._session_list:
-            session_dict[session.socket] = session
-
-        for session_socket, session in session_dict.iteritems():
-            if session.tracker_type == u'DHT':
-                # FakeDHTSession doesn't really have a socket as it uses LibtorrentMgr's DHT
+        # GUI requests go in front of the queues, the scrapes are filled up with other queued torrents
+        for tracker_url in tracker_set:
+            # skip no-DHT
+            if tracker_url == u'no-DHT':
                 continue
-            if session.tracker_type == u'UDP':
-                check_read_socket_list.append(session_socket)
-            else:
-                if session.action == TRACKER_ACTION_CONNECT:
-                    check_write_socket_list.append(session_socket)
-                else:
-                    check_read_socket_list.append(session_socket)
-
-        # return select socket lists
-        return check_read_socket_list, check_write_socket_list
+            self._scrape_queue.push(tracker_url, infohash, last_check, is_gui_request=True)
+            self._start_scrapes(tracker_url)
 
-    def _process_pending_requests(self):
+    def _start_scrapes(self, tracker_url):
         """
-        Processes all pending requests.
+        Starts as many full scrapes on the given tracker as it is allowed to handle at the same time.
         """
-        while len(self._pending_request_queue) > 0:
-            _, infohash, tracker_set = self._pending_request_queue.popleft()
-            for tracker_url in tracker_set:
-                self._create_session_for_request(infohash, tracker_url)
-
-    def _create_session_for_request(self, infohash, tracker_url):
-        # skip no-DHT
-        if tracker_url == u'no-DHT':
+        if tracker_url == u'DHT':
+            dht_session = self._session_dict[u'DHT'][0]
+            for infohash in self._scrape_queue.pop(tracker_url, MAX_TRACKER_MULTI_SCRAPE):
+                # the DHT session may report right away, so it has to know that a response is expected first
+                self._update_pending_response(infohash)
+                dht_session.add_request(infohash)
             return
 
-        # >> Step 1: Try to append the request to an existing session
-        # check there is any existing session that scrapes this torrent
-        request_handled = False
-        for session in self._session_list:
-            if session.tracker_url != tracker_url or session.is_failed:
-                continue
+        # wait until a recently failed tracker has backed off, its queue is kept until then
+        if not self._session.lm.tracker_manager.should_check_tracker(tracker_url):
+            self._logger.debug(u"skipping recently failed tracker %s", tracker_url)
+            return
 
-            if session.has_request(infohash):
-                # a torrent check is already there, ignore this request
-                request_handled = True
+        num_sessions = self._session.lm.tracker_manager.get_max_concurrent_scrapes(tracker_url) \
+            - len(self._session_dict.get(tracker_url, ()))
+        for _ in xrange(num_sessions):
+            infohash_list = self._scrape_queue.pop(tracker_url, MAX_TRACKER_MULTI_SCRAPE)
+            if not infohash_list:
                 break
-
-            if session.can_add_request():
-                session.add_request(infohash)
-                self._update_pending_response(infohash)
-                request_handled = True
+            if not self._create_session(tracker_url, infohash_list):
                 break
 
-        if request_handled:
-            self._logger.debug(u'infohash [%s] appended', hexlify(infohash))
-            return
+    def _create_session(self, tracker_url, infohash_list):
+        """
+        Creates and starts a session that scrapes the given infohashes on the given tracker.
+        :return: True if the session has been started, False otherwise.
+        """
+        try:
+            session = create_tracker_session(tracker_url, self._on_result_from_session, self._on_session_finished,
+                                             self._udp_protocol)
+        except Exception as e:
+            self._logger.info(u"Failed to create session for tracker %s: %s", tracker_url, e)
+            self._session.lm.tracker_manager.update_tracker_info(tracker_url, False)
+            return False
 
-        # >> Step 2: No session to append to, create a new one
-        # create a new session for this request
+        for infohash in infohash_list:
+            session.add_request(infohash)
+            # update the number of responses this torrent is expecting
+            self._update_pending_response(infohash)
+        self._session_dict[tracker_url].append(session)
 
-        # before creating a new session, check if the tracker is alive
-        if not self._session.lm.tracker_manager.should_check_tracker(tracker_url):
-            self._logger.warn(u"skipping recently failed tracker %s", tracker_url)
-            return
+        self._logger.debug(u"Session created for %d infohashes on %s", len(infohash_list), tracker_url)
+        session.connect_to_tracker()
+        return True
 
-        session = None
-        try:
-            session = create_tracker_session(tracker_url, self._on_result_from_session)
+    def _on_session_finished(self, session, infohash_list, success):
+        """
+        Called by a session once its infohashes have been checked or the check has failed.
+        """
+        if self._should_stop:
+            return
 
-            connection_established = session.create_connection()
-            if not connection_established:
-                raise RuntimeError(u"Could not establish connection")
+        self._logger.debug(u"%s is %s", session, u'finished' if success else u'failed')
 
-            session.add_request(infohash)
+        # the DHT session stays around and reports every infohash separately
+        if session.tracker_type != u'DHT':
+            # update tracker info
+            latency = time.time() - session.start_time if success else None
+            self._session.lm.tracker_manager.update_tracker_info(session.tracker_url, success, latency)
 
-            self._session_list.append(session)
+            tracker_session_list = self._session_dict[session.tracker_url]
+            tracker_session_list.remove(session)
+            if not tracker_session_list:
+                del self._session_dict[session.tracker_url]
 
-            # update the number of responses this torrent is expecting
-            self._update_pending_response(infohash)
+        for infohash in list(infohash_list):
+            response = self._pending_response_dict.get(infohash)
+            if response is None:
+                # the torrent has been waiting too long and was given up on
+                continue
+            response[u'remaining_responses'] -= 1
 
-            self._logger.debug(u"Session created for infohash %s", hexlify(infohash))
+            # store the best result so far
+            if response[u'updated']:
+                response[u'updated'] = False
+                self._update_torrent_result(response)
 
-        except Exception as e:
-            self._logger.info(u"Failed to create session for tracker %s: %s", tracker_url, e)
+            if response[u'remaining_responses'] == 0:
+                del self._pending_response_dict[infohash]
 
-            if session:
-                session.cleanup()
+        if session.tracker_type != u'DHT':
+            session.cleanup()
 
-            self._session.lm.tracker_manager.update_tracker_info(tracker_url, False)
+            # keep the tracker busy while it has queued torrents
+            self._start_scrapes(session.tracker_url)
 
     def _update_pending_response(self, infohash):
+        expiry_time = time.time() + PENDING_RESPONSE_TIMEOUT
         if infohash in self._pending_response_dict:
             self._pending_response_dict[infohash][u'remaining_responses'] += 1
             self._pending_response_dict[infohash][u'updated'] = False
+            self._pending_response_dict[infohash][u'expiry_time'] = expiry_time
         else:
             self._pending_response_dict[infohash] = {u'infohash': infohash,
                                                      u'remaining_responses': 1,
                                                      u'seeders': -2,
                                                      u'leechers': -2,
-                                                     u'updated': False}
+                                                     u'updated': False,
+                                                     u'expiry_time': expiry_time}
+
+    def _expire_pending_responses(self, current_time):
+        """
+        Gives up on the torrents whose responses didn't arrive in time. They are stored as checked without any peers,
+        unless a response did arrive, so they are checked again like any other torrent.
+        """
+        for infohash, response in self._pending_response_dict.items():
+            if response[u'expiry_time'] > current_time:
+                continue
+
+            self._logger.debug(u"Giving up on the %d missing responses for %s", response[u'remaining_responses'],
+                               hexlify(infohash))
+            del self._pending_response_dict[infohash]
+            if response[u'seeders'] < 0:
+                response[u'seeders'] = response[u'leechers'] = 0
+                response[u'last_check'] = current_time
+                response[u'updated'] = True
+            if response[u'updated']:
+                self._update_torrent_result(response)
 
     def _on_result_from_session(self, infohash, seeders, leechers):
         if self.should_stop:
             return
-        response = self._pending_response_dict[infohash]
+        response = self._pending_response_dict.get(infohash)
+        if response is None:
+            # trackers may report on torrents we did not ask for
+            return
         response[u'last_check'] = int(time.time())
         if response[u'seeders'] < seeders or (response[u'seeders'] == seeders and response[u'leechers'] < leechers):
             response[u'seeders'] = seeders
@@ -15,7 +15,7 @@ from Tribler.Core.defaults import TDEF_DEFAULTS
 from Tribler.Core.exceptions import TorrentDefNotFinalizedException, NotYetImplementedException
 import Tribler.Core.APIImplementation.maketorrent as maketorrent
 
-from Tribler.Core.Utilities.utilities import validTorrentFile, isValidURL, parse_magnetlink
+from Tribler.Core.Utilities.utilities import validTorrentFile, isValidURL, parse_magnetlink, get_info_span
 from Tribler.Core.Utilities.unicode import dunno2unicode
 
 
@@ -46,6 +46,7 @@ class TorrentDef(object):
             # self.metainfo_valid set in copy()
             self.metainfo = metainfo
             self.infohash = infohash
+            self.input_files_pending = False
             return
 
         self.input = {}  # fields added by user, waiting to be turned into torrent file
@@ -54,6 +55,8 @@ class TorrentDef(object):
         self.input['encoding'] = sys.getfilesystemencoding()
 
         self.input['files'] = []
+        # whether the files of a loaded torrent still have to be copied into self.input['files']
+        self.input_files_pending = False
 
         self.metainfo_valid = False
         self.metainfo = None  # copy of loaded or last saved torrent dict
@@ -85,8 +88,7 @@ class TorrentDef(object):
         :param data: The torrent file data.
         :return: A TorrentDef object.
         """
-        data = bdecode(data)
-        return TorrentDef._create(data)
+        return TorrentDef._create(bdecode(data), data)
 
     def _read(stream):
         """ Internal class method that reads a torrent file from stream,
@@ -94,23 +96,31 @@ class TorrentDef(object):
         accordingly. """
         bdata = stream.read()
         stream.close()
-        data = bdecode(bdata)
-        return TorrentDef._create(data)
+        return TorrentDef._create(bdecode(bdata), bdata)
     _read = staticmethod(_read)
 
-    def _create(metainfo):  # TODO: replace with constructor
+    def _create(metainfo, data=None):  # TODO: replace with constructor
+        """ Creates a finalized TorrentDef from the metainfo. When the bencoded
+        torrent file is given as data, the infohash is computed over the info
+        dictionary in data instead of bencoding metainfo['info'] again. """
         # raises ValueErrors if not good
         validTorrentFile(metainfo)
 
         t = TorrentDef()
         t.metainfo = metainfo
         t.metainfo_valid = True
-        # copy stuff into self.input
-        maketorrent.copy_metainfo_to_input(t.metainfo, t.input)
+        # copy stuff into self.input, the file list is only copied when it's needed
+        maketorrent.copy_metainfo_to_input(t.metainfo, t.input, copy_files=False)
+        t.input_files_pending = True
 
         # Two places where infohash calculated, here and in maketorrent.py
         # Elsewhere: must use TorrentDef.get_infohash() to allow P2PURLs.
-        t.infohash = sha1(bencode(metainfo['info'])).digest()
+        info_span = get_info_span(data) if data is not None else None
+        if info_span:
+            begin, end = info_span
+            t.infohash = sha1(buffer(data, begin, end - begin)).digest()
+        else:
+            t.infohash = sha1(bencode(metainfo['info'])).digest()
 
         assert isinstance(t.infohash, str), "INFOHASH has invalid type: %s" % type(t.infohash)
         assert len(t.infohash) == INFOHASH_LENGTH, "INFOHASH has invalid length: %d" % len(t.infohash)
@@ -188,6 +198,7 @@ class TorrentDef(object):
         """
         s = os.stat(inpath)
         d = {'inpath': inpath, 'outpath': outpath, 'playtime': playtime, 'length': s.st_size}
+        self._load_input_files()
         self.input['files'].append(d)
 
         self.metainfo_valid = False
@@ -198,6 +209,7 @@ class TorrentDef(object):
         @param inpath Absolute name of file or directory on local filesystem,
         as Unicode string.
         """
+        self._load_input_files()
         for d in self.input['files']:
             if d['inpath'] == inpath:
                 self.input['files'].remove(d)
@@ -409,6 +421,13 @@ class TorrentDef(object):
         else:
             return []
 
+    def _load_input_files(self):
+        """ Copies the files of a loaded torrent into self.input, they are
+        only needed to modify the torrent. """
+        if self.input_files_pending:
+            self.input_files_pending = False
+            maketorrent.copy_metainfo_files_to_input(self.metainfo, self.input)
+
     def finalize(self, userabortflag=None, userprogresscallback=None):
         """ Create BT torrent file by reading the files added with
         add_content() and calculate the torrent file's infohash.
@@ -429,6 +448,8 @@ class TorrentDef(object):
         if self.metainfo_valid:
             return
 
+        self._load_input_files()
+
         # Note: reading of all files and calc of hashes is done by calling
         # thread.
         (infohash, metainfo) = maketorrent.make_torrent_file(self.input,
@@ -10,6 +10,7 @@
 import logging
 import os
 from binascii import hexlify
+from collections import defaultdict
 from shutil import rmtree
 from sqlite3 import Connection
 
@@ -18,6 +19,7 @@ from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler
 from Tribler.Core.CacheDB.db_versions import LOWEST_SUPPORTED_DB_VERSION, LATEST_DB_VERSION
 from Tribler.Core.CacheDB.sqlitecachedb import str2bin
 from Tribler.Core.TorrentDef import TorrentDef
+from Tribler.Core.Utilities.search_utils import split_into_keywords, get_term_trigram_rows
 
 
 class VersionNoLongerSupportedError(Exception):
@@ -81,6 +83,14 @@ class DBUpgrader(object):
         if self.db.version == 27:
             self._upgrade_27_to_28()
 
+        # version 28 -> 29
+        if self.db.version == 28:
+            self._upgrade_28_to_29()
+
+        # version 29 -> 30
+        if self.db.version == 29:
+            self._upgrade_29_to_30()
+
         # check if we managed to upgrade to the latest DB version.
         if self.db.version == LATEST_DB_VERSION:
             self.status_update_func(u"Database upgrade finished.")
@@ -517,6 +527,112 @@ DROP TABLE IF EXISTS MetaDataTypes;
         # update database version
         self.db.write_version(28)
 
+    def _upgrade_28_to_29(self):
+        self.status_update_func(u"Upgrading database from v%s to v%s..." % (28, 29))
+
+        # add the search term dictionary and its trigram index
+        self.db.execute(u"""
+CREATE TABLE IF NOT EXISTS SearchTerm (
+  term                  text    PRIMARY KEY NOT NULL,
+  frequency             integer DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS SearchTermTrigram (
+  trigram               text    NOT NULL,
+  term                  text    NOT NULL,
+  PRIMARY KEY (trigram, term)
+);
+""")
+
+        self.status_update_func(u"Building search term index...")
+        term_frequencies = defaultdict(int)
+        for swarmname, in self.db.execute(u"SELECT swarmname FROM FullTextIndex"):
+            for term in set(split_into_keywords(swarmname or u"")):
+                term_frequencies[term] += 1
+
+        self.db.executemany(u"INSERT OR REPLACE INTO SearchTerm (term, frequency) VALUES (?, ?)",
+                            term_frequencies.iteritems())
+        self.db.executemany(u"INSERT OR IGNORE INTO SearchTermTrigram (trigram, term) VALUES (?, ?)",
+                            get_term_trigram_rows(term_frequencies.iterkeys()))
+
+        # update database version
+        self.db.write_version(29)
+
+    def _upgrade_29_to_30(self):
+        self.status_update_func(u"Upgrading database from v%s to v%s..." % (29, 30))
+
+        # store the base64 encoded infohashes as BLOBs
+        self.status_update_func(u"Updating Torrent table...")
+        self.db.execute(u"""
+DROP VIEW IF EXISTS CollectedTorrent;
+
+CREATE TABLE _tmp_Torrent (
+  torrent_id       integer PRIMARY KEY AUTOINCREMENT NOT NULL,
+  infohash		   blob NOT NULL,
+  name             text,
+  length           integer,
+  creation_date    integer,
+  num_files        integer,
+  insert_time      numeric,
+  secret           integer,
+  relevance        numeric DEFAULT 0,
+  category         text,
+  status           text DEFAULT 'unknown',
+  num_seeders      integer,
+  num_leechers     integer,
+  comment          text,
+  dispersy_id      integer,
+  is_collected     integer DEFAULT 0,
+  last_tracker_check    integer DEFAULT 0,
+  tracker_check_retries integer DEFAULT 0,
+  next_tracker_check    integer DEFAULT 0
+);
+
+INSERT INTO _tmp_Torrent
+SELECT torrent_id, str2bin(infohash), name, length, creation_date, num_files, insert_time, secret, relevance,
+category, status, num_seeders, num_leechers, comment, dispersy_id, is_collected, last_tracker_check,
+tracker_check_retries, next_tracker_check FROM Torrent;
+
+DROP TABLE Torrent;
+ALTER TABLE _tmp_Torrent RENAME TO Torrent;
+
+CREATE UNIQUE INDEX infohash_idx ON Torrent (infohash);
+CREATE VIEW CollectedTorrent AS SELECT * FROM Torrent WHERE is_collected == 1;
+""")
+
+        # the dispersy_cids are already inserted as BLOBs, the -1 of channels without a community becomes an integer
+        self.status_update_func(u"Updating Channels table...")
+        self.db.execute(u"""
+DROP VIEW IF EXISTS Channels;
+
+CREATE TABLE _tmp_Channels (
+  id                        integer         PRIMARY KEY ASC,
+  dispersy_cid              blob,
+  peer_id                   integer,
+  name                      text            NOT NULL,
+  description               text,
+  modified                  integer         DEFAULT (strftime('%s','now')),
+  inserted                  integer         DEFAULT (strftime('%s','now')),
+  deleted_at                integer,
+  nr_torrents               integer         DEFAULT 0,
+  nr_spam                   integer         DEFAULT 0,
+  nr_favorite               integer         DEFAULT 0
+);
+
+INSERT INTO _tmp_Channels
+SELECT id, CASE WHEN dispersy_cid == '-1' THEN -1 ELSE CAST(dispersy_cid AS BLOB) END, peer_id, name, description,
+modified, inserted, deleted_at, nr_torrents, nr_spam, nr_favorite FROM _Channels;
+
+DROP TABLE _Channels;
+ALTER TABLE _tmp_Channels RENAME TO _Channels;
+
+CREATE VIEW Channels AS SELECT * FROM _Channels WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS ChannelCidIndex ON _Channels(dispersy_cid, deleted_at);
+""")
+
+        # update database version
+        self.db.write_version(30)
+
     def reimport_torrents(self):
         """Import all torrent files in the collected torrent dir, all the files already in the database will be ignored.
         """
@@ -0,0 +1,71 @@
+"""
+Helpers for piece bitfields.
+
+A bitfield is kept as a bytearray with one byte (0 or 1) per piece, so counting and slicing pieces runs in C instead
+of looping over a list of booleans in Python.
+"""
+import struct
+from binascii import hexlify, unhexlify
+
+# (largest count, bytes per counter, struct format) of the counters used by merge_bitfields
+COUNTER_FORMATS = ((0xff, 1, 'B'), (0xffff, 2, 'H'), (0xffffffff, 4, 'I'))
+
+
+def to_bitfield(pieces):
+    """
+    Converts a sequence of booleans, like the pieces of a libtorrent status, to a bitfield.
+    """
+    return pieces if isinstance(pieces, bytearray) else bytearray(pieces)
+
+
+def count_pieces(bitfield, start=0, end=None):
+    """
+    Returns the number of pieces in the range [start, end) that are set in the bitfield.
+    """
+    return bitfield[start:end].count('\x01')
+
+
+def get_pieces_progress(bitfield, pieces, consecutive=False):
+    """
+    Returns the fraction of the given pieces that are set in the bitfield. If consecutive is True, only the pieces up
+    to the first one that isn't set are counted.
+    """
+    if not pieces:
+        return 1.0
+
+    last_piece = max(pieces)
+    if last_piece >= len(bitfield):
+        bitfield = bitfield + bytearray(last_piece + 1 - len(bitfield))
+
+    have = bytearray(map(bitfield.__getitem__, pieces))
+    if consecutive:
+        first_missing = have.find('\x00')
+        pieces_have = len(have) if first_missing == -1 else first_missing
+    else:
+        pieces_have = have.count('\x01')
+    return float(pieces_have) / len(have)
+
+
+def merge_bitfields(bitfields):
+    """
+    Returns a tuple with, for every piece, the number of bitfields that have it.
+
+    Every bitfield is turned into one big integer with a fixed-width counter per piece. The counters are wide enough to
+    never overflow into each other, so adding up the integers counts all pieces at once.
+    """
+    bitfields = [to_bitfield(bitfield) for bitfield in bitfields]
+    num_pieces = max(len(bitfield) for bitfield in bitfields) if bitfields else 0
+    if not num_pieces:
+        return ()
+
+    for max_count, width, counter_format in COUNTER_FORMATS:
+        if len(bitfields) <= max_count:
+            break
+
+    total = 0
+    for bitfield in bitfields:
+        counters = bytearray(num_pieces * width)
+        counters[width - 1:len(bitfield) * width:width] = bitfield
+        total += int(hexlify(counters), 16)
+
+    return struct.unpack('>%d%s' % (num_pieces, counter_format), unhexlify('%0*x' % (num_pieces * width * 2, total)))
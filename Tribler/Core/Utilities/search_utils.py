@@ -2,10 +2,20 @@
 # see LICENSE.txt for license information
 
 import re
+from math import log
+from struct import unpack_from
 
 RE_KEYWORD_SPLIT = re.compile(r"[\W_]", re.UNICODE)
 DIALOG_STOPWORDS = {'an', 'and', 'by', 'for', 'from', 'of', 'the', 'to', 'with'}
 
+# only terms of at least this length are added to the trigram index used for search suggestions
+MIN_SUGGESTION_TERM_LENGTH = 4
+
+# BM25 parameters for ranking full text matches, the column weights are for the FullTextIndex columns
+# (swarmname, filenames, fileextensions)
+BM25_K1 = 1.2
+BM25_COLUMN_WEIGHTS = (1.0, 0.5, 0.25)
+
 
 def split_into_keywords(string, to_filter_stopwords=False):
     """
@@ -25,3 +35,73 @@ def split_into_keywords(string, to_filter_stopwords=False):
 
 def filter_keywords(keywords):
     return [kw for kw in keywords if len(kw) > 0 and kw not in DIALOG_STOPWORDS]
+
+
+def get_trigrams(term):
+    """
+    Returns the set of trigrams of a term. The term is padded with spaces so the start and end of the term are
+    trigrams as well.
+    """
+    padded = u"  %s " % term
+    return set(padded[i:i + 3] for i in xrange(len(padded) - 2))
+
+
+def get_term_trigram_rows(terms):
+    """
+    Returns the (trigram, term) rows to insert in the SearchTermTrigram table for the given terms.
+    """
+    return [(trigram, term) for term in terms if len(term) >= MIN_SUGGESTION_TERM_LENGTH
+            for trigram in get_trigrams(term)]
+
+
+def levenshtein_distance(a, b):
+    """
+    Calculates the Levenshtein distance between a and b.
+    """
+    n, m = len(a), len(b)
+    if n > m:
+        # Make sure n <= m, to use O(min(n,m)) space
+        a, b = b, a
+        n, m = m, n
+
+    current = range(n + 1)
+    for i in range(1, m + 1):
+        previous, current = current, [i] + [0] * n
+        for j in range(1, n + 1):
+            add, delete = previous[j] + 1, current[j - 1] + 1
+            change = previous[j - 1]
+            if a[j - 1] != b[i - 1]:
+                change = change + 1
+            current[j] = min(add, delete, change)
+
+    return current[n]
+
+
+def fts_search_rank(matchinfo, num_docs, num_seeders, nr_favorite, nr_spam):
+    """
+    Ranks a FullTextIndex match, registered as the search_rank SQL function.
+
+    The text relevance is a BM25 score (without document length normalization, which the default FTS3
+    matchinfo does not provide) computed from the 'pcx' matchinfo blob. It is boosted by the number of seeders
+    and by the votes of the channel the torrent is in (if any).
+    """
+    num_phrases, num_cols = unpack_from('II', matchinfo)
+    hits = unpack_from('I' * (3 * num_cols * num_phrases), matchinfo, 8)
+    num_docs = max(num_docs or 0, 1)
+
+    score = 0.0
+    for phrase in xrange(num_phrases):
+        for col in xrange(min(num_cols, len(BM25_COLUMN_WEIGHTS))):
+            offset = 3 * (col + phrase * num_cols)
+            tf = hits[offset]
+            if tf:
+                docs_with_hits = hits[offset + 2]
+                idf = log(1.0 + (num_docs - docs_with_hits + 0.5) / (docs_with_hits + 0.5))
+                score += BM25_COLUMN_WEIGHTS[col] * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1)
+
+    score *= 1.0 + log(1.0 + max(num_seeders or 0, 0))
+
+    votes = (nr_favorite or 0) - (nr_spam or 0)
+    if votes > 0:
+        score *= 1.0 + 0.5 * log(1.0 + votes)
+    return score
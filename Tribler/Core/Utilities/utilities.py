@@ -172,6 +172,44 @@ def isValidTorrentFile(metainfo):
         return False
 
 
+def _skip_bencoded_value(data, offset):
+    """
+    Returns the offset just past the bencoded value that starts at the given offset, without decoding it.
+    """
+    token = data[offset]
+    if token == 'i':
+        return data.index('e', offset) + 1
+    if token in 'ld':
+        offset += 1
+        while data[offset] != 'e':
+            offset = _skip_bencoded_value(data, offset)
+        return offset + 1
+    colon = data.index(':', offset)
+    return colon + 1 + int(data[offset:colon])
+
+
+def get_info_span(data):
+    """
+    Locates the bencoded info dictionary of a torrent file.
+    @param data The bencoded torrent file.
+    @return A (begin, end) tuple with the offsets of the info dictionary in data, or None if it can't be found.
+    """
+    try:
+        if data[0] != 'd':
+            return None
+
+        offset = 1
+        while data[offset] != 'e':
+            key_end = _skip_bencoded_value(data, offset)
+            value_end = _skip_bencoded_value(data, key_end)
+            if data[offset:key_end] == '4:info':
+                return (key_end, value_end) if value_end <= len(data) else None
+            offset = value_end
+    except (IndexError, ValueError):
+        pass
+    return None
+
+
 def isValidURL(url):
     if url.lower().startswith('udp'):    # exception for udp
         url = url.lower().replace('udp', 'http', 1)
@@ -3,13 +3,11 @@
 # see LICENSE.txt for license information
 import os
 import sys
-import time
 import logging
 
 from binascii import hexlify
 from traceback import print_exc
 from collections import defaultdict
-from threading import RLock
 
 from Tribler.Core.simpledefs import NTFY_TORRENTS, NTFY_VIDEO_STARTED, DLMODE_NORMAL, NTFY_VIDEO_BUFFERING
 from Tribler.Core.Libtorrent.LibtorrentDownloadImpl import VODFile
@@ -54,7 +52,6 @@ class VideoPlayer(object):
     def shutdown(self):
         if self.videoserver:
             self.videoserver.shutdown()
-            self.videoserver.server_close()
         if self.vlcwrap:
             self.vlcwrap.shutdown()
             self.vlcwrap = None
@@ -110,17 +107,19 @@ class VideoPlayer(object):
 
         return 1, False
 
-    def get_vod_stream(self, dl_hash, wait=False):
-        if 'stream' not in self.vod_info[dl_hash] and self.session.get_download(dl_hash):
-            download = self.session.get_download(dl_hash)
-            vod_filename = self.get_vod_filename(download)
-            while wait and not os.path.exists(vod_filename):
-                time.sleep(1)
-            self.vod_info[dl_hash]['stream'] = (VODFile(open(vod_filename, 'rb'), download), RLock())
+    def open_vod_stream(self, dl_hash):
+        """
+        Opens a new stream on the VOD file of a download, every reader gets its own stream.
+        The streams are closed when another download is played.
+        """
+        download = self.session.get_download(dl_hash)
+        if not download:
+            return None
 
-        if self.vod_info[dl_hash].has_key('stream'):
-            return self.vod_info[dl_hash]['stream']
-        return None, None
+        stream = VODFile(open(self.get_vod_filename(download), 'rb'), download)
+        streams = [s for s in self.vod_info[dl_hash].get('streams', []) if not s.closed]
+        self.vod_info[dl_hash]['streams'] = streams + [stream]
+        return stream
 
     def get_vod_duration(self, dl_hash):
         return self.vod_info.get(dl_hash, {}).get('duration', 0)
@@ -132,8 +131,8 @@ class VideoPlayer(object):
         if self.vod_download:
             self.vod_download.set_mode(DLMODE_NORMAL)
             vi_dict = self.vod_info.pop(self.vod_download.get_def().get_infohash(), None)
-            if vi_dict and 'stream' in vi_dict:
-                vi_dict['stream'][0].close()
+            for stream in (vi_dict or {}).get('streams', []):
+                stream.close()
 
         self.vod_download = download
         if self.vod_download:
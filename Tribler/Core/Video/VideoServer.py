@@ -2,21 +2,41 @@
 # Based on SimpleServer written by Jan David Mol, Arno Bakker
 # see LICENSE.txt for license information
 #
-import socket
+import os
+import time
 import logging
 import mimetypes
 
-from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
-from SocketServer import ThreadingMixIn
-from threading import Event, Thread
-from traceback import print_exc
+from threading import Event
 from binascii import unhexlify
 from cherrypy.lib.httputil import get_ranges
+from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+from twisted.web import resource
+from twisted.web.server import NOT_DONE_YET, Site
+from zope.interface import implementer
 
 from Tribler.Core.simpledefs import DLMODE_VOD
+from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
 
-class VideoServer(ThreadingMixIn, HTTPServer):
+# the number of threads that VOD requests use to wait for pieces, they have their own pool so stalled players can't
+# take up the threads of the reactor's pool
+VOD_THREADS = 10
+# seconds a request waits for the prebuffer and the VOD file, and seconds a read waits for its pieces
+VOD_WAIT_TIMEOUT = 60
+VOD_READ_TIMEOUT = 60
+
+
+class VideoServer(object):
+    """
+    HTTP server that streams the VOD file of a download to the video player.
+
+    The server runs in the reactor, every request streams its own byte range through a push producer, so several
+    players can read from the same download at the same time and a slow player doesn't cause data to pile up in memory.
+    """
 
     def __init__(self, port, session, video_player):
         self._logger = logging.getLogger(self.__class__.__name__)
@@ -26,59 +46,64 @@ class VideoServer(ThreadingMixIn, HTTPServer):
 
         self.videoplayer = video_player
 
-        HTTPServer.__init__(self, ("127.0.0.1", self.port), VideoRequestHandler)
+        self.site = Site(VideoResource(self))
+        self.site.noisy = False
+        self.listening_port = None
 
-        self.server_thread = None
+        # the producers of the requests that are being served
+        self.producers = set()
 
-        self.daemon_threads = True
-        self.allow_reuse_address = True
+        self.threadpool = ThreadPool(0, VOD_THREADS, name="VideoServer")
+        self.is_stopping = False
 
+    @blocking_call_on_reactor_thread
     def start(self):
-        self.server_thread = Thread(target=self.serve_forever, name="VideoHTTPServerThread-1")
-        self.server_thread.setDaemon(True)
-        self.server_thread.start()
+        self.threadpool.start()
+        self.listening_port = reactor.listenTCP(self.port, self.site, interface="127.0.0.1")
 
-    def process_request_thread(self, request, client_address):
-        try:
-            self.finish_request(request, client_address)
-            self.close_request(request)
-        except socket.error:
-            pass
-        except Exception:
-            print_exc()
+    @blocking_call_on_reactor_thread
+    def shutdown(self):
+        # closing the streams and stopping wakes up the threads that are waiting
+        self.is_stopping = True
+        for producer in list(self.producers):
+            producer.stopProducing()
+        self.threadpool.stop()
+
+        if self.listening_port:
+            self.listening_port.stopListening()
+            self.listening_port = None
 
 
-class VideoRequestHandler(BaseHTTPRequestHandler):
+class VideoResource(resource.Resource):
+
+    isLeaf = True
+
+    def __init__(self, server):
+        resource.Resource.__init__(self)
 
-    def __init__(self, request, client_address, server):
         self._logger = server._logger
+        self.server = server
         self.videoplayer = server.videoplayer
-        self.event = None
-        BaseHTTPRequestHandler.__init__(self, request, client_address, server)
 
-    def log_message(self, f, *args):
-        pass
+    def render_GET(self, request):
+        self._logger.debug("VOD request %s %s", request.getClientAddress(), request.path)
 
-    def do_GET(self):
-        if self.request_version == 'HTTP/1.1':
-            self.protocol_version = 'HTTP/1.1'
-
-        self._logger.debug("VOD request %s %s", self.client_address, self.path)
-        downloadhash, fileindex = self.path.strip('/').split('/')
-        downloadhash = unhexlify(downloadhash)
+        try:
+            downloadhash, fileindex = request.path.strip('/').split('/')
+            downloadhash = unhexlify(downloadhash)
+        except (TypeError, ValueError):
+            return resource.NoResource().render(request)
         download = self.server.session.get_download(downloadhash)
 
         if not download or not fileindex.isdigit() or int(fileindex) > len(download.get_def().get_files()):
-            self.send_error(404, "Not Found")
-            return
+            return resource.NoResource().render(request)
 
         fileindex = int(fileindex)
         filename, length = download.get_def().get_files_as_unicode_with_length()[fileindex]
 
-        requested_range = get_ranges(self.headers.getheader('range'), length)
+        requested_range = get_ranges(request.getHeader('range'), length)
         if requested_range is not None and len(requested_range) != 1:
-            self.send_error(416, "Requested Range Not Satisfiable")
-            return
+            return resource.ErrorPage(416, "Requested Range Not Satisfiable", "").render(request)
 
         has_changed = self.videoplayer.get_vod_fileindex() != fileindex or\
             self.videoplayer.get_vod_download() != download
@@ -93,78 +118,201 @@ class VideoRequestHandler(BaseHTTPRequestHandler):
             download.set_mode(DLMODE_VOD)
             download.restart()
 
-        piecelen = download.get_def().get_piece_length()
-        blocksize = piecelen
-
         if requested_range is not None:
             firstbyte, lastbyte = requested_range[0]
             nbytes2send = lastbyte - firstbyte
-            self.send_response(206)
-            self.send_header('Content-Range', 'bytes %d-%d/%d' % (firstbyte, lastbyte - 1, length))
+            request.setResponseCode(206)
+            request.setHeader('Content-Range', 'bytes %d-%d/%d' % (firstbyte, lastbyte - 1, length))
         else:
             firstbyte = 0
             nbytes2send = length
-            self.send_response(200)
 
         self._logger.debug("requested range %d - %d", firstbyte, firstbyte + nbytes2send)
 
         mimetype = mimetypes.guess_type(filename)[0]
         if mimetype:
-            self.send_header('Content-Type', mimetype)
-        self.send_header('Accept-Ranges', 'bytes')
+            request.setHeader('Content-Type', mimetype)
+        request.setHeader('Accept-Ranges', 'bytes')
+        request.setHeader('Content-Length', str(nbytes2send))
+
+        # the request is done once it has been finished or the client has disconnected
+        request_done = []
+        request.notifyFinish().addBoth(request_done.append)
+
+        # Waiting for the prebuffer and the VOD file to be created blocks, so it is done in a thread
+        vod_filename = self.videoplayer.get_vod_filename(download)
+        waiting = deferToThreadPool(reactor, self.server.threadpool, self.wait_for_stream, download, vod_filename,
+                                    has_changed, request_done)
+        waiting.addCallback(lambda _: self.start_producer(request, request_done, download, vod_filename, firstbyte,
+                                                          nbytes2send))
+        waiting.addErrback(self.on_request_failed, request, request_done)
+        return NOT_DONE_YET
+
+    def start_producer(self, request, request_done, download, vod_filename, firstbyte, nbytes2send):
+        if request_done:
+            return
 
-        if length is not None:
-            self.send_header('Content-Length', nbytes2send)
+        vod_fileindex = download.get_vod_fileindex()
+        if download.get_byte_progress([(vod_fileindex, firstbyte, firstbyte + nbytes2send)]) == 1.0:
+            # The whole range has been downloaded, it's served straight from disk without going through VOD
+            stream = open(vod_filename, 'rb')
+            threadpool = None
         else:
-            self.send_header('Transfer-Encoding', 'chunked')
-
-        if self.request_version == 'HTTP/1.1' and self.headers.get('Connection', '').lower() != 'close':
-            self.send_header('Connection', 'Keep-Alive')
-            self.send_header('Keep-Alive', 'timeout=300, max=1')
-
-        self.end_headers()
-
-        if has_changed:
-            self.wait_for_buffer(download)
-
-        stream, lock = self.videoplayer.get_vod_stream(downloadhash, wait=True)
-
-        with lock:
-            if stream.closed:
+            stream = self.videoplayer.open_vod_stream(download.get_def().get_infohash())
+            if stream is None:
+                self._logger.warning("download of VOD request %s has been removed", request.path)
+                request.loseConnection()
                 return
+            threadpool = self.server.threadpool
 
-            stream.seek(firstbyte)
-            nbyteswritten = 0
-            while True:
-                data = stream.read(blocksize)
+        producer = VideoStreamProducer(request, stream, firstbyte, nbytes2send,
+                                       download.get_def().get_piece_length(), threadpool)
+        self.server.producers.add(producer)
+        producer.start().addBoth(lambda _: self.server.producers.discard(producer))
 
-                if len(data) == 0:
-                    break
-                elif length is not None and nbyteswritten + len(data) > nbytes2send:
-                    endlen = nbytes2send - nbyteswritten
-                    if endlen != 0:
-                        self.wfile.write(data[:endlen])
-                        nbyteswritten += endlen
-                    break
-                else:
-                    self.wfile.write(data)
-                    nbyteswritten += len(data)
+    def on_request_failed(self, failure, request, request_done):
+        self._logger.error("failed to serve VOD request %s: %s", request.path, failure.getErrorMessage())
+        if not request_done:
+            request.loseConnection()
 
-            if nbyteswritten != nbytes2send:
-                self._logger.error("sent wrong amount, wanted %s got %s", nbytes2send, nbyteswritten)
+    def wait_for_stream(self, download, vod_filename, has_changed, request_done):
+        end_time = time.time() + VOD_WAIT_TIMEOUT
+        if has_changed:
+            self.wait_for_buffer(download, vod_filename, request_done, end_time)
 
-            if not requested_range:
-                stream.close()
+        while not os.path.exists(vod_filename):
+            self.check_waiting(download, vod_filename, request_done, end_time)
+            time.sleep(1)
 
-    def wait_for_buffer(self, download):
-        self.event = Event()
+    def wait_for_buffer(self, download, vod_filename, request_done, end_time):
+        event = Event()
 
         def wait_for_buffer(ds):
-            if download.vod_seekpos is None or download != self.videoplayer.get_vod_download()\
+            if event.is_set() or download.vod_seekpos is None or download != self.videoplayer.get_vod_download()\
                     or ds.get_vod_prebuffering_progress() == 1.0:
-                self.event.set()
+                event.set()
                 return 0, False
             return 1.0, False
         download.set_state_callback(wait_for_buffer)
-        self.event.wait()
-        self.event.clear()
+
+        try:
+            while not event.wait(1):
+                self.check_waiting(download, vod_filename, request_done, end_time)
+        finally:
+            # stops the state callback
+            event.set()
+
+    def check_waiting(self, download, vod_filename, request_done, end_time):
+        """
+        Raises an IOError when a request should stop waiting for its stream.
+        """
+        if request_done or self.server.is_stopping:
+            raise IOError("request for %s is done" % vod_filename)
+        if download != self.videoplayer.get_vod_download():
+            raise IOError("%s is no longer being played" % vod_filename)
+        if time.time() > end_time:
+            raise IOError("timed out waiting for %s" % vod_filename)
+
+
+@implementer(IPushProducer)
+class VideoStreamProducer(object):
+    """
+    Writes a byte range of a stream to an HTTP request, as fast as the client consumes it.
+
+    Blocks that are on disk are read in the reactor, only waiting for pieces to be downloaded is done in a thread of the
+    given pool. The transport pauses the producer while its write buffer is full.
+    """
+
+    def __init__(self, request, stream, firstbyte, nbytes2send, blocksize, threadpool=None):
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        self.request = request
+        self.stream = stream
+        self.firstbyte = firstbyte
+        self.nbytes2send = nbytes2send
+        self.nbyteswritten = 0
+        self.blocksize = blocksize
+
+        # the pool to wait for pieces in, None if the whole stream is available
+        self.threadpool = threadpool
+
+        self.paused = False
+        self.reading = False
+        self.stopped = False
+
+    def start(self):
+        """
+        Starts streaming.
+        :return: a Deferred that fires when the request has finished or the connection has been lost.
+        """
+        finished = self.request.notifyFinish()
+        finished.addErrback(lambda _: self.stopProducing())
+
+        self.stream.seek(self.firstbyte)
+        self.request.registerProducer(self, True)
+        self.produce()
+        return finished
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.produce()
+
+    def stopProducing(self):
+        if not self.stopped:
+            self.stopped = True
+            self.stream.close()
+
+    def produce(self):
+        while not self.paused and not self.reading and not self.stopped:
+            nbytes = min(self.blocksize, self.nbytes2send - self.nbyteswritten)
+            if nbytes <= 0:
+                self.finish()
+            elif self.threadpool is None or self.stream.is_available(nbytes):
+                self.write(self.stream.read(nbytes))
+            else:
+                self.reading = True
+                waiting = deferToThreadPool(reactor, self.threadpool, self.stream.wait_available, nbytes,
+                                            VOD_READ_TIMEOUT)
+                waiting.addCallbacks(self.on_wait, self.on_wait_failed, callbackArgs=(nbytes,))
+
+    def on_wait(self, is_available, nbytes):
+        self.reading = False
+        if self.stopped:
+            return
+
+        if is_available:
+            self.write(self.stream.read(nbytes))
+            self.produce()
+        else:
+            self._logger.error("VOD stream stalled, no data for %d seconds", VOD_READ_TIMEOUT)
+            self.finish()
+
+    def on_wait_failed(self, failure):
+        self.reading = False
+        if not self.stopped:
+            self._logger.error("failed to read VOD stream: %s", failure.getErrorMessage())
+            self.finish()
+
+    def write(self, data):
+        if not data:
+            # the stream has been closed or ended early
+            self.finish()
+            return
+
+        self.request.write(data)
+        self.nbyteswritten += len(data)
+
+    def finish(self):
+        if self.nbyteswritten != self.nbytes2send:
+            self._logger.error("sent wrong amount, wanted %s got %s", self.nbytes2send, self.nbyteswritten)
+
+        self.stopProducing()
+        self.request.unregisterProducer()
+        if self.nbyteswritten == self.nbytes2send:
+            self.request.finish()
+        else:
+            # the client can't tell a short response from a complete one unless the connection is closed
+            self.request.loseConnection()
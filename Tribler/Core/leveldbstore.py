@@ -33,8 +33,12 @@
 #
 
 # Code:
-from collections import MutableMapping
+from collections import MutableMapping, OrderedDict
+from hashlib import sha1
 from itertools import chain
+from struct import unpack_from
+from threading import Lock, RLock
+import logging
 import os
 
 
@@ -59,74 +63,215 @@ except ImportError:
 
 from twisted.internet import reactor
 from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
 
 from Tribler.dispersy.taskmanager import TaskManager
 
 
-WRITEBACK_PERIOD = 120
+# pending values are written back after at most this many seconds
+WRITEBACK_PERIOD = 30
+# or as soon as this many values, or values of this many bytes in total, are pending
+WRITEBACK_MAX_ENTRIES = 1000
+WRITEBACK_MAX_BYTES = 16 * 1024 * 1024
+# the values are written in batches of at most this many values and about this many bytes
+WRITEBACK_BATCH_ENTRIES = 100
+WRITEBACK_BATCH_BYTES = 4 * 1024 * 1024
+
+# the number of recently read values, and their size in bytes, that are kept in memory
+READ_CACHE_MAX_ENTRIES = 256
+READ_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# the key filter starts with room for this many keys and doubles in size whenever it gets full
+KEY_FILTER_MIN_CAPACITY = 1 << 16
+# bits per key in the key filter, with 5 hash functions this gives about 1% false positives
+KEY_FILTER_BITS_PER_KEY = 10
 
 # TODO(emilon): Make sure the caching makes an actual difference in IO and kill
 # it if it doesn't as it complicates the code.
 
 
+class KeyFilter(object):
+    """
+    Bloom filter over the keys of a store, telling for sure when a key is not in the store.
+
+    Keys can't be removed from a Bloom filter, a deleted key just shows up as one of the false positives until the
+    filter is rebuilt.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.num_keys = 0
+        self._num_bits = capacity * KEY_FILTER_BITS_PER_KEY
+        self._bits = bytearray((self._num_bits + 7) // 8)
+
+    def _get_bit_indices(self, key):
+        return [index % self._num_bits for index in unpack_from('<5I', sha1(key).digest())]
+
+    def add(self, key):
+        for index in self._get_bit_indices(key):
+            self._bits[index >> 3] |= 1 << (index & 7)
+        self.num_keys += 1
+
+    def is_full(self):
+        return self.num_keys > self.capacity
+
+    def __contains__(self, key):
+        return all(self._bits[index >> 3] & (1 << (index & 7)) for index in self._get_bit_indices(key))
+
+
 class LevelDbStore(MutableMapping, TaskManager):
+    """
+    Key-value store on top of LevelDB.
+
+    Values that are put are kept in memory and written back in the background, at the latest after writeback_period
+    seconds, or as soon as more than max_pending_entries values or max_pending_bytes bytes are waiting. Values are
+    written in a thread in batches of at most WRITEBACK_BATCH_BYTES bytes. Recently read values are kept in an LRU
+    cache.
+    """
     _reactor = reactor
     _leveldb = LevelDB
     _writebatch = get_write_batch
+    _defer_to_thread = staticmethod(deferToThread)
 
-    def __init__(self, store_dir):
+    def __init__(self, store_dir, writeback_period=WRITEBACK_PERIOD, max_pending_entries=WRITEBACK_MAX_ENTRIES,
+                 max_pending_bytes=WRITEBACK_MAX_BYTES, read_cache_entries=READ_CACHE_MAX_ENTRIES,
+                 read_cache_bytes=READ_CACHE_MAX_BYTES):
         super(LevelDbStore, self).__init__()
+        self._logger = logging.getLogger(self.__class__.__name__)
 
         self._store_dir = store_dir
+        self._max_pending_entries = max_pending_entries
+        self._max_pending_bytes = max_pending_bytes
+        self._read_cache_entries = read_cache_entries
+        self._read_cache_bytes = read_cache_bytes
+
+        # values that have been put, and values that are being written to LevelDB by a thread
         self._pending_torrents = {}
+        self._pending_bytes = 0
+        self._flushing_torrents = {}
+        # held while writing to LevelDB, so a delete or close can't interleave with a write in a thread
+        self._write_lock = RLock()
+
+        # {key: value} of the values read from LevelDB, least recently used first
+        self._read_cache = OrderedDict()
+        self._read_cache_size = 0
+        self._read_cache_lock = Lock()
+
         # This is done to work around LevelDB's inability to deal with non-ascii
         # paths on windows.
         self._db = self._leveldb(os.path.relpath(store_dir, os.getcwdu()))
 
-        self._writeback_lc = self.register_task("flush cache ", LoopingCall(self.flush))
+        # membership checks are answered by the key filter and a key-only lookup, so they never read values from disk
+        self._key_filter = None
+        self._build_key_filter(KEY_FILTER_MIN_CAPACITY)
+
+        self._writeback_lc = self.register_task("flush cache ", LoopingCall(self._flush_pending))
         self._writeback_lc.clock = self._reactor
-        self._writeback_lc.start(WRITEBACK_PERIOD)
+        self._writeback_lc.start(writeback_period)
+
+    def _build_key_filter(self, min_capacity):
+        keys = list(self._db.RangeIter(include_value=False))
+        pending_keys = set(chain(self._pending_torrents, self._flushing_torrents))
+        self._key_filter = KeyFilter(max(min_capacity, 2 * (len(keys) + len(pending_keys))))
+        for key in chain(keys, pending_keys):
+            self._key_filter.add(key)
 
     def __getitem__(self, key):
         try:
             return self._pending_torrents[key]
         except KeyError:
-            return self._db.Get(key)
+            pass
+        try:
+            return self._flushing_torrents[key]
+        except KeyError:
+            pass
+
+        with self._read_cache_lock:
+            value = self._read_cache.pop(key, None)
+            if value is not None:
+                self._read_cache[key] = value
+                return value
+
+        if key not in self._key_filter:
+            raise KeyError(key)
+        value = self._db.Get(key)
+        self._cache_read(key, value)
+        return value
+
+    def _cache_read(self, key, value):
+        if len(value) > self._read_cache_bytes:
+            return
+
+        with self._read_cache_lock:
+            old_value = self._read_cache.pop(key, None)
+            if old_value is not None:
+                self._read_cache_size -= len(old_value)
+            self._read_cache[key] = value
+            self._read_cache_size += len(value)
+
+            while len(self._read_cache) > self._read_cache_entries or self._read_cache_size > self._read_cache_bytes:
+                _, old_value = self._read_cache.popitem(last=False)
+                self._read_cache_size -= len(old_value)
+
+    def _uncache_read(self, key):
+        with self._read_cache_lock:
+            old_value = self._read_cache.pop(key, None)
+            if old_value is not None:
+                self._read_cache_size -= len(old_value)
 
     def __setitem__(self, key, value):
+        self._uncache_read(key)
+
+        old_value = self._pending_torrents.get(key)
         self._pending_torrents[key] = value
+        self._pending_bytes += len(value) - (len(old_value) if old_value is not None else 0)
         # self._db.Put(key, value)
 
+        if old_value is None:
+            self._key_filter.add(key)
+            if self._key_filter.is_full():
+                self._build_key_filter(2 * self._key_filter.capacity)
+
+        if len(self._pending_torrents) >= self._max_pending_entries or self._pending_bytes >= self._max_pending_bytes:
+            self._flush_pending()
+
     def __delitem__(self, key):
         if key in self._pending_torrents:
-            self._pending_torrents.pop(key)
-        self._db.Delete(key)
+            self._pending_bytes -= len(self._pending_torrents.pop(key))
+        self._flushing_torrents.pop(key, None)
+        self._uncache_read(key)
+        with self._write_lock:
+            self._db.Delete(key)
 
     def __iter__(self):
         for k in self._pending_torrents.iterkeys():
             yield k
-        for k, _ in self._db.RangeIter():
+        for k in self._flushing_torrents.iterkeys():
+            if k not in self._pending_torrents:
+                yield k
+        for k in self._db.RangeIter(include_value=False):
             yield k
 
     def __contains__(self, key):
-        if key in self._pending_torrents:
-            return True
-        try:
-            self.__getitem__(key)
+        if key in self._pending_torrents or key in self._flushing_torrents:
             return True
-        except KeyError:
-            pass
+        if key not in self._key_filter:
+            return False
 
+        # the key filter can give false positives, seek to the key without reading its value
+        for k in self._db.RangeIter(key_from=key, include_value=False):
+            return k == key
         return False
 
     def __len__(self):
-        return len(self._pending_torrents) + len(list(self.keys()))
+        keys = self.keys()
+        return len(keys) + len(set(chain(self._pending_torrents, self._flushing_torrents)).difference(keys))
 
     def keys(self):
-        return [k for k, _ in self._db.RangeIter()]
+        return list(self._db.RangeIter(include_value=False))
 
     def iteritems(self):
-        return chain(self._pending_torrents, self._db.RangeIter())
+        return chain(self._pending_torrents, self._flushing_torrents, self._db.RangeIter())
 
     def put(self, k, v):
         self.__setitem__(k, v)
@@ -139,19 +284,80 @@ class LevelDbStore(MutableMapping, TaskManager):
         else:
             return self._db.RangeIter(key_from=start, key_to=end)
 
+    def _get_write_batches(self, items):
+        """
+        Splits the (key, value) items into write batches of at most WRITEBACK_BATCH_BYTES bytes.
+        """
+        write_batch = None
+        batch_bytes = 0
+        for k, v in items:
+            if write_batch is None:
+                write_batch = self._writebatch(self._db)
+                batch_bytes = 0
+            write_batch.Put(k, v)
+            batch_bytes += len(k) + len(v)
+            if batch_bytes >= WRITEBACK_BATCH_BYTES:
+                yield write_batch
+                write_batch = None
+        if write_batch is not None:
+            yield write_batch
+
+    def _flush_pending(self):
+        """
+        Hands the pending values to a thread that writes them to LevelDB.
+        """
+        if not self._pending_torrents:
+            return
+
+        items = self._pending_torrents.items()
+        self._flushing_torrents.update(items)
+        self._pending_torrents.clear()
+        self._pending_bytes = 0
+
+        def on_written(_):
+            for k, v in items:
+                if self._flushing_torrents.get(k) is v:
+                    del self._flushing_torrents[k]
+
+        def on_failure(failure):
+            # the values stay in memory and are written again by flush
+            self._logger.error("failed to write %d values to %s: %s", len(items), self._store_dir,
+                               failure.getErrorMessage())
+
+        writing = self._defer_to_thread(self._write_items, items)
+        writing.addCallbacks(on_written, on_failure)
+        return writing
+
+    def _write_items(self, items):
+        while items:
+            batch_items, items = items[:WRITEBACK_BATCH_ENTRIES], items[WRITEBACK_BATCH_ENTRIES:]
+            with self._write_lock:
+                if self._db is None:
+                    return
+                # values that have been deleted or written by flush in the meantime are skipped
+                batch_items = [(k, v) for k, v in batch_items if self._flushing_torrents.get(k) is v]
+                for write_batch in self._get_write_batches(batch_items):
+                    self._db.Write(write_batch)
+
     def flush(self):
-        if self._pending_torrents:
-            write_batch = self._writebatch(self._db)
-            for k, v in self._pending_torrents.iteritems():
-                write_batch.Put(k, v)
+        """
+        Writes all values that haven't been written yet to LevelDB, in the calling thread.
+        """
+        with self._write_lock:
+            items = dict(self._flushing_torrents)
+            items.update(self._pending_torrents)
+            for write_batch in self._get_write_batches(items.iteritems()):
+                self._db.Write(write_batch)
+
+            self._flushing_torrents.clear()
             self._pending_torrents.clear()
-            return self._db.Write(write_batch)
+            self._pending_bytes = 0
 
     def close(self):
         self.cancel_all_pending_tasks()
-        self.flush()
-        self._db = None
-
+        with self._write_lock:
+            self.flush()
+            self._db = None
 
 #
 # torrentstore.py ends here
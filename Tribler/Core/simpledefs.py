@@ -40,6 +40,7 @@ For details see API.py
 """
 
 STATEDIR_DLPSTATE_DIR = u'dlcheckpoints'
+STATEDIR_DLSTATE_STORE_DIR = u'dlstates'
 STATEDIR_PEERICON_DIR = u'icons'
 STATEDIR_TORRENT_STORE_DIR = u'collected_torrents'
 STATEDIR_METADATA_STORE_DIR = u'collected_metadata'
@@ -10,7 +10,7 @@ import sys
 import wx
 
 from Tribler.Category.Category import Category
-from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin, forceAndReturnDBThread
+from Tribler.Core.CacheDB.sqlitecachedb import bin2str, forceAndReturnDBThread
 from Tribler.Core.TorrentDef import TorrentDef, TorrentDefNoMetainfo
 from Tribler.Core.Video.utils import videoextdefaults
 from Tribler.Core.simpledefs import (NTFY_TORRENTS, NTFY_MYPREFERENCES, NTFY_VOTECAST, NTFY_CHANNELCAST,
@@ -1320,7 +1320,7 @@ class ChannelManager(object):
         sql = "SELECT distinct infohash, PL.dispersy_id FROM PlaylistTorrents PL, ChannelTorrents CT, Torrent T WHERE PL.channeltorrent_id = CT.id AND CT.torrent_id = T.torrent_id AND playlist_id = ?"
         records = self.channelcast_db._db.fetchall(sql, (playlist_id,))
         for infohash, dispersy_id in records:
-            infohash = str2bin(infohash)
+            infohash = str(infohash)
             if infohash in to_be_created:
                 to_be_created.remove(infohash)
             else:
@@ -26,3 +26,11 @@ class TriblerCategoryTestFamilyFilter(AbstractServer):
         self.assertFalse(family_filter.isXXXTerm("term0es"))
         self.assertTrue(family_filter.isXXXTerm("term1s"))
         self.assertFalse(family_filter.isXXXTerm("term0n"))
+
+    def test_found_xxx_term(self):
+        family_filter = XXXFilter(self.CATEGORY_TEST_DATA_DIR)
+        self.assertTrue(family_filter.foundXXXTerm("someterm3file"))
+        self.assertFalse(family_filter.foundXXXTerm("term1"))
+
+        family_filter.xxx_searchterms_regexp = family_filter.compileSearchTerms(set())
+        self.assertFalse(family_filter.foundXXXTerm("someterm3file"))
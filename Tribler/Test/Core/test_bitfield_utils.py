@@ -0,0 +1,37 @@
+from Tribler.Core.Utilities.bitfield_utils import count_pieces, get_pieces_progress, merge_bitfields, to_bitfield
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class TriblerCoreTestBitfieldUtils(TriblerCoreTest):
+
+    def test_to_bitfield(self):
+        self.assertEqual(to_bitfield([True, False, True]), bytearray('\x01\x00\x01'))
+        bitfield = bytearray('\x01')
+        self.assertIs(to_bitfield(bitfield), bitfield)
+
+    def test_count_pieces(self):
+        bitfield = to_bitfield([True, False, True, True])
+        self.assertEqual(count_pieces(bitfield), 3)
+        self.assertEqual(count_pieces(bitfield, 1, 3), 1)
+        self.assertEqual(count_pieces(bytearray()), 0)
+
+    def test_get_pieces_progress(self):
+        bitfield = to_bitfield([True, True, False, True])
+        self.assertEqual(get_pieces_progress(bitfield, []), 1.0)
+        self.assertEqual(get_pieces_progress(bitfield, [0, 1, 2, 3]), 0.75)
+        self.assertEqual(get_pieces_progress(bitfield, [0, 1, 2, 3], consecutive=True), 0.5)
+        self.assertEqual(get_pieces_progress(bitfield, [3]), 1.0)
+
+        # pieces beyond the end of the bitfield are missing
+        self.assertEqual(get_pieces_progress(bitfield, [3, 4]), 0.5)
+
+    def test_merge_bitfields(self):
+        self.assertEqual(merge_bitfields([]), ())
+        self.assertEqual(merge_bitfields([[True, False, True], [True, True, False]]), (2, 1, 1))
+
+        # shorter bitfields don't have the last pieces
+        self.assertEqual(merge_bitfields([[True, True, True], [True]]), (2, 1, 1))
+
+    def test_merge_bitfields_wide_counters(self):
+        bitfields = [[True, False]] * 300 + [[False, True]] * 2
+        self.assertEqual(merge_bitfields(bitfields), (300, 2))
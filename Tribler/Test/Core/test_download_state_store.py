@@ -0,0 +1,84 @@
+import os
+from binascii import hexlify
+
+from libtorrent import bdecode, bencode
+
+from Tribler.Core.Modules.download_state_store import DownloadStateStore
+from Tribler.Core.Utilities.configparser import CallbackConfigParser
+from Tribler.Core.leveldbstore import LevelDbStore
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+INFOHASH = 'a' * 20
+METAINFO = {'info': {'name': 'test', 'length': 1, 'piece length': 16384, 'pieces': 'b' * 20}}
+
+
+class TriblerCoreTestDownloadStateStore(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TriblerCoreTestDownloadStateStore, self).setUp(annotate=annotate)
+        self.torrent_store = LevelDbStore(os.path.join(self.session_base_dir, u"torrents"))
+        self.store = DownloadStateStore(os.path.join(self.session_base_dir, u"dlstates"), self.torrent_store)
+
+    def tearDown(self, annotate=True):
+        self.store.close()
+        self.torrent_store.close()
+        super(TriblerCoreTestDownloadStateStore, self).tearDown(annotate=annotate)
+
+    def create_pstate(self, progress=0.5):
+        pstate = CallbackConfigParser()
+        pstate.add_section('state')
+        pstate.set('state', 'metainfo', METAINFO)
+        pstate.set('state', 'dlstate', {'status': 3, 'progress': progress, 'swarmcache': None})
+        return pstate
+
+    def test_put_and_get(self):
+        self.assertTrue(self.store.put(INFOHASH, self.create_pstate()))
+        self.assertEqual(self.store.get_infohashes(), [INFOHASH])
+
+        pstate = self.store.get(INFOHASH)
+        self.assertEqual(pstate.get('state', 'metainfo'), METAINFO)
+        self.assertEqual(pstate.get('state', 'dlstate')['progress'], 0.5)
+        self.assertIsNone(self.store.get('b' * 20))
+
+    def test_metainfo_in_torrent_store(self):
+        self.store.put(INFOHASH, self.create_pstate())
+        self.assertEqual(bdecode(self.torrent_store[hexlify(INFOHASH)]), METAINFO)
+        self.assertFalse(INFOHASH in self.torrent_store)
+
+    def test_metainfo_collected_before(self):
+        self.torrent_store[hexlify(INFOHASH)] = bencode(METAINFO)
+        self.torrent_store.flush()
+        self.store.put(INFOHASH, self.create_pstate())
+        self.store.close()
+
+        # the state is read back by a new store, which has to find the metainfo that was collected before
+        self.store = DownloadStateStore(os.path.join(self.session_base_dir, u"dlstates"), self.torrent_store)
+        self.assertEqual(self.store.get(INFOHASH).get('state', 'metainfo'), METAINFO)
+        self.assertEqual(self.torrent_store.keys(), [hexlify(INFOHASH)])
+
+    def test_metainfo_collected_with_other_trackers(self):
+        self.torrent_store[hexlify(INFOHASH)] = bencode(dict(METAINFO, announce='http://tracker/announce'))
+        self.torrent_store.flush()
+        metainfo = dict(METAINFO, announce='http://private/announce?passkey=abc')
+        pstate = self.create_pstate()
+        pstate.set('state', 'metainfo', metainfo)
+        self.store.put(INFOHASH, pstate)
+        self.store.close()
+
+        # the download keeps its own trackers, the collected torrent is left alone
+        self.store = DownloadStateStore(os.path.join(self.session_base_dir, u"dlstates"), self.torrent_store)
+        self.assertEqual(self.store.get(INFOHASH).get('state', 'metainfo'), metainfo)
+        self.assertEqual(bdecode(self.torrent_store[hexlify(INFOHASH)])['announce'], 'http://tracker/announce')
+
+    def test_unchanged_state_not_written(self):
+        self.assertTrue(self.store.put(INFOHASH, self.create_pstate()))
+        self.assertFalse(self.store.put(INFOHASH, self.create_pstate()))
+        self.assertTrue(self.store.put(INFOHASH, self.create_pstate(progress=0.75)))
+
+    def test_remove(self):
+        self.store.put(INFOHASH, self.create_pstate())
+        self.store.flush()
+        self.store.remove(INFOHASH)
+        self.assertEqual(self.store.get_infohashes(), [])
+        self.assertTrue(self.store.put(INFOHASH, self.create_pstate()))
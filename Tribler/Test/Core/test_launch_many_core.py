@@ -0,0 +1,166 @@
+import os
+from binascii import hexlify
+from threading import RLock
+
+from Tribler.Core.APIImplementation.LaunchManyCore import (TriblerLaunchMany, RESUME_BATCH_INTERVAL,
+                                                           RESUME_BATCH_SIZE)
+from Tribler.Core.Modules.download_state_store import DownloadStateStore
+from Tribler.Core.Utilities.configparser import CallbackConfigParser
+from Tribler.Core.leveldbstore import LevelDbStore
+from Tribler.Core.simpledefs import DLSTATUS_DOWNLOADING, DLSTATUS_STOPPED, NTFY_INSERT, NTFY_STARTUP_TICK
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+METAINFO = {'info': {'name': 'test', 'length': 1, 'piece length': 16384, 'pieces': 'b' * 20}}
+
+
+class MockNotifier(object):
+
+    def __init__(self):
+        self.notifications = []
+
+    def notify(self, subject, change_type, obj_id, *args):
+        self.notifications.append((subject, change_type, obj_id) + args)
+
+
+class MockSession(object):
+
+    def __init__(self, pstate_dir):
+        self.pstate_dir = pstate_dir
+        self.notifier = MockNotifier()
+
+    def get_downloads_pstate_dir(self):
+        return self.pstate_dir
+
+
+class MockThreadPool(object):
+
+    def __init__(self):
+        self.tasks = []
+
+    def add_task(self, task, delay=0):
+        self.tasks.append((task, delay))
+
+
+class MockLaunchMany(TriblerLaunchMany):
+    """
+    Records the downloads that are resumed instead of starting them.
+    """
+
+    def __init__(self):
+        super(MockLaunchMany, self).__init__()
+        self.resumed = []
+
+    def resume_download(self, infohash, initialdlstatus=None, initialdlstatus_dict={}, setupDelay=0, pstate=None):
+        self.resumed.append((infohash, setupDelay, pstate))
+
+
+class FailingDownloadStateStore(DownloadStateStore):
+
+    def flush(self):
+        raise IOError("disk full")
+
+
+class TriblerCoreTestLaunchManyCore(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TriblerCoreTestLaunchManyCore, self).setUp(annotate=annotate)
+        self.pstate_dir = os.path.join(self.session_base_dir, u"dlcheckpoints")
+        os.makedirs(self.pstate_dir)
+
+        self.lm = MockLaunchMany()
+        self.lm.session = MockSession(self.pstate_dir)
+        self.lm.sesslock = RLock()
+        self.lm.threadpool = MockThreadPool()
+        self.lm.initComplete = True
+        self.lm.torrent_store = LevelDbStore(os.path.join(self.session_base_dir, u"torrents"))
+        self.lm.download_state_store = DownloadStateStore(os.path.join(self.session_base_dir, u"dlstates"),
+                                                          self.lm.torrent_store)
+
+    def tearDown(self, annotate=True):
+        self.lm.download_state_store.close()
+        self.lm.torrent_store.close()
+        super(TriblerCoreTestLaunchManyCore, self).tearDown(annotate=annotate)
+
+    def create_pstate(self, progress=0.5, status=DLSTATUS_DOWNLOADING):
+        pstate = CallbackConfigParser()
+        pstate.add_section('state')
+        pstate.set('state', 'metainfo', METAINFO)
+        pstate.set('state', 'dlstate', {'status': status, 'progress': progress, 'swarmcache': None})
+        return pstate
+
+    def write_pstate_file(self, infohash, progress=0.5):
+        pstate = self.create_pstate(progress)
+        filename = os.path.join(self.pstate_dir, hexlify(infohash) + '.state')
+        with open(filename, 'wb') as pstate_file:
+            pstate.write(pstate_file)
+        return filename
+
+    def write_unreadable_pstate_file(self, infohash):
+        filename = os.path.join(self.pstate_dir, hexlify(infohash) + '.state')
+        with open(filename, 'wb') as pstate_file:
+            pstate_file.write("not a checkpoint")
+        return filename
+
+    def test_import_pstate_files(self):
+        filename = self.write_pstate_file('a' * 20)
+        unreadable_filename = self.write_unreadable_pstate_file('b' * 20)
+
+        self.assertEqual(self.lm._import_pstate_files(), ['b' * 20])
+        self.assertEqual(self.lm.download_state_store.get_infohashes(), ['a' * 20])
+        self.assertEqual(self.lm.download_state_store.get('a' * 20).get('state', 'dlstate')['progress'], 0.5)
+
+        # only the imported checkpoint is removed
+        self.assertFalse(os.path.exists(filename))
+        self.assertTrue(os.path.exists(unreadable_filename))
+
+    def test_import_pstate_files_flush_failed(self):
+        self.lm.download_state_store.close()
+        self.lm.download_state_store = FailingDownloadStateStore(os.path.join(self.session_base_dir, u"dlstates"),
+                                                                 self.lm.torrent_store)
+        filename = self.write_pstate_file('a' * 20)
+
+        self.assertRaises(IOError, self.lm._import_pstate_files)
+        self.assertTrue(os.path.exists(filename))
+
+    def test_load_checkpoint_active_first(self):
+        self.lm.download_state_store.put('a' * 20, self.create_pstate(status=DLSTATUS_STOPPED))
+        self.lm.download_state_store.put('b' * 20, self.create_pstate())
+        self.lm.download_state_store.put('c' * 20, self.create_pstate())
+        self.lm.download_state_store.put('d' * 20, self.create_pstate())
+
+        self.lm.load_checkpoint(initialdlstatus_dict={'d' * 20: DLSTATUS_STOPPED})
+        resumed = [infohash for infohash, _, _ in self.lm.resumed]
+        self.assertEqual(sorted(resumed[:2]), ['b' * 20, 'c' * 20])
+        self.assertEqual(sorted(resumed[2:]), ['a' * 20, 'd' * 20])
+        # the checkpoints that were read in the pool are handed over, so they aren't read again
+        self.assertTrue(all(pstate is not None for _, _, pstate in self.lm.resumed))
+
+    def test_load_checkpoint_batches(self):
+        num_checkpoints = 2 * RESUME_BATCH_SIZE + 1
+        infohashes = ['%020d' % i for i in xrange(num_checkpoints)]
+        for infohash in infohashes:
+            self.lm.download_state_store.put(infohash, self.create_pstate())
+
+        self.lm.load_checkpoint()
+        self.assertEqual(sorted(infohash for infohash, _, _ in self.lm.resumed), infohashes)
+        self.assertEqual([delay for _, delay, _ in self.lm.resumed],
+                         [0] * RESUME_BATCH_SIZE + [RESUME_BATCH_INTERVAL] * RESUME_BATCH_SIZE +
+                         [2 * RESUME_BATCH_INTERVAL])
+
+        # a startup tick is sent when every batch starts
+        self.assertEqual([delay for _, delay in self.lm.threadpool.tasks],
+                         [0, RESUME_BATCH_INTERVAL, 2 * RESUME_BATCH_INTERVAL])
+        for task, _ in self.lm.threadpool.tasks:
+            task()
+        self.assertEqual(self.lm.session.notifier.notifications,
+                         [(NTFY_STARTUP_TICK, NTFY_INSERT, None, 'Resuming downloads (%d/%d)' % (num_resumed,
+                                                                                                num_checkpoints))
+                          for num_resumed in (RESUME_BATCH_SIZE, 2 * RESUME_BATCH_SIZE, num_checkpoints)])
+
+    def test_load_checkpoint_imports_pstate_files(self):
+        self.write_pstate_file('a' * 20)
+        self.lm.load_checkpoint()
+        self.assertEqual([infohash for infohash, _, _ in self.lm.resumed], ['a' * 20])
+        self.assertEqual(self.lm.session.notifier.notifications, [])
+        self.assertEqual(len(self.lm.threadpool.tasks), 1)
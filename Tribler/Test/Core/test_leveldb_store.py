@@ -38,9 +38,11 @@ from nose.tools import raises
 from shutil import rmtree
 from tempfile import mkdtemp
 
+from twisted.internet.defer import maybeDeferred
 from twisted.internet.task import Clock
 
-from Tribler.Core.leveldbstore import LevelDbStore, WRITEBACK_PERIOD, get_write_batch_plyvel, get_write_batch_leveldb
+from Tribler.Core.leveldbstore import (LevelDbStore, KeyFilter, WRITEBACK_PERIOD, WRITEBACK_MAX_ENTRIES,
+                                       get_write_batch_plyvel, get_write_batch_leveldb)
 from Tribler.Test.test_as_server import BaseTestCase
 
 
@@ -50,6 +52,8 @@ V = "bar"
 
 class ClockedAbstractLevelDBStore(LevelDbStore):
     _reactor = Clock()
+    # write back in the calling thread, so the tests don't have to wait for it
+    _defer_to_thread = staticmethod(maybeDeferred)
 
 
 class ClockedLevelDBStore(ClockedAbstractLevelDBStore):
@@ -110,6 +114,60 @@ class AbstractTestLevelDBStore(BaseTestCase):
         self.store._reactor.advance(WRITEBACK_PERIOD)
         self.assertEqual(0, len(self.store._pending_torrents))
 
+    def test_cacheIsFlushedWhenFull(self):
+        for i in xrange(WRITEBACK_MAX_ENTRIES - 1):
+            self.store[str(i)] = V
+        self.assertEqual(WRITEBACK_MAX_ENTRIES - 1, len(self.store._pending_torrents))
+        self.store[K] = V
+        self.assertEqual(0, len(self.store._pending_torrents))
+        self.assertEqual(0, len(self.store._flushing_torrents))
+        self.assertEqual(V, self.store._db.Get(K))
+
+    def test_cacheIsFlushedWhenLarge(self):
+        self.store._max_pending_bytes = 2 * len(V)
+        self.store[K] = V
+        self.assertEqual(1, len(self.store._pending_torrents))
+        self.store[K + K] = V
+        self.assertEqual(0, len(self.store._pending_torrents))
+        self.assertEqual(V, self.store._db.Get(K + K))
+
+    def test_deleteIsNotUndoneByWriteback(self):
+        self.store[K] = V
+        self.store._flushing_torrents.update(self.store._pending_torrents)
+        items = self.store._pending_torrents.items()
+        self.store._pending_torrents.clear()
+        del self.store[K]
+        # a write back that was already running when the value was deleted
+        self.store._write_items(items)
+        self.assertFalse(K in self.store)
+        self.assertEqual(None, self.store.get(K))
+
+    def test_readCache(self):
+        self.store[K] = V
+        self.store.flush()
+        self.assertEqual(V, self.store[K])
+        self.assertEqual(V, self.store._read_cache[K])
+
+        self.store[K] = K
+        self.assertFalse(K in self.store._read_cache)
+        self.assertEqual(K, self.store[K])
+
+        self.store.flush()
+        self.assertEqual(K, self.store[K])
+        del self.store[K]
+        self.assertFalse(K in self.store._read_cache)
+        self.assertEqual(None, self.store.get(K))
+
+    def test_readCacheIsBounded(self):
+        self.store._read_cache_entries = 2
+        for i in xrange(3):
+            self.store[str(i)] = V
+        self.store.flush()
+        for i in xrange(3):
+            self.assertEqual(V, self.store[str(i)])
+        self.assertEqual(["1", "2"], self.store._read_cache.keys())
+        self.assertEqual(2 * len(V), self.store._read_cache_size)
+
     def test_len(self):
         self.assertEqual(0, len(self.store))
         self.store[K] = V
@@ -123,6 +181,27 @@ class AbstractTestLevelDBStore(BaseTestCase):
         self.store[K] = V
         self.assertTrue(K in self.store)
 
+    def test_containsAfterReopen(self):
+        self.store[K] = V
+        store_dir = self.store._store_dir
+        self.store.close()
+        self.openStore(store_dir)
+        self.assertTrue(K in self.store)
+        self.assertFalse(V in self.store)
+
+    def test_containsAfterDelete(self):
+        self.store[K] = V
+        self.store.flush()
+        del self.store[K]
+        self.assertFalse(K in self.store)
+
+    def test_keyFilterGrows(self):
+        capacity = self.store._key_filter.capacity
+        for i in xrange(capacity + 1):
+            self.store[str(i)] = V
+        self.assertGreater(self.store._key_filter.capacity, capacity)
+        self.assertTrue(all(str(i) in self.store for i in xrange(capacity + 1)))
+
     @raises(StopIteration)
     def test_iter_empty(self):
         iteritems = self.store.iteritems()
@@ -139,6 +218,16 @@ class AbstractTestLevelDBStore(BaseTestCase):
             self.assertTrue(key)
 
 
+class TestKeyFilter(BaseTestCase):
+
+    def test_contains(self):
+        key_filter = KeyFilter(100)
+        key_filter.add(K)
+        self.assertTrue(K in key_filter)
+        self.assertFalse(V in key_filter)
+        self.assertFalse(key_filter.is_full())
+
+
 class TestLevelDBStore(AbstractTestLevelDBStore):
     __test__ = True
     _storetype = ClockedLevelDBStore
@@ -0,0 +1,162 @@
+import threading
+import time
+
+import libtorrent as lt
+
+from Tribler.Core.Libtorrent.LibtorrentDownloadImpl import LibtorrentDownloadImpl
+from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr, ALERT_WAIT_TIMEOUT
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class MockTriblerSession(object):
+
+    notifier = None
+
+
+class MockHandle(object):
+
+    def __init__(self, infohash):
+        self.infohash = infohash
+
+    def is_valid(self):
+        return True
+
+    def info_hash(self):
+        return self.infohash
+
+
+class MockAlert(object):
+
+    def __init__(self, handle=None, category=0):
+        self.handle = handle
+        self._category = category
+
+    def category(self):
+        return self._category
+
+
+class MockFinishedAlert(MockAlert):
+    pass
+
+
+class MockAlertDownload(object):
+
+    def __init__(self):
+        self.alerts = []
+
+    def process_alert(self, alert):
+        # handling an alert takes a while, the alert pump shouldn't pop new alerts in the meantime
+        time.sleep(0.01)
+        self.alerts.append(alert)
+
+
+class MockAlertSession(object):
+    """
+    A libtorrent session that hands out the given batches of alerts and checks that a batch has been handled before
+    the next one is popped.
+    """
+
+    def __init__(self, batches, download):
+        self.batches = list(batches)
+        self.download = download
+        self.popped = 0
+        self.popped_early = False
+        self.has_alerts = threading.Event()
+        if self.batches:
+            self.has_alerts.set()
+
+    def wait_for_alert(self, timeout):
+        return True if self.has_alerts.wait(timeout / 1000.0) else None
+
+    def pop_alerts(self):
+        if len(self.download.alerts) != self.popped:
+            self.popped_early = True
+        alerts = self.batches.pop(0)
+        if not self.batches:
+            self.has_alerts.clear()
+        self.popped += len(alerts)
+        return alerts
+
+
+class MockDownloadImpl(LibtorrentDownloadImpl):
+    """
+    A download that only has what process_alert needs.
+    """
+
+    def __init__(self):
+        self.dllock = threading.RLock()
+        self.handle = MockHandle('a' * 40)
+        self.handled = []
+        self.num_stats_updates = 0
+        self.alert_handlers = {MockFinishedAlert: self.handled.append}
+
+    def update_lt_stats(self):
+        self.num_stats_updates += 1
+
+
+class TriblerCoreTestLibtorrentAlerts(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TriblerCoreTestLibtorrentAlerts, self).setUp(annotate=annotate)
+        self.ltmgr = LibtorrentMgr(MockTriblerSession())
+        self.download = MockAlertDownload()
+        self.ltmgr.torrents['a' * 40] = (self.download, None)
+
+    def tearDown(self, annotate=True):
+        self.ltmgr.alert_pump_stop.set()
+        for alert_pump in self.ltmgr.alert_pump_threads:
+            alert_pump.join()
+        super(TriblerCoreTestLibtorrentAlerts, self).tearDown(annotate=annotate)
+
+    def wait_for(self, condition, timeout=5):
+        end_time = time.time() + timeout
+        while not condition() and time.time() < end_time:
+            time.sleep(0.01)
+        return condition()
+
+    def test_alert_pump(self):
+        handle = MockHandle('a' * 40)
+        batches = [[MockAlert(handle) for _ in xrange(3)] for _ in xrange(5)]
+        ltsession = MockAlertSession(batches, self.download)
+        self.ltmgr._start_alert_pump(ltsession, 0)
+
+        self.assertTrue(self.wait_for(lambda: len(self.download.alerts) == 15))
+        self.assertEqual(self.download.alerts, sum(batches, []))
+        # every batch was handled by the reactor before the next one was popped
+        self.assertFalse(ltsession.popped_early)
+
+    def test_alert_pump_stop(self):
+        ltsession = MockAlertSession([], self.download)
+        self.ltmgr._start_alert_pump(ltsession, 0)
+        alert_pump = self.ltmgr.alert_pump_threads[0]
+        self.assertTrue(alert_pump.is_alive())
+
+        self.ltmgr.alert_pump_stop.set()
+        alert_pump.join(ALERT_WAIT_TIMEOUT / 1000.0 * 2)
+        self.assertFalse(alert_pump.is_alive())
+
+    def test_alerts_after_stop(self):
+        processed = threading.Event()
+        self.ltmgr.alert_pump_stop.set()
+        self.ltmgr._process_alerts([MockAlert(MockHandle('a' * 40))], processed)
+        self.assertTrue(processed.is_set())
+        self.assertEqual(self.download.alerts, [])
+
+    def test_alert_for_unknown_torrent(self):
+        processed = threading.Event()
+        self.ltmgr._process_alerts([MockAlert(MockHandle('b' * 40)), MockAlert()], processed)
+        self.assertTrue(processed.is_set())
+        self.assertEqual(self.download.alerts, [])
+
+    def test_dispatch_by_alert_class(self):
+        download = MockDownloadImpl()
+        finished_alert = MockFinishedAlert()
+        download.process_alert(finished_alert)
+        self.assertEqual(download.handled, [finished_alert])
+        self.assertEqual(download.num_stats_updates, 0)
+
+        # alerts without a handler update the statistics, except for the frequent progress alerts
+        download.process_alert(MockAlert())
+        self.assertEqual(download.num_stats_updates, 1)
+        download.process_alert(MockAlert(category=lt.alert.category_t.progress_notification))
+        self.assertEqual(download.num_stats_updates, 1)
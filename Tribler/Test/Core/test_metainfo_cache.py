@@ -0,0 +1,66 @@
+from copy import deepcopy
+
+from Tribler.Core.Libtorrent.metainfo_cache import MetainfoCache
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+def create_metainfo(name):
+    return {'info': {'name': name, 'pieces': 'a' * 20}, 'seeders': 1, 'leechers': 2}
+
+
+class TriblerCoreTestMetainfoCache(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TriblerCoreTestMetainfoCache, self).setUp(annotate=annotate)
+        self.cache = MetainfoCache(max_entries=2, max_bytes=100)
+
+    def test_get_shares_info(self):
+        self.assertEqual(self.cache.put('a', create_metainfo('a'), 10), create_metainfo('a'))
+
+        first = self.cache.get('a')
+        second = self.cache.get('a')
+        self.assertEqual(first, create_metainfo('a'))
+        self.assertIs(first['info'], second['info'])
+
+        # the top-level dictionary is a copy, the info dictionary is read-only
+        del first['seeders']
+        self.assertIn('seeders', self.cache.get('a'))
+        self.assertRaises(TypeError, first['info'].__setitem__, 'name', 'b')
+        self.assertRaises(TypeError, first['info'].pop, 'name')
+
+        copied_info = deepcopy(first['info'])
+        copied_info['name'] = 'b'
+        self.assertEqual(copied_info['name'], 'b')
+
+    def test_lru_eviction(self):
+        self.cache.put('a', create_metainfo('a'), 10)
+        self.cache.put('b', create_metainfo('b'), 10)
+        self.cache.get('a')
+        self.cache.put('c', create_metainfo('c'), 10)
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertIn('c', self.cache)
+
+    def test_size_eviction(self):
+        self.cache.put('a', create_metainfo('a'), 60)
+        self.cache.put('b', create_metainfo('b'), 60)
+        self.assertNotIn('a', self.cache)
+        self.assertEqual(self.cache.get_statistics()['bytes'], 60)
+
+        # too large to be cached at all
+        self.cache.put('c', create_metainfo('c'), 200)
+        self.assertNotIn('c', self.cache)
+
+    def test_expired(self):
+        self.cache.max_age = -1
+        self.cache.put('a', create_metainfo('a'), 10)
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('b', create_metainfo('b'), 10)
+        self.cache.remove_expired()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_statistics(self):
+        self.cache.put('a', create_metainfo('a'), 10)
+        self.cache.get('a')
+        self.cache.get('b')
+        self.assertEqual(self.cache.get_statistics(), {'entries': 1, 'bytes': 10, 'hits': 1, 'misses': 1})
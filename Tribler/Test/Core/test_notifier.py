@@ -1,6 +1,10 @@
 import time
+from threading import Event
+
+from twisted.internet import reactor
+
 from Tribler.Core.CacheDB.Notifier import Notifier
-from Tribler.Core.simpledefs import NTFY_TORRENTS, NTFY_STARTED, NTFY_FINISHED
+from Tribler.Core.simpledefs import NTFY_TORRENTS, NTFY_STARTED, NTFY_FINISHED, NTFY_CHANNELCAST
 from Tribler.Test.Core.base_test import TriblerCoreTest
 
 
@@ -8,10 +12,16 @@ class TriblerCoreTestNotifier(TriblerCoreTest):
 
     called_callback = False
 
+    def setUp(self, annotate=True):
+        super(TriblerCoreTestNotifier, self).setUp(annotate=annotate)
+        self.events = []
+
     def callback_func(self, subject, changetype, objectID, *args):
+        self.events.append(objectID)
         self.called_callback = True
 
     def cache_callback_func(self, events):
+        self.events.extend(events)
         self.called_callback = True
 
     def wait_for_callback(self):
@@ -41,6 +51,56 @@ class TriblerCoreTestNotifier(TriblerCoreTest):
         notifier.remove_observers()
         self.assertTrue(len(notifier.observers) == 0)
 
+    def test_notifier_remove_observer(self):
+        notifier = Notifier(False)
+        notifier.add_observer(self.callback_func, NTFY_TORRENTS, [NTFY_STARTED, NTFY_FINISHED])
+        notifier.add_observer(self.cache_callback_func, NTFY_TORRENTS, [NTFY_STARTED])
+        notifier.remove_observer(self.callback_func)
+        self.assertEqual(notifier.observers.keys(), [(NTFY_TORRENTS, NTFY_STARTED)])
+
+    def test_notifier_id(self):
+        notifier = Notifier(False)
+        notifier.add_observer(self.callback_func, NTFY_TORRENTS, [NTFY_STARTED], id='a')
+        notifier.notify(NTFY_TORRENTS, NTFY_STARTED, 'b')
+        notifier.notify(NTFY_TORRENTS, NTFY_STARTED, 'a')
+        self.assertEqual(self.events, ['a'])
+
+    def test_notifier_threadpool_many(self):
+        notifier = Notifier(True)
+        notifier.add_observer(self.callback_func, NTFY_TORRENTS, [NTFY_STARTED])
+        for i in xrange(100):
+            notifier.notify(NTFY_TORRENTS, NTFY_STARTED, i)
+        self.wait_for_callback()
+        counter = 0
+        while len(self.events) < 100 and counter < 100:
+            time.sleep(0.01)
+            counter += 1
+        self.assertEqual(sorted(self.events), range(100))
+
+    def test_notifier_threadpool_slow_observer(self):
+        notifier = Notifier(True)
+        blocked = Event()
+        notifier.add_observer(lambda *args: blocked.wait(5), NTFY_TORRENTS, [NTFY_STARTED])
+        notifier.add_observer(self.callback_func, NTFY_CHANNELCAST, [NTFY_STARTED])
+
+        # the reactor runs a single pool thread, which can't run the observers side by side
+        reactor.suggestThreadPoolSize(2)
+        try:
+            # both events are queued before the reactor hands any of them to the pool
+            reactor_held, queued = Event(), Event()
+            reactor.callFromThread(lambda: (reactor_held.set(), queued.wait(1)))
+            reactor_held.wait(1)
+            notifier.notify(NTFY_TORRENTS, NTFY_STARTED, None)
+            notifier.notify(NTFY_CHANNELCAST, NTFY_STARTED, 'a')
+            queued.set()
+
+            # the blocked observer does not hold up the events of other subjects
+            self.wait_for_callback()
+            self.assertEqual(self.events, ['a'])
+        finally:
+            blocked.set()
+            reactor.suggestThreadPoolSize(1)
+
     def test_notifier_no_observers(self):
         notifier = Notifier(False)
         notifier.notify(NTFY_TORRENTS, NTFY_STARTED, None)
@@ -64,6 +124,7 @@ class TriblerCoreTestNotifier(TriblerCoreTest):
         notifier.notify(NTFY_TORRENTS, NTFY_STARTED, None)
         notifier.notify(NTFY_TORRENTS, NTFY_STARTED, None)
         self.wait_for_callback()
+        self.assertEqual(len(self.events), 2)
 
     def test_notifier_cache_remove_observers(self):
         notifier = Notifier(False)
@@ -0,0 +1,37 @@
+from Tribler.Core.TorrentChecker.scrape_queue import ScrapeQueue
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class TriblerCoreTestScrapeQueue(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TriblerCoreTestScrapeQueue, self).setUp(annotate=annotate)
+        self.queue = ScrapeQueue()
+
+    def test_pop_by_next_check(self):
+        self.queue.push(u"tracker", 'c' * 20, 300)
+        self.queue.push(u"tracker", 'a' * 20, 100)
+        self.queue.push(u"tracker", 'b' * 20, 200)
+        self.queue.push(u"other", 'd' * 20, 50)
+
+        self.assertEqual(self.queue.pop(u"tracker", 2), ['a' * 20, 'b' * 20])
+        self.assertEqual(self.queue.get_queue_size(u"tracker"), 1)
+        self.assertEqual(self.queue.pop(u"tracker", 2), ['c' * 20])
+        self.assertEqual(self.queue.pop(u"tracker", 2), [])
+        self.assertEqual(self.queue.get_tracker_urls(), [u"other"])
+
+    def test_popular_and_gui_first(self):
+        self.queue.push(u"tracker", 'a' * 20, 1000)
+        self.queue.push(u"tracker", 'b' * 20, 2000, num_seeders=1000)
+        self.queue.push(u"tracker", 'c' * 20, 100000, is_gui_request=True)
+        self.assertEqual(self.queue.pop(u"tracker", 3), ['c' * 20, 'b' * 20, 'a' * 20])
+
+    def test_requeue(self):
+        self.assertTrue(self.queue.push(u"tracker", 'a' * 20, 100))
+        self.assertTrue(self.queue.push(u"tracker", 'b' * 20, 200))
+        self.assertFalse(self.queue.push(u"tracker", 'a' * 20, 300))
+        self.assertTrue(self.queue.push(u"tracker", 'b' * 20, 200, is_gui_request=True))
+        self.assertTrue(self.queue.is_queued(u"tracker", 'b' * 20))
+        self.assertEqual(self.queue.get_queue_size(u"tracker"), 2)
+        self.assertEqual(self.queue.pop(u"tracker", 10), ['b' * 20, 'a' * 20])
+        self.assertFalse(self.queue.is_queued(u"tracker", 'b' * 20))
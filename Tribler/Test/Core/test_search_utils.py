@@ -1,4 +1,7 @@
-from Tribler.Core.Utilities.search_utils import split_into_keywords, filter_keywords
+from struct import pack
+
+from Tribler.Core.Utilities.search_utils import (split_into_keywords, filter_keywords, fts_search_rank, get_trigrams,
+                                                  get_term_trigram_rows, levenshtein_distance)
 from Tribler.Test.Core.base_test import TriblerCoreTest
 
 
@@ -17,3 +20,28 @@ class TriblerCoreTestSearchUtils(TriblerCoreTest):
         result = filter_keywords(["to", "be", "or", "not", "to", "be"])
         self.assertIsInstance(result, list)
         self.assertEqual(len(result), 4)
+
+    def test_fts_search_rank(self):
+        # one phrase, three columns: (hits this row, hits all rows, docs with hits) per column
+        matchinfo = pack('IIIIIIIIIII', 1, 3, 2, 10, 5, 0, 0, 0, 1, 1, 1)
+        no_seeders = fts_search_rank(matchinfo, 100, 0, None, None)
+        self.assertGreater(no_seeders, 0)
+        self.assertGreater(fts_search_rank(matchinfo, 100, 10, None, None), no_seeders)
+        self.assertGreater(fts_search_rank(matchinfo, 100, 0, 5, 1), no_seeders)
+        self.assertEqual(fts_search_rank(matchinfo, 100, 0, 1, 5), no_seeders)
+
+        no_match = pack('IIIIIIIIIII', 1, 3, 0, 10, 5, 0, 0, 0, 0, 1, 1)
+        self.assertEqual(fts_search_rank(no_match, 100, 10, None, None), 0)
+
+    def test_get_trigrams(self):
+        self.assertEqual(get_trigrams(u"abcd"), {u"  a", u" ab", u"abc", u"bcd", u"cd "})
+
+    def test_get_term_trigram_rows(self):
+        rows = get_term_trigram_rows([u"abc", u"abcd"])
+        self.assertEqual(len(rows), 5)
+        self.assertTrue(all(term == u"abcd" for _, term in rows))
+
+    def test_levenshtein_distance(self):
+        self.assertEqual(levenshtein_distance(u"content", u"content"), 0)
+        self.assertEqual(levenshtein_distance(u"contnet", u"content"), 2)
+        self.assertEqual(levenshtein_distance(u"cont", u"content"), 3)
@@ -1,10 +1,12 @@
 import os
 
+import apsw
 from apsw import SQLError, CantOpenError
 
 import shutil
 from nose.tools import raises
 
+from Tribler.Core.Utilities.twisted_thread import deferred
 from Tribler.Test.Core.base_test import TriblerCoreTest
 from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, DB_SCRIPT_NAME, CorruptedDatabaseError
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
@@ -190,3 +192,89 @@ class TestSqliteCacheDB(TriblerCoreTest):
         self.sqlite_test.update('person', "lastname == '4'", firstname=654, lastname=44)
         one = self.sqlite_test.fetchone("select firstname from person where lastname == 44")
         self.assertEqual(one, 654)
+
+    @deferred(timeout=5)
+    def test_fetchall_async_in_memory(self):
+        self.test_insertmany()
+
+        def check_results(results):
+            self.assertEqual(len(results), 100)
+
+        return self.sqlite_test.fetchall_async(u"SELECT * FROM person").addCallback(check_results)
+
+    @deferred(timeout=5)
+    def test_fetch_async_read_pool(self):
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"))
+        sqlite_test_2.initialize()
+        sqlite_test_2.execute(u"CREATE TABLE person(lastname, firstname);")
+        sqlite_test_2.insert('person', lastname='a', firstname='b')
+
+        def check_fetchall(results):
+            self.assertEqual(results, [('a', 'b')])
+            return sqlite_test_2.fetchone_async(u"SELECT lastname FROM person WHERE firstname == ?", ('b',))
+
+        def check_fetchone(result):
+            self.assertEqual(result, 'a')
+            sqlite_test_2.close()
+
+        deferred_read = sqlite_test_2.fetchall_async(u"SELECT * FROM person")
+        deferred_read.addCallback(check_fetchall)
+        deferred_read.addCallback(check_fetchone)
+        return deferred_read
+
+    @blocking_call_on_reactor_thread
+    def test_queue_write(self):
+        self.test_create_db()
+
+        self.sqlite_test.queue_write(u"INSERT INTO person VALUES (?, ?)", ('a', 'b'))
+        self.sqlite_test.queue_writemany(u"INSERT INTO person VALUES (?, ?)", [('c', 'd'), ('e', 'f')])
+        self.assertTrue(self.sqlite_test.is_pending_task_active(u"commit_write_queue"))
+        self.assertEqual(self.sqlite_test.size('person'), 3)
+        self.assertFalse(self.sqlite_test.is_pending_task_active(u"commit_write_queue"))
+
+    @blocking_call_on_reactor_thread
+    def test_queue_write_failed_row(self):
+        self.sqlite_test.execute(u"CREATE TABLE person(lastname UNIQUE, firstname);")
+        self.sqlite_test.execute(u"INSERT INTO person VALUES ('c', 'x')")
+
+        failed = []
+        self.sqlite_test.queue_writemany(u"INSERT INTO person VALUES (?, ?)", [('a', 'b'), ('c', 'd'), ('e', 'f')],
+                                         on_error=lambda e, args: failed.append(args))
+        self.assertEqual(self.sqlite_test.size('person'), 3)
+        self.assertEqual(failed, [('c', 'd')])
+        self.assertEqual(self.sqlite_test.fetchone(u"SELECT firstname FROM person WHERE lastname = 'c'"), 'x')
+
+    @blocking_call_on_reactor_thread
+    def test_queue_write_failed_row_no_callback(self):
+        self.sqlite_test.execute(u"CREATE TABLE person(lastname UNIQUE, firstname);")
+        self.sqlite_test.queue_writemany(u"INSERT INTO person VALUES (?, ?)", [('a', 'b'), ('a', 'c'), ('e', 'f')])
+        self.assertEqual(self.sqlite_test.fetchall(u"SELECT * FROM person ORDER BY lastname"),
+                         [('a', 'b'), ('e', 'f')])
+
+    @blocking_call_on_reactor_thread
+    def test_queue_write_size_flush(self):
+        db_path = os.path.join(self.session_base_dir, "test_db.db")
+        sqlite_test_2 = SQLiteCacheDB(db_path, write_queue_size=10)
+        sqlite_test_2.initialize()
+        sqlite_test_2.execute(u"CREATE TABLE person(lastname, firstname);")
+        sqlite_test_2.initial_begin()
+
+        def committed_rows():
+            connection = apsw.Connection(db_path)
+            count = connection.cursor().execute(u"SELECT count(*) FROM person").fetchone()[0]
+            connection.close()
+            return count
+
+        sqlite_test_2.queue_writemany(u"INSERT INTO person VALUES (?, ?)", [(str(i), str(i)) for i in range(10)])
+        self.assertEqual(committed_rows(), 10)
+        self.assertFalse(sqlite_test_2.is_pending_task_active(u"commit_write_queue"))
+
+        sqlite_test_2.queue_write(u"INSERT INTO person VALUES (?, ?)", ('a', 'b'))
+        self.assertEqual(committed_rows(), 10)
+        self.assertTrue(sqlite_test_2.is_pending_task_active(u"commit_write_queue"))
+        sqlite_test_2.close()
+
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"))
+        sqlite_test_2.initialize()
+        self.assertEqual(sqlite_test_2.size('person'), 11)
+        sqlite_test_2.close()
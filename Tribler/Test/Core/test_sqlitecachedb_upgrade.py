@@ -64,3 +64,21 @@ class TestSqliteCacheDB(AbstractServer):
         db_migrator = DBUpgrader(self.session, self.sqlitedb, torrent_store=MockTorrentStore())
         db_migrator.start_migrate()
         self.assertEqual(self.sqlitedb.version, LATEST_DB_VERSION)
+
+    def test_upgrade_28_to_29(self):
+        self.sqlitedb = SQLiteCacheDB(os.path.join(self.session_base_dir, 'tribler.sdb'))
+        self.sqlitedb.initialize()
+        self.sqlitedb.execute(u"CREATE TABLE MyInfo (entry PRIMARY KEY, value text)")
+        self.sqlitedb.execute(u"INSERT INTO MyInfo (entry, value) VALUES ('version', 28)")
+        self.sqlitedb.execute(u"CREATE VIRTUAL TABLE FullTextIndex USING fts3(swarmname, filenames, fileextensions)")
+        self.sqlitedb.executemany(u"INSERT INTO FullTextIndex (swarmname) VALUES (?)",
+                                  [(u"sintel open movie",), (u"big buck bunny movie",), (None,)])
+        self.sqlitedb.initial_begin()
+
+        db_migrator = DBUpgrader(self.session, self.sqlitedb, torrent_store=MockTorrentStore())
+        db_migrator._upgrade_28_to_29()
+        self.assertEqual(self.sqlitedb.version, 29)
+        self.assertEqual(self.sqlitedb.fetchone(u"SELECT frequency FROM SearchTerm WHERE term = 'movie'"), 2)
+        self.assertEqual(self.sqlitedb.fetchone(u"SELECT frequency FROM SearchTerm WHERE term = 'sintel'"), 1)
+        self.assertEqual(self.sqlitedb.fetchall(u"SELECT term FROM SearchTermTrigram WHERE trigram = 'nte'"),
+                         [(u"sintel",)])
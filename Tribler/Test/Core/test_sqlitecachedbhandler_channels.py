@@ -24,12 +24,12 @@ class TestChannelDBHandler(AbstractDB):
         self.assertIsNone(self.cdb.get_torrent_metadata(200))
 
     def test_get_dispersy_cid_from_channel_id(self):
-        self.assertEqual(self.cdb.getDispersyCIDFromChannelId(1), "1")
-        self.assertEqual(self.cdb.getDispersyCIDFromChannelId(3), "3")
+        self.assertEqual(str(self.cdb.getDispersyCIDFromChannelId(1)), "1")
+        self.assertEqual(str(self.cdb.getDispersyCIDFromChannelId(3)), "3")
 
     def test_get_channel_id_from_dispersy_cid(self):
-        self.assertEqual(self.cdb.getChannelIdFromDispersyCID(1), 1)
-        self.assertEqual(self.cdb.getChannelIdFromDispersyCID(3), 3)
+        self.assertEqual(self.cdb.getChannelIdFromDispersyCID(buffer('1')), 1)
+        self.assertEqual(self.cdb.getChannelIdFromDispersyCID(buffer('3')), 3)
 
     def test_get_count_max_from_channel_id(self):
         self.assertEqual(self.cdb.getCountMaxFromChannelId(1), (2, 1457809687))
@@ -49,7 +49,8 @@ class TestChannelDBHandler(AbstractDB):
         self.assertEqual(len(channels), 3)
 
     def test_get_channels_by_cid(self):
-        self.assertEqual(len(self.cdb.getChannelsByCID(["3"])), 0)
+        self.assertEqual(len(self.cdb.getChannelsByCID(["3"])), 1)
+        self.assertEqual(len(self.cdb.getChannelsByCID(["9"])), 0)
 
     def test_get_all_channels(self):
         self.assertEqual(len(self.cdb.getAllChannels()), 8)
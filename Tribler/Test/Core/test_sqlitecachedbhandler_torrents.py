@@ -2,7 +2,7 @@ from binascii import unhexlify
 import os
 from shutil import copy as copyfile
 from Tribler.Category.Category import Category
-from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler, MyPreferenceDBHandler
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler, MyPreferenceDBHandler, REMOTE_SEARCH_MAX_ROWS
 from Tribler.Core.CacheDB.sqlitecachedb import str2bin
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Test.Core.test_sqlitecachedbhandler import AbstractDB
@@ -205,6 +205,21 @@ class TestTorrentDBHandler(AbstractDB):
         new_infohash = unhexlify('50865489ac16e2f34ea0cd3043cfd970cc24ec09')
         self.assertEqual(self.tdb.addOrGetTorrentID(new_infohash), 4849)
 
+    @blocking_call_on_reactor_thread
+    def test_infohash_stored_as_blob(self):
+        infohash = unhexlify('50865489ac16e2f34ea0cd3043cfd970cc24ec09')
+        torrent_id = self.tdb.addOrGetTorrentID(infohash)
+        stored = self.tdb._db.fetchone(u"SELECT infohash FROM Torrent WHERE torrent_id = ?", (torrent_id,))
+        self.assertEqual(str(stored), infohash)
+        self.assertEqual(self.tdb.getInfohash(torrent_id), infohash)
+
+    @blocking_call_on_reactor_thread
+    def test_on_search_response(self):
+        infohash = unhexlify('50865489ac16e2f34ea0cd3043cfd970cc24ec09')
+        self.tdb.on_search_response([(infohash, u"remote torrent", 42, 1, [u"other"], 1234)])
+        torrent_id = self.tdb.getTorrentID(infohash)
+        self.assertEqual(self.tdb.getOne('name', torrent_id=torrent_id), u"remote torrent")
+
     @blocking_call_on_reactor_thread
     def test_add_get_torrent_ids_return(self):
         infohash = str2bin('AA8cTG7ZuPsyblbRE7CyxsrKUCg=')
@@ -229,14 +244,67 @@ class TestTorrentDBHandler(AbstractDB):
         res = self.tdb.getNumberCollectedTorrents()
         self.assertEqual(old_res, res)
 
+    @blocking_call_on_reactor_thread
+    def test_remote_search_ranks_best_seeded_matches(self):
+        keys = ['T.torrent_id', 'infohash', 'num_seeders']
+        sql, args = self.tdb._get_search_names_sql([u"content"], False, keys)
+        results = self.tdb._db.fetchall(sql, args)
+        self.assertEqual(len(results), REMOTE_SEARCH_MAX_ROWS)
+        self.assertEqual([result[2] for result in results], sorted([result[2] for result in results], reverse=True))
+
+        # every torrent in the test database matches, an old torrent with many seeders still makes it to the top
+        oldest_id = self.tdb._db.fetchone(u"SELECT min(rowid) FROM FullTextIndex WHERE FullTextIndex MATCH "
+                                          u"'filenames:content' "
+                                          u"AND rowid IN (SELECT torrent_id FROM CollectedTorrent WHERE secret IS NOT 1) "
+                                          u"AND rowid NOT IN (SELECT torrent_id FROM _ChannelTorrents)")
+        self.tdb._db.execute(u"UPDATE Torrent SET num_seeders = 1000000000 WHERE torrent_id = ?", (oldest_id,))
+        results = self.tdb._db.fetchall(sql, args)
+        self.assertEqual(results[0][0], oldest_id)
+
+        # only the best seeded matches are ranked
+        args = args[:2] + (1,) + args[3:]
+        self.assertEqual([result[0] for result in self.tdb._db.fetchall(sql, args)], [oldest_id])
+
     @blocking_call_on_reactor_thread
     def test_get_search_suggestions(self):
         self.assertEqual(self.tdb.getSearchSuggestion(["content", "cont"]), ["Content 1"])
 
+    @blocking_call_on_reactor_thread
+    def test_get_search_suggestions_misspelled(self):
+        self.assertEqual(self.tdb.getSearchSuggestion(["contnet"]), ["Content 1"])
+        self.assertEqual(self.tdb.getSearchSuggestion(["xyzw"]), [])
+
+    @blocking_call_on_reactor_thread
+    def test_index_torrent_search_terms(self):
+        self.tdb._indexTorrent(123456, u"Sintel open movie", [])
+        self.assertEqual(self.tdb._db.fetchone(u"SELECT frequency FROM SearchTerm WHERE term = 'sintel'"), 1)
+        self.assertEqual(self.tdb.getSearchSuggestion(["sintle"]), [u"sintel open movie"])
+
+        self.tdb._indexTorrent(123456, u"Big Buck Bunny movie", [])
+        self.assertEqual(self.tdb._db.fetchone(u"SELECT frequency FROM SearchTerm WHERE term = 'sintel'"), 0)
+        self.assertEqual(self.tdb._db.fetchone(u"SELECT frequency FROM SearchTerm WHERE term = 'movie'"), 1)
+
     @blocking_call_on_reactor_thread
     def test_get_autocomplete_terms(self):
         self.assertEqual(len(self.tdb.getAutoCompleteTerms("content", 100)), 0)
 
+    @blocking_call_on_reactor_thread
+    def test_get_autocomplete_terms_by_frequency(self):
+        self.tdb._indexTorrent(123456, u"Sintel open movie", [])
+        self.tdb._indexTorrent(123457, u"Sintel director commentary", [])
+        self.tdb._indexTorrent(123458, u"Sinterklaas", [])
+        self.assertEqual(self.tdb.getAutoCompleteTerms(u"Sint", 1), [u"sintel"])
+        self.assertEqual(self.tdb.getAutoCompleteTerms(u"sint", 100), [u"sintel", u"sinterklaas"])
+        self.assertEqual(self.tdb.getAutoCompleteTerms(u"sintel", 100), [])
+        self.assertEqual(self.tdb.getAutoCompleteTerms(u"si", 100), [])
+
+    @blocking_call_on_reactor_thread
+    def test_get_autocomplete_terms_last_code_point(self):
+        self.tdb._db.executemany(u"INSERT INTO SearchTerm (term, frequency) VALUES (?, 1)",
+                                 [(u"abc\uffff",), (u"abc\uffffd",), (u"abd",)])
+        self.assertEqual(self.tdb.getAutoCompleteTerms(u"abc\uffff", 100), [u"abc\uffffd"])
+        self.assertEqual(sorted(self.tdb.getAutoCompleteTerms(u"abc", 100)), [u"abc\uffff", u"abc\uffffd"])
+
     @blocking_call_on_reactor_thread
     def test_get_recently_randomly_collected_torrents(self):
         self.assertEqual(len(self.tdb.getRecentlyCollectedTorrents(limit=10)), 10)
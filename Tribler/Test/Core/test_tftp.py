@@ -0,0 +1,129 @@
+import os
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+
+from Tribler.Core.TFTP.handler import TftpHandler
+from Tribler.Core.TFTP.packet import OPCODE_DATA, OPCODE_RRQ, decode_packet, encode_packet
+from Tribler.Core.Utilities.twisted_thread import deferred
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class FakeEndpoint(object):
+    """
+    Delivers packets between the TFTP handlers of this test, optionally dropping some of them.
+    """
+
+    def __init__(self, address, network):
+        self.address = address
+        self.network = network
+        self.callback = None
+
+    def listen_to(self, prefix, callback):
+        self.callback = callback
+        self.network[self.address] = self
+
+    def stop_listen_to(self, prefix):
+        del self.network[self.address]
+
+    def send_packet(self, candidate, packet, prefix=None):
+        if self.network.get('drop', lambda packet: False)(decode_packet(packet)):
+            return
+        target = self.network.get(candidate.sock_addr)
+        if target:
+            reactor.callLater(0, target.callback, self.address, packet)
+
+
+class FakeSession(object):
+
+    def __init__(self, address, torrent_store):
+        self.lm = self
+        self.dispersy = self
+        self.wan_address = address
+        self.torrent_store = torrent_store
+
+
+class TriblerCoreTestTftp(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TriblerCoreTestTftp, self).setUp(annotate=annotate)
+        self.file_data = os.urandom(20000)
+        self.network = {}
+        self.handlers = []
+
+    def tearDown(self, annotate=True):
+        for handler in self.handlers:
+            handler.shutdown()
+        super(TriblerCoreTestTftp, self).tearDown(annotate=annotate)
+
+    def create_handler(self, address, **kwargs):
+        handler = TftpHandler(FakeSession(address, {'a' * 40: self.file_data}), FakeEndpoint(address, self.network),
+                              "fffffffd".decode('hex'), block_size=1024, **kwargs)
+        handler.initialize()
+        self.handlers.append(handler)
+        return handler
+
+    def download(self, client):
+        download_deferred = Deferred()
+        client.download_file(u"a" * 40 + u".torrent", "127.0.0.2", 2,
+                             success_callback=lambda address, name, data, info: download_deferred.callback(data),
+                             failure_callback=lambda address, name, msg, info: download_deferred.errback(
+                                 AssertionError(msg)))
+        download_deferred.addCallback(self.assertEqual, self.file_data)
+        return download_deferred
+
+    def test_packet_windowsize_option(self):
+        packet = {'opcode': OPCODE_RRQ, 'session_id': 1, 'file_name': "test",
+                  'options': {'blksize': 1024, 'timeout': 2, 'windowsize': 16}}
+        self.assertEqual(decode_packet(encode_packet(packet)), packet)
+
+    @deferred(timeout=5)
+    def test_download_lock_step(self):
+        self.create_handler(("127.0.0.2", 2))
+        return self.download(self.create_handler(("127.0.0.1", 1)))
+
+    @deferred(timeout=5)
+    def test_download_too_large(self):
+        download_deferred = Deferred()
+        self.create_handler(("127.0.0.2", 2))
+        client = self.create_handler(("127.0.0.1", 1), max_file_size=10000)
+        client.download_file(u"a" * 40 + u".torrent", "127.0.0.2", 2,
+                             success_callback=lambda address, name, data, info: download_deferred.errback(
+                                 AssertionError("a file larger than max_file_size was accepted")),
+                             failure_callback=lambda address, name, msg, info: download_deferred.callback(msg))
+        return download_deferred
+
+    @deferred(timeout=5)
+    def test_download_windowed(self):
+        sent_data_blocks = []
+
+        def check_window(_):
+            # 20 blocks fit in two windows
+            self.assertEqual(len(sent_data_blocks), 20)
+
+        self.network['drop'] = lambda packet: sent_data_blocks.append(1) if packet['opcode'] == OPCODE_DATA else False
+        self.create_handler(("127.0.0.2", 2), window_size=16)
+        return self.download(self.create_handler(("127.0.0.1", 1), window_size=16)).addCallback(check_window)
+
+    @deferred(timeout=5)
+    def test_download_windowed_packet_loss(self):
+        dropped_blocks = set()
+
+        def drop_once(packet):
+            # lose block 5 and 18 the first time they are sent
+            if packet['opcode'] == OPCODE_DATA and packet['block_number'] in (5, 18) \
+                    and packet['block_number'] not in dropped_blocks:
+                dropped_blocks.add(packet['block_number'])
+                return True
+            return False
+
+        self.network['drop'] = drop_once
+        self.create_handler(("127.0.0.2", 2), window_size=8)
+        return self.download(self.create_handler(("127.0.0.1", 1), window_size=8))
+
+    @deferred(timeout=10)
+    def test_download_windowed_fallback(self):
+        # a peer that predates windowsize drops the request
+        self.network['drop'] = lambda packet: packet['opcode'] == OPCODE_RRQ and 'windowsize' in packet['options']
+        self.create_handler(("127.0.0.2", 2), window_size=16)
+        return self.download(self.create_handler(("127.0.0.1", 1), window_size=16))
@@ -0,0 +1,93 @@
+from Tribler.Core.TorrentChecker.torrent_checker import TorrentChecker
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class MockObject(object):
+    pass
+
+
+class MockTorrentDb(object):
+
+    def __init__(self, torrents):
+        self.torrents = torrents
+        self.updates = []
+
+    def getNumberCollectedTorrents(self):
+        return len(self.torrents)
+
+    def getTorrentsOnTracker(self, tracker_url, current_time, limit):
+        return self.torrents[:limit]
+
+    def getTorrent(self, infohash, keys, include_mypref=True):
+        return {u'torrent_id': 1, u'tracker_check_retries': 0}
+
+    def updateTorrentCheckResult(self, torrent_id, infohash, seeders, leechers, last_check, next_check, status,
+                                 retries):
+        self.updates.append((infohash, seeders, leechers, status))
+
+
+class MockTrackerManager(object):
+
+    def get_next_tracker_for_auto_check(self):
+        return u'DHT', None
+
+
+class MockLtMgr(object):
+    """
+    Starts DHT lookups that never report back.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def get_metainfo(self, infohash, callback, timeout=30, timeout_callback=None, notify=True):
+        self.requests.append(infohash)
+        return True
+
+
+class TriblerCoreTestTorrentChecker(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TriblerCoreTestTorrentChecker, self).setUp(annotate=annotate)
+        session = MockObject()
+        session.lm = MockObject()
+        session.lm.ltmgr = MockLtMgr()
+        session.lm.tracker_manager = MockTrackerManager()
+        self.ltmgr = session.lm.ltmgr
+
+        self.checker = TorrentChecker(session)
+        self.checker._torrent_db = MockTorrentDb([(1, 'a' * 20, 0, 0, 0)])
+        # the torrents are selected by the test
+        self.checker._reschedule_torrent_select = lambda: None
+
+    def test_pending_torrent_not_selected(self):
+        self.checker._task_select_torrents()
+        self.assertEqual(self.ltmgr.requests, ['a' * 20])
+
+        # the torrent is still being checked, so it isn't queued again
+        self.checker._task_select_torrents()
+        self.assertEqual(self.ltmgr.requests, ['a' * 20])
+        self.assertEqual(self.checker._scrape_queue.get_queue_size(u'DHT'), 0)
+
+    def test_expire_pending_response(self):
+        self.checker._task_select_torrents()
+        self.checker._pending_response_dict['a' * 20][u'expiry_time'] = 0
+
+        # the lost response is given up on, the torrent is stored as checked and checked again
+        self.checker._task_select_torrents()
+        self.assertEqual(self.checker._torrent_db.updates, [('a' * 20, 0, 0, u'unknown')])
+        self.assertEqual(self.ltmgr.requests, ['a' * 20, 'a' * 20])
+        self.assertIn('a' * 20, self.checker._pending_response_dict)
+
+    def test_expire_pending_response_with_result(self):
+        self.checker._task_select_torrents()
+        self.checker._on_result_from_session('a' * 20, 5, 6)
+        self.checker._pending_response_dict['a' * 20][u'expiry_time'] = 0
+
+        self.checker._expire_pending_responses(1)
+        self.assertEqual(self.checker._torrent_db.updates, [('a' * 20, 5, 6, u'good')])
+        self.assertFalse(self.checker._pending_response_dict)
+
+        # a response that arrives after all is ignored
+        self.checker._on_session_finished(self.checker._session_dict[u'DHT'][0], ['a' * 20], True)
+        self.assertEqual(len(self.checker._torrent_db.updates), 1)
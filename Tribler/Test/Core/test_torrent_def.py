@@ -3,6 +3,7 @@
 
 import logging
 import os
+from hashlib import sha1
 from nose.tools import raises
 
 from libtorrent import bdecode
@@ -93,6 +94,23 @@ class TestTorrentDef(BaseTestCase):
 
         self.assert_(exps == reals)
 
+    def test_add_content_dir_pieces(self):
+        """ Pieces that span multiple files are hashed over the content of all of them """
+        t = TorrentDef()
+        dn = os.path.join(TESTS_API_DIR, "contentdir")
+        t.add_content(dn, "dirintorrent")
+        t.set_tracker(TRACKER)
+        t.set_piece_length(2 ** 16)
+        t.finalize()
+
+        content = ''
+        for file in t.get_metainfo()['info']['files']:
+            with open(os.path.join(dn, *file['path']), 'rb') as f:
+                content += f.read()
+
+        pieces = ''.join(sha1(content[offset:offset + 2 ** 16]).digest() for offset in xrange(0, len(content), 2 ** 16))
+        self.assertEqual(t.get_pieces(), pieces)
+
     def test_add_content_dir_and_file(self):
         """ Add a single dir and single file to a TorrentDef """
         t = TorrentDef()
@@ -329,6 +347,23 @@ class TestTorrentDef(BaseTestCase):
         torrent = TorrentDef.load_from_dict(metainfo)
         self.assertTrue(isValidTorrentFile(torrent.get_metainfo()))
 
+    def test_load_from_memory_infohash(self):
+        with open(os.path.join(TESTS_DATA_DIR, "bak_multiple.torrent"), "rb") as torrent_file:
+            data = torrent_file.read()
+
+        torrent = TorrentDef.load_from_memory(data)
+        self.assertEqual(torrent.get_infohash(), TorrentDef.load_from_dict(bdecode(data)).get_infohash())
+
+    def test_load_from_memory_files(self):
+        with open(os.path.join(TESTS_DATA_DIR, "bak_multiple.torrent"), "rb") as torrent_file:
+            torrent = TorrentDef.load_from_memory(torrent_file.read())
+        num_files = len(torrent.get_files())
+
+        # the files are only copied to the input when the torrent is modified
+        self.assertEqual(torrent.input['files'], [])
+        torrent.remove_content("/test123")
+        self.assertEqual(len(torrent.input['files']), num_files)
+
     @raises(TorrentDefNotFinalizedException)
     def test_no_valid_metainfo(self):
         t = TorrentDef()
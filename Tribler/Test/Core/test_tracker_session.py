@@ -0,0 +1,147 @@
+import struct
+from binascii import hexlify
+
+from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr
+from Tribler.Core.TorrentChecker.session import (FakeDHTSession, HttpTrackerSession, UdpTrackerProtocol,
+                                                 UdpTrackerSession, TRACKER_ACTION_CONNECT, TRACKER_ACTION_SCRAPE,
+                                                 create_tracker_session)
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class FakeUdpProtocol(UdpTrackerProtocol):
+
+    def __init__(self):
+        UdpTrackerProtocol.__init__(self)
+        self.sent = []
+
+    def send(self, message, address):
+        self.sent.append((message, address))
+
+
+class MockObject(object):
+    pass
+
+
+class MockTriblerSession(object):
+
+    notifier = None
+
+
+class TriblerCoreTestTrackerSession(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TriblerCoreTestTrackerSession, self).setUp(annotate=annotate)
+        self.results = []
+        self.finished = []
+
+    def on_result(self, infohash, seeders, leechers):
+        self.results.append((infohash, seeders, leechers))
+
+    def on_finished(self, session, infohash_list, success):
+        self.finished.append((session, list(infohash_list), success))
+
+    def test_create_tracker_session(self):
+        protocol = FakeUdpProtocol()
+        session = create_tracker_session(u"udp://localhost:4782", self.on_result, self.on_finished, protocol)
+        self.assertIsInstance(session, UdpTrackerSession)
+        session = create_tracker_session(u"http://localhost:4782/announce", self.on_result, self.on_finished,
+                                         protocol)
+        self.assertIsInstance(session, HttpTrackerSession)
+
+    def test_http_scrape_url(self):
+        session = HttpTrackerSession(u"http://localhost/announce.php?passkey=abc", (u"localhost", 80),
+                                     u"announce.php?passkey=abc", self.on_result, self.on_finished)
+        session.add_request('a' * 20)
+        session.add_request('b' * 20)
+        self.assertEqual(session.get_scrape_url(), "http://localhost:80/scrape.php?passkey=abc&info_hash=" +
+                         'a' * 20 + "&info_hash=" + 'b' * 20)
+        session.cleanup()
+
+    def test_http_scrape_response(self):
+        session = HttpTrackerSession(u"http://localhost/announce", (u"localhost", 80), u"announce",
+                                     self.on_result, self.on_finished)
+        session.add_request('a' * 20)
+        session.add_request('b' * 20)
+        session._on_scrape_response("d5:filesd20:" + 'a' * 20 + "d8:completei4e10:downloadedi5e10:incompletei6eeee")
+        self.assertEqual(self.results, [('a' * 20, 5, 6), ('b' * 20, 0, 0)])
+        self.assertEqual(self.finished, [(session, ['a' * 20, 'b' * 20], True)])
+        self.assertTrue(session.is_finished)
+        session.cleanup()
+
+    def test_http_scrape_error(self):
+        session = HttpTrackerSession(u"http://localhost/announce", (u"localhost", 80), u"announce",
+                                     self.on_result, self.on_finished)
+        session.add_request('a' * 20)
+        session._on_scrape_response("d14:failure reason4:nopee")
+        self.assertEqual(self.results, [])
+        self.assertEqual(self.finished, [(session, ['a' * 20], False)])
+        self.assertTrue(session.is_failed)
+        session.cleanup()
+
+    def test_udp_scrape(self):
+        protocol = FakeUdpProtocol()
+        session = UdpTrackerSession(u"udp://localhost:4782", (u"localhost", 4782), None,
+                                    self.on_result, self.on_finished, protocol)
+        session.add_request('a' * 20)
+        session._on_resolved("127.0.0.1")
+
+        message, address = protocol.sent[-1]
+        self.assertEqual(address, ("127.0.0.1", 4782))
+        _, action, transaction_id = struct.unpack('!qii', message)
+        self.assertEqual(action, TRACKER_ACTION_CONNECT)
+
+        protocol.datagramReceived(struct.pack('!iiq', TRACKER_ACTION_CONNECT, transaction_id, 42), address)
+        self.assertTrue(session.is_initiated)
+        connection_id, action, transaction_id, infohash = struct.unpack('!qii20s', protocol.sent[-1][0])
+        self.assertEqual((connection_id, action, infohash), (42, TRACKER_ACTION_SCRAPE, 'a' * 20))
+
+        # packets carrying an unknown transaction ID are ignored
+        protocol.datagramReceived(struct.pack('!iiiii', TRACKER_ACTION_SCRAPE, transaction_id + 1, 1, 2, 3), address)
+        self.assertEqual(self.results, [])
+
+        protocol.datagramReceived(struct.pack('!iiiii', TRACKER_ACTION_SCRAPE, transaction_id, 1, 2, 3), address)
+        self.assertEqual(self.results, [('a' * 20, 1, 3)])
+        self.assertEqual(self.finished, [(session, ['a' * 20], True)])
+        session.cleanup()
+
+    def test_udp_error_response(self):
+        protocol = FakeUdpProtocol()
+        session = UdpTrackerSession(u"udp://localhost:4782", (u"localhost", 4782), None,
+                                    self.on_result, self.on_finished, protocol)
+        session.add_request('a' * 20)
+        session._on_resolved("127.0.0.1")
+        _, _, transaction_id = struct.unpack('!qii', protocol.sent[-1][0])
+
+        protocol.datagramReceived(struct.pack('!ii', 3, transaction_id) + "error", ("127.0.0.1", 4782))
+        self.assertEqual(self.finished, [(session, ['a' * 20], False)])
+        session.cleanup()
+
+    def create_dht_session(self):
+        ltmgr = LibtorrentMgr(MockTriblerSession())
+        ltmgr.dht_ready = True
+        session = MockObject()
+        session.lm = MockObject()
+        session.lm.ltmgr = ltmgr
+        return FakeDHTSession(session, self.on_result, self.on_finished), ltmgr
+
+    def test_dht_downloading_torrent(self):
+        dht_session, ltmgr = self.create_dht_session()
+        ltmgr.torrents[hexlify('a' * 20)] = (None, None)
+
+        # torrents that are being downloaded aren't looked up, so they fail right away
+        dht_session.add_request('a' * 20)
+        self.assertEqual(self.finished, [(dht_session, ['a' * 20], False)])
+        dht_session.cleanup()
+
+    def test_dht_duplicate_request(self):
+        dht_session, ltmgr = self.create_dht_session()
+        ltmgr.metainfo_requests[hexlify('a' * 20)] = {'handle': None, 'callbacks': [lambda _: None],
+                                                      'timeout_callbacks': [], 'notify': False}
+
+        # the lookup that is already running has no timeout callback, the DHT session still has to hear about it
+        dht_session.add_request('a' * 20)
+        request = ltmgr.metainfo_requests[hexlify('a' * 20)]
+        self.assertEqual(len(request['callbacks']), 2)
+        self.assertEqual(len(request['timeout_callbacks']), 1)
+        self.assertEqual(self.finished, [])
+        dht_session.cleanup()
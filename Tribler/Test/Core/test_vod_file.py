@@ -0,0 +1,219 @@
+from StringIO import StringIO
+from threading import Condition, Lock, Thread
+
+import libtorrent as lt
+
+from Tribler.Core.Libtorrent.LibtorrentDownloadImpl import VODFile, VOD_DEADLINE_STEP, VOD_READAHEAD_PIECES
+from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+PIECE_LENGTH = 16
+NUM_PIECES = 20
+
+
+class MockPeerRequest(object):
+
+    def __init__(self, piece):
+        self.piece = piece
+
+
+class MockTorrentInfo(object):
+
+    def map_file(self, fileindex, offset, size):
+        return MockPeerRequest(offset // PIECE_LENGTH)
+
+    def num_pieces(self):
+        return NUM_PIECES
+
+
+class MockHandle(object):
+
+    def __init__(self):
+        self.pieces = set()
+        self.deadlines = {}
+
+    def is_valid(self):
+        return True
+
+    def torrent_file(self):
+        return MockTorrentInfo()
+
+    def have_piece(self, piece):
+        return piece in self.pieces
+
+    def set_piece_deadline(self, piece, deadline):
+        self.deadlines[piece] = deadline
+
+    def reset_piece_deadline(self, piece):
+        self.deadlines.pop(piece, None)
+
+    def piece_priorities(self):
+        return []
+
+    def status(self):
+        return self
+
+
+class MockTorrentDef(object):
+
+    def get_pieces(self):
+        return 'a' * 20 * NUM_PIECES
+
+    def get_piece_length(self):
+        return PIECE_LENGTH
+
+
+class MockLtMgr(object):
+
+    def __init__(self):
+        self.vod_streams = 0
+
+    def add_vod_stream(self, hops):
+        self.vod_streams += 1
+
+    def remove_vod_stream(self, hops):
+        self.vod_streams -= 1
+
+
+class MockDownload(object):
+
+    def __init__(self):
+        self.tdef = MockTorrentDef()
+        self.handle = MockHandle()
+        self.ltmgr = MockLtMgr()
+        self.vod_seekpos = 0
+        self.vod_piece_condition = Condition()
+        self.vod_stream_positions = {}
+        self.vod_stream_lock = Lock()
+        self.priorities = {}
+
+    def get_hops(self):
+        return 0
+
+    def get_vod_fileindex(self):
+        return 0
+
+    def get_vod_filesize(self):
+        return PIECE_LENGTH * NUM_PIECES
+
+    def set_byte_priority(self, byteranges, priority):
+        for _, bytes_begin, bytes_end in byteranges:
+            self.priorities[priority] = (bytes_begin, bytes_end)
+
+
+class MockLtSession(object):
+
+    def __init__(self):
+        self.alert_mask = None
+
+    def set_alert_mask(self, alert_mask):
+        self.alert_mask = alert_mask
+
+
+class MockTriblerSession(object):
+
+    notifier = None
+
+
+class TriblerCoreTestVODFile(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TriblerCoreTestVODFile, self).setUp(annotate=annotate)
+        self.download = MockDownload()
+        self.data = ''.join(chr(i) * PIECE_LENGTH for i in xrange(NUM_PIECES))
+        self.vod_file = VODFile(StringIO(self.data), self.download)
+
+    def test_read_sets_deadlines(self):
+        self.download.handle.pieces = set(xrange(NUM_PIECES))
+        self.download.handle.pieces.discard(3)
+        self.assertEqual(self.vod_file.read(PIECE_LENGTH), self.data[:PIECE_LENGTH])
+
+        # only the missing pieces of the readahead window get a deadline, the nearest one is the most urgent
+        self.assertEqual(self.download.handle.deadlines, {3: 4 * VOD_DEADLINE_STEP})
+
+    def test_readahead_window(self):
+        self.download.handle.pieces = set([0])
+        self.vod_file.read(PIECE_LENGTH)
+        self.assertEqual(sorted(self.download.handle.deadlines), range(1, VOD_READAHEAD_PIECES))
+        self.assertEqual(self.download.handle.deadlines[1], 2 * VOD_DEADLINE_STEP)
+
+    def test_seek_resets_deadlines(self):
+        self.download.handle.pieces = set([0])
+        self.vod_file.read(PIECE_LENGTH)
+        self.vod_file.seek(10 * PIECE_LENGTH)
+        self.assertEqual(self.download.handle.deadlines, {})
+
+    def test_concurrent_streams(self):
+        self.download.handle.pieces = set(xrange(NUM_PIECES))
+        self.vod_file.seek(0)
+        self.vod_file.read(2 * PIECE_LENGTH)
+
+        # a player probing the end of the file doesn't take the priority away from the pieces the first stream reads
+        other_file = VODFile(StringIO(self.data), self.download)
+        other_file.seek(15 * PIECE_LENGTH)
+        self.assertEqual(self.download.vod_seekpos, 2 * PIECE_LENGTH)
+        self.assertEqual(self.download.priorities, {0: (0, 2 * PIECE_LENGTH), 1: (2 * PIECE_LENGTH, -1)})
+
+        other_file.read(PIECE_LENGTH)
+        self.assertEqual(self.download.vod_seekpos, 2 * PIECE_LENGTH)
+
+        # once the first stream is closed, the other one decides
+        self.vod_file.close()
+        other_file.seek(16 * PIECE_LENGTH)
+        self.assertEqual(self.download.vod_seekpos, 16 * PIECE_LENGTH)
+        self.assertEqual(self.download.priorities, {0: (0, 16 * PIECE_LENGTH), 1: (16 * PIECE_LENGTH, -1)})
+        other_file.close()
+        self.assertEqual(self.download.vod_stream_positions, {})
+
+    def test_read_waits_for_pieces(self):
+        result = []
+        reader = Thread(target=lambda: result.append(self.vod_file.read(2 * PIECE_LENGTH)))
+        reader.start()
+
+        with self.download.vod_piece_condition:
+            self.download.handle.pieces.update([0, 1])
+            self.download.vod_piece_condition.notify_all()
+        reader.join(5)
+
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(result, [self.data[:2 * PIECE_LENGTH]])
+
+    def test_close_wakes_read(self):
+        result = []
+        reader = Thread(target=lambda: result.append(self.vod_file.read(PIECE_LENGTH)))
+        reader.start()
+        self.vod_file.close()
+        reader.join(5)
+
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(result, [''])
+
+    def test_wait_available_timeout(self):
+        self.download.handle.pieces = set([0])
+        self.assertTrue(self.vod_file.wait_available(PIECE_LENGTH, 0.1))
+        self.assertFalse(self.vod_file.wait_available(2 * PIECE_LENGTH, 0.1))
+        self.assertIn(1, self.download.handle.deadlines)
+
+    def test_close_removes_vod_stream(self):
+        self.assertEqual(self.download.ltmgr.vod_streams, 1)
+        self.vod_file.close()
+        self.vod_file.close()
+        self.assertEqual(self.download.ltmgr.vod_streams, 0)
+
+
+class TriblerCoreTestVODAlerts(TriblerCoreTest):
+
+    def test_progress_alerts_only_with_vod_streams(self):
+        ltmgr = LibtorrentMgr(MockTriblerSession())
+        ltsession = ltmgr.ltsessions[0] = MockLtSession()
+
+        ltmgr.add_vod_stream(0)
+        ltmgr.add_vod_stream(0)
+        self.assertTrue(ltsession.alert_mask & lt.alert.category_t.progress_notification)
+
+        ltmgr.remove_vod_stream(0)
+        self.assertTrue(ltsession.alert_mask & lt.alert.category_t.progress_notification)
+        ltmgr.remove_vod_stream(0)
+        self.assertEqual(ltsession.alert_mask, ltmgr.get_alert_mask())
+        self.assertFalse(ltsession.alert_mask & lt.alert.category_t.progress_notification)
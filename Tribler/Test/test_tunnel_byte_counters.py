@@ -0,0 +1,94 @@
+import time
+from collections import defaultdict
+
+from Tribler.Test.test_as_server import AbstractServer
+from Tribler.community.bartercast4.statistics import BartercastStatisticTypes, _barter_statistics
+from Tribler.community.tunnel.routing import Circuit, RelayRoute
+from Tribler.community.tunnel.tunnel_community import TunnelCommunity, TunnelExitSocket
+
+
+class MockTunnelCommunity(TunnelCommunity):
+    """
+    A tunnel community that only has the state the byte counters need, without Dispersy.
+    """
+
+    def __init__(self):
+        self.stats = defaultdict(int)
+        self._pending_bytes = {}
+        self._byte_rates = {}
+        self._last_byte_flush = time.time()
+        self.sent_data = []
+
+    def send_data(self, candidates, circuit_id, dest_address, source_address, data):
+        self.sent_data.append(data)
+        return len(data) + 10
+
+
+class TestTunnelByteCounters(AbstractServer):
+
+    def setUp(self, annotate=True):
+        super(TestTunnelByteCounters, self).setUp(annotate=annotate)
+        self.community = MockTunnelCommunity()
+        self.circuit = Circuit(1L, first_hop=("1.2.3.4", 1234))
+        self.relay = RelayRoute(2L, ("2.3.4.5", 2345))
+        self.exit_socket = TunnelExitSocket(3L, self.community, ("3.4.5.6", 3456))
+        # the bartercast statistics are process wide, they are restored after the test
+        self.bartercast = dict((stat_type, peers.copy())
+                               for stat_type, peers in _barter_statistics.bartercast.iteritems())
+
+    def tearDown(self, annotate=True):
+        _barter_statistics.bartercast.update(self.bartercast)
+        super(TestTunnelByteCounters, self).tearDown(annotate=annotate)
+
+    def get_bartercast(self, stat_type, peer):
+        return _barter_statistics.bartercast[stat_type].get(peer, 0)
+
+    def test_pending_counters(self):
+        self.community.increase_bytes_sent(self.circuit, 100)
+        self.community.increase_bytes_sent(self.circuit, 50)
+        self.community.increase_bytes_received(self.relay, 20)
+        self.community.increase_bytes_received(self.exit_socket, 30)
+
+        # the objects are counted right away, the statistics only when they are flushed
+        self.assertEqual(self.circuit.bytes_up, 150)
+        self.assertEqual(self.relay.bytes_down, 20)
+        self.assertEqual(self.exit_socket.bytes_down, 30)
+        self.assertEqual(self.community._pending_bytes,
+                         {self.circuit: [150, 0], self.relay: [0, 20], self.exit_socket: [0, 30]})
+        self.assertFalse(self.community.stats)
+
+    def test_unknown_object(self):
+        self.community.increase_bytes_sent(1L, 100)
+        self.assertFalse(self.community._pending_bytes)
+
+    def test_flush_byte_counters(self):
+        circuit_peer = self.get_bartercast(BartercastStatisticTypes.TUNNELS_BYTES_SENT, "1.2.3.4:1234")
+        exit_peer = self.get_bartercast(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, "3.4.5.6:3456")
+
+        self.community.increase_bytes_sent(self.circuit, 100)
+        self.community.increase_bytes_received(self.exit_socket, 30)
+        self.community._last_byte_flush = time.time() - 5
+        self.community.flush_byte_counters()
+
+        self.assertEqual(self.community.stats, {'bytes_up': 100, 'bytes_enter': 30})
+        self.assertFalse(self.community._pending_bytes)
+        self.assertEqual(self.get_bartercast(BartercastStatisticTypes.TUNNELS_BYTES_SENT, "1.2.3.4:1234"),
+                         circuit_peer + 100)
+        self.assertEqual(self.get_bartercast(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, "3.4.5.6:3456"),
+                         exit_peer + 30)
+
+        rates = self.community.get_byte_rates()
+        self.assertAlmostEqual(rates['bytes_up'], 20, delta=1)
+        self.assertAlmostEqual(rates['bytes_enter'], 6, delta=1)
+        self.assertEqual(rates['bytes_relay_up'], 0)
+
+        # nothing was transferred during the next interval
+        self.community.flush_byte_counters()
+        self.assertEqual(self.community.stats, {'bytes_up': 100, 'bytes_enter': 30})
+        self.assertEqual(self.community.get_byte_rates()['bytes_up'], 0)
+
+    def test_circuit_tunnel_data(self):
+        self.circuit.proxy = self.community
+        self.assertTrue(self.circuit.tunnel_data(("5.6.7.8", 5678), "data"))
+        self.assertEqual(self.circuit.bytes_up, 14)
+        self.assertEqual(self.community._pending_bytes, {self.circuit: [14, 0]})
@@ -0,0 +1,54 @@
+from unittest import skipIf
+
+from Tribler.Test.test_as_server import AbstractServer
+from Tribler.community.tunnel import EXIT_NODE, EXIT_NODE_CIPHER, ORIGINATOR, ORIGINATOR_CIPHER
+from Tribler.community.tunnel.crypto import tunnelcrypto
+from Tribler.community.tunnel.crypto.tunnelcrypto import TunnelCrypto
+
+
+@skipIf(tunnelcrypto.AESGCM is None, "this cryptography release has no AESGCM")
+class TestTunnelCrypto(AbstractServer):
+
+    def setUp(self, annotate=True):
+        super(TestTunnelCrypto, self).setUp(annotate=annotate)
+        self.crypto = TunnelCrypto()
+        self.session_keys = self.crypto.generate_session_keys("\x01" * 64)
+        self.key, _, self.salt, _, _, _, self.cipher, _ = self.session_keys
+        self.aesgcm = tunnelcrypto.AESGCM
+
+    def tearDown(self, annotate=True):
+        tunnelcrypto.AESGCM = self.aesgcm
+        super(TestTunnelCrypto, self).tearDown(annotate=annotate)
+
+    def encrypt_uncached(self, content, salt_explicit):
+        # without AESGCM, a new Cipher is created for every packet
+        tunnelcrypto.AESGCM = None
+        try:
+            return self.crypto.encrypt_str(content, self.key, self.salt, salt_explicit)
+        finally:
+            tunnelcrypto.AESGCM = self.aesgcm
+
+    def test_session_ciphers(self):
+        self.assertIsInstance(self.session_keys[ORIGINATOR_CIPHER], self.aesgcm)
+        self.assertIsInstance(self.session_keys[EXIT_NODE_CIPHER], self.aesgcm)
+        self.assertIsNot(self.session_keys[ORIGINATOR_CIPHER], self.session_keys[EXIT_NODE_CIPHER])
+
+        tunnelcrypto.AESGCM = None
+        self.assertEqual(self.crypto.generate_session_keys("\x01" * 64)[6:], [None, None])
+
+    def test_session_cipher_same_output(self):
+        content = "x" * 1400
+        encrypted = self.crypto.encrypt_str(content, self.key, self.salt, 4242, self.cipher)
+        self.assertEqual(encrypted, self.encrypt_uncached(content, 4242))
+        self.assertEqual(self.crypto.encrypt_str(content, self.key, self.salt, 4242), encrypted)
+        self.assertEqual(self.crypto.decrypt_str(encrypted, self.key, self.salt, self.cipher), content)
+
+        tunnelcrypto.AESGCM = None
+        self.assertEqual(self.crypto.decrypt_str(encrypted, self.key, self.salt), content)
+
+    def test_directions(self):
+        encrypted = self.crypto.encrypt_str("x", self.session_keys[EXIT_NODE], self.salt, 1000,
+                                            self.session_keys[EXIT_NODE_CIPHER])
+        self.assertEqual(self.crypto.decrypt_str(encrypted, self.session_keys[EXIT_NODE], self.salt), "x")
+        self.assertNotEqual(encrypted, self.crypto.encrypt_str("x", self.session_keys[ORIGINATOR], self.salt, 1000,
+                                                               self.session_keys[ORIGINATOR_CIPHER]))
@@ -0,0 +1,88 @@
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.error import DNSLookupError
+from twisted.internet.task import Clock
+
+from Tribler.Test.test_as_server import AbstractServer
+from Tribler.community.tunnel.dns_resolver import DNSResolver, DNS_NEGATIVE_TTL, DNS_POSITIVE_TTL
+
+
+class ResolvingClock(Clock):
+
+    def __init__(self):
+        Clock.__init__(self)
+        self.answers = {}
+        self.lookups = []
+
+    def resolve(self, hostname):
+        self.lookups.append(hostname)
+        answer = self.answers.get(hostname)
+        if answer is None:
+            return fail(DNSLookupError(hostname))
+        return answer if isinstance(answer, Deferred) else succeed(answer)
+
+
+class TestDNSResolver(AbstractServer):
+
+    def setUp(self, annotate=True):
+        super(TestDNSResolver, self).setUp(annotate=annotate)
+        self.resolver = DNSResolver()
+        self.resolver._reactor = self.clock = ResolvingClock()
+        self.clock.answers["tracker.example.com"] = "1.2.3.4"
+        self.ip_addresses = []
+
+    def test_resolve(self):
+        self.assertTrue(self.resolver.resolve("tracker.example.com", self.ip_addresses.append))
+        self.assertTrue(self.resolver.resolve("tracker.example.com", self.ip_addresses.append))
+        self.assertEqual(self.ip_addresses, ["1.2.3.4", "1.2.3.4"])
+        self.assertEqual(self.clock.lookups, ["tracker.example.com"])
+
+        self.clock.advance(DNS_POSITIVE_TTL)
+        self.resolver.resolve("tracker.example.com", self.ip_addresses.append)
+        self.assertEqual(len(self.clock.lookups), 2)
+
+    def test_resolve_failed(self):
+        self.resolver.resolve("unknown.example.com", self.ip_addresses.append)
+        self.resolver.resolve("unknown.example.com", self.ip_addresses.append)
+        self.assertEqual(self.ip_addresses, [None, None])
+        self.assertEqual(len(self.clock.lookups), 1)
+
+        self.clock.advance(DNS_NEGATIVE_TTL)
+        self.resolver.resolve("unknown.example.com", self.ip_addresses.append)
+        self.assertEqual(len(self.clock.lookups), 2)
+
+    def test_resolve_waiting(self):
+        resolving = self.clock.answers["slow.example.com"] = Deferred()
+        for _ in xrange(self.resolver.max_waiting):
+            self.assertTrue(self.resolver.resolve("slow.example.com", self.ip_addresses.append))
+        self.assertFalse(self.resolver.resolve("slow.example.com", self.ip_addresses.append))
+        self.assertEqual(self.ip_addresses, [])
+
+        resolving.callback("5.6.7.8")
+        self.assertEqual(self.ip_addresses, ["5.6.7.8"] * self.resolver.max_waiting)
+        self.assertEqual(self.clock.lookups, ["slow.example.com"])
+
+    def test_cache_size(self):
+        self.resolver.cache_size = 2
+        for hostname in ("a.example.com", "b.example.com", "tracker.example.com"):
+            self.clock.answers.setdefault(hostname, "1.1.1.1")
+            self.resolver.resolve(hostname, self.ip_addresses.append)
+        self.assertEqual(self.resolver.cache.keys(), ["b.example.com", "tracker.example.com"])
+
+    def test_max_lookups(self):
+        resolving = self.clock.answers["slow.example.com"] = Deferred()
+        self.resolver.max_lookups = 1
+        self.assertTrue(self.resolver.resolve("slow.example.com", self.ip_addresses.append))
+        self.assertFalse(self.resolver.resolve("tracker.example.com", self.ip_addresses.append))
+        self.assertEqual(self.clock.lookups, ["slow.example.com"])
+
+        resolving.callback("5.6.7.8")
+        self.assertTrue(self.resolver.resolve("tracker.example.com", self.ip_addresses.append))
+        self.assertEqual(self.ip_addresses, ["5.6.7.8", "1.2.3.4"])
+
+    def test_negative_cache_size(self):
+        self.resolver.negative_cache_size = 2
+        self.resolver.resolve("tracker.example.com", self.ip_addresses.append)
+        for hostname in ("a.example.com", "b.example.com", "c.example.com"):
+            self.resolver.resolve(hostname, self.ip_addresses.append)
+        self.assertEqual(self.resolver.negative_cache.keys(), ["b.example.com", "c.example.com"])
+        self.assertEqual(self.resolver.cache.keys(), ["tracker.example.com"])
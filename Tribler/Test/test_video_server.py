@@ -6,9 +6,16 @@ import socket
 import binascii
 from traceback import print_exc
 
-from Tribler.Test.test_as_server import TESTS_DATA_DIR, TestAsServer
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.error import ConnectionLost
+from twisted.internet.task import deferLater
+
+from Tribler.Test.test_as_server import TESTS_DATA_DIR, AbstractServer, TestAsServer
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.DownloadConfig import DownloadStartupConfig
+from Tribler.Core.Utilities.twisted_thread import deferred
+from Tribler.Core.Video.VideoServer import VideoServer, VideoStreamProducer
 
 DEBUG = True
 
@@ -201,3 +208,252 @@ class TestVideoHTTPServer(TestAsServer):
                 line = line + data
             if data == '\n' and len(line) >= 2 and line[-2:] == '\r\n':
                 return line
+
+
+class MockRequest(object):
+
+    def __init__(self, path, range_header=None):
+        self.path = path
+        self.range_header = range_header
+        self.code = 200
+        self.headers = {}
+        self.written = []
+        self.producer = None
+        self.finished = False
+        self.connection_lost = False
+        self.finish_deferreds = []
+
+    def getHeader(self, name):
+        return self.range_header if name == 'range' else None
+
+    def getClientAddress(self):
+        return None
+
+    def setResponseCode(self, code, message=None):
+        self.code = code
+
+    def setHeader(self, name, value):
+        self.headers[name] = value
+
+    def notifyFinish(self):
+        finish_deferred = Deferred()
+        self.finish_deferreds.append(finish_deferred)
+        return finish_deferred
+
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+    def unregisterProducer(self):
+        self.producer = None
+
+    def write(self, data):
+        self.written.append(data)
+
+    def finish(self):
+        self.finished = True
+        for finish_deferred in self.finish_deferreds:
+            finish_deferred.callback(None)
+
+    def loseConnection(self):
+        self.connection_lost = True
+        for finish_deferred in self.finish_deferreds:
+            finish_deferred.errback(ConnectionLost())
+
+
+class MockTorrentDef(object):
+
+    def __init__(self, filename, length):
+        self.filename = filename
+        self.length = length
+
+    def get_files(self):
+        return [self.filename]
+
+    def get_files_as_unicode_with_length(self):
+        return [(self.filename, self.length)]
+
+    def is_multifile_torrent(self):
+        return False
+
+    def get_piece_length(self):
+        return 16384
+
+    def get_infohash(self):
+        return 'a' * 20
+
+
+class MockDownload(object):
+
+    def __init__(self, tdef):
+        self.tdef = tdef
+
+    def get_def(self):
+        return self.tdef
+
+    def get_vod_fileindex(self):
+        return 0
+
+    def get_byte_progress(self, byteranges, consecutive=False):
+        return 1.0
+
+
+class MockVideoPlayer(object):
+
+    def __init__(self, download, filename):
+        self.download = download
+        self.filename = filename
+
+    def get_vod_fileindex(self):
+        return 0
+
+    def get_vod_download(self):
+        return self.download
+
+    def get_vod_filename(self, download):
+        return self.filename
+
+
+class MockSession(object):
+
+    def __init__(self, download):
+        self.download = download
+
+    def get_download(self, infohash):
+        return self.download if infohash == self.download.get_def().get_infohash() else None
+
+
+class StalledStream(object):
+    """
+    A VOD stream of which the pieces don't come in.
+    """
+
+    def __init__(self, is_available=False):
+        self._is_available = is_available
+        self.closed = False
+
+    def seek(self, pos):
+        pass
+
+    def read(self, nbytes):
+        return 'x' * nbytes
+
+    def is_available(self, nbytes):
+        return False
+
+    def wait_available(self, nbytes, timeout):
+        return self._is_available
+
+    def close(self):
+        self.closed = True
+
+
+class TestVideoResource(AbstractServer):
+
+    def setUp(self, annotate=True):
+        super(TestVideoResource, self).setUp(annotate=annotate)
+        self.sourcefn = os.path.join(TESTS_DATA_DIR, "video.avi")
+        self.sourcesize = os.path.getsize(self.sourcefn)
+        with open(self.sourcefn, 'rb') as source_file:
+            self.sourcedata = source_file.read()
+
+        download = MockDownload(MockTorrentDef(u"video.avi", self.sourcesize))
+        self.server = VideoServer(0, MockSession(download), MockVideoPlayer(download, self.sourcefn))
+        self.server.threadpool.start()
+        self.resource = self.server.site.resource
+
+    def tearDown(self, annotate=True):
+        self.server.shutdown()
+        super(TestVideoResource, self).tearDown(annotate=annotate)
+
+    def render(self, range_header=None, path=None):
+        request = MockRequest(path or "/%s/0" % binascii.hexlify('a' * 20), range_header)
+        self.resource.render_GET(request)
+        return request
+
+    @deferred(timeout=10)
+    def test_range(self):
+        def check(_):
+            self.assertEqual(request.code, 206)
+            self.assertEqual(request.headers['Content-Range'], 'bytes 100-199/%d' % self.sourcesize)
+            self.assertEqual(request.headers['Content-Length'], '100')
+            self.assertEqual(''.join(request.written), self.sourcedata[100:200])
+            self.assertTrue(request.finished)
+
+        request = self.render('bytes=100-199')
+        return request.notifyFinish().addCallback(check)
+
+    @deferred(timeout=10)
+    def test_whole_file(self):
+        def check(_):
+            self.assertEqual(request.code, 200)
+            self.assertEqual(''.join(request.written), self.sourcedata)
+
+        request = self.render()
+        return request.notifyFinish().addCallback(check)
+
+    def test_multiple_ranges(self):
+        request = self.render('bytes=0-99,200-299')
+        self.assertEqual(request.code, 416)
+
+    def test_unknown_download(self):
+        request = self.render(path="/%s/0" % binascii.hexlify('b' * 20))
+        self.assertEqual(request.code, 404)
+
+    @deferred(timeout=10)
+    def test_disconnect_mid_stream(self):
+        def write(data):
+            request.written.append(data)
+            if len(request.written) == 1:
+                # the transport buffer is full and the client goes away
+                request.producer.pauseProducing()
+                producer = request.producer
+                request.loseConnection()
+                self.assertTrue(producer.stopped)
+                self.assertTrue(producer.stream.closed)
+
+        def check(failure):
+            failure.trap(ConnectionLost)
+            self.assertEqual(len(request.written), 1)
+            self.assertFalse(request.finished)
+            # the producer is forgotten once it has handled the disconnect as well
+            return deferLater(reactor, 0, lambda: self.assertEqual(self.server.producers, set()))
+
+        request = MockRequest("/%s/0" % binascii.hexlify('a' * 20), 'bytes=0-99999')
+        request.write = write
+        self.resource.render_GET(request)
+        return request.notifyFinish().addCallbacks(self.fail, check)
+
+
+class TestVideoStreamProducer(AbstractServer):
+
+    def setUp(self, annotate=True):
+        super(TestVideoStreamProducer, self).setUp(annotate=annotate)
+        self.server = VideoServer(0, None, None)
+        self.server.threadpool.start()
+
+    def tearDown(self, annotate=True):
+        self.server.shutdown()
+        super(TestVideoStreamProducer, self).tearDown(annotate=annotate)
+
+    @deferred(timeout=10)
+    def test_stalled_stream(self):
+        def check(_):
+            self.assertEqual(request.written, [])
+            self.assertTrue(request.connection_lost)
+            self.assertFalse(request.finished)
+            self.assertTrue(stream.closed)
+
+        request = MockRequest("/")
+        stream = StalledStream()
+        producer = VideoStreamProducer(request, stream, 0, 100, 10, self.server.threadpool)
+        return producer.start().addCallback(check)
+
+    @deferred(timeout=10)
+    def test_waited_stream(self):
+        def check(_):
+            self.assertEqual(''.join(request.written), 'x' * 100)
+            self.assertTrue(request.finished)
+
+        request = MockRequest("/")
+        producer = VideoStreamProducer(request, StalledStream(is_available=True), 0, 100, 10, self.server.threadpool)
+        return producer.start().addCallback(check)
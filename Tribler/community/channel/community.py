@@ -7,7 +7,6 @@ from traceback import print_stack
 
 from twisted.python.threadable import isInIOThread
 
-from Tribler.Core.CacheDB.sqlitecachedb import str2bin
 from Tribler.community.channel.payload import ModerationPayload
 from Tribler.dispersy.authentication import MemberAuthentication, NoAuthentication
 from Tribler.dispersy.candidate import CANDIDATE_WALK_LIFETIME
@@ -726,7 +725,7 @@ class ChannelCommunity(Community):
                     infohash = self._channelcast_db._db.fetchone(
                         u"SELECT infohash FROM Torrent WHERE torrent_id = ?", (torrent_id,))
                     if infohash:
-                        infohash = str2bin(infohash)
+                        infohash = str(infohash)
                         logger.debug(
                             "Incoming metadata-json with infohash %s from %s",
                             infohash.encode("HEX"),
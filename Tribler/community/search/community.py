@@ -338,30 +338,36 @@ class SearchCommunity(Community):
             if self.log_incomming_searches:
                 self.log_incomming_searches(message.candidate.sock_addr, keywords)
 
-            results = []
-            dbresults = self._torrent_db.searchNames(keywords, local=False, keys=['infohash', 'T.name', 'T.length', 'T.num_files', 'T.category', 'T.creation_date', 'T.num_seeders', 'T.num_leechers'])
-            if len(dbresults) > 0:
-                for dbresult in dbresults:
-                    channel_details = dbresult[-10:]
-
-                    dbresult = list(dbresult[:8])
-                    dbresult[2] = long(dbresult[2])  # length
-                    dbresult[3] = int(dbresult[3])  # num_files
-                    dbresult[4] = [dbresult[4]]  # category
-                    dbresult[5] = long(dbresult[5])  # creation_date
-                    dbresult[6] = int(dbresult[6] or 0)  # num_seeders
-                    dbresult[7] = int(dbresult[7] or 0)  # num_leechers
-
-                    # cid
-                    if channel_details[1]:
-                        channel_details[1] = str(channel_details[1])
-                    dbresult.append(channel_details[1])
-
-                    results.append(tuple(dbresult))
-            elif DEBUG:
-                self._logger.debug(u"no results")
-
-            self._create_search_response(message.payload.identifier, results, message.candidate)
+            keys = ['infohash', 'T.name', 'T.length', 'T.num_files', 'T.category', 'T.creation_date', 'T.num_seeders',
+                    'T.num_leechers']
+            deferred = self._torrent_db.search_names_async(keywords, local=False, keys=keys)
+            deferred.addCallback(self._on_search_db_results, message.payload.identifier, message.candidate)
+            deferred.addErrback(lambda failure, kws=keywords: self._logger.error(u"search for %s failed: %s", kws, failure))
+
+    def _on_search_db_results(self, dbresults, identifier, candidate):
+        results = []
+        if len(dbresults) > 0:
+            for dbresult in dbresults:
+                channel_details = dbresult[-10:]
+
+                dbresult = list(dbresult[:8])
+                dbresult[2] = long(dbresult[2])  # length
+                dbresult[3] = int(dbresult[3])  # num_files
+                dbresult[4] = [dbresult[4]]  # category
+                dbresult[5] = long(dbresult[5])  # creation_date
+                dbresult[6] = int(dbresult[6] or 0)  # num_seeders
+                dbresult[7] = int(dbresult[7] or 0)  # num_leechers
+
+                # cid
+                if channel_details[1]:
+                    channel_details[1] = str(channel_details[1])
+                dbresult.append(channel_details[1])
+
+                results.append(tuple(dbresult))
+        elif DEBUG:
+            self._logger.debug(u"no results")
+
+        self._create_search_response(identifier, results, candidate)
 
     def _create_search_response(self, identifier, results, candidate):
         # create search-response message
@@ -13,6 +13,8 @@ ORIGINATOR_SALT = 2
 EXIT_NODE_SALT = 3
 ORIGINATOR_SALT_EXPLICIT = 4
 EXIT_NODE_SALT_EXPLICIT = 5
+ORIGINATOR_CIPHER = 6
+EXIT_NODE_CIPHER = 7
 
 # Data circuits are supposed to end in an exit peer that allows exiting data to the outside world
 CIRCUIT_TYPE_DATA = 'DATA'
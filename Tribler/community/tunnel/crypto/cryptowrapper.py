@@ -18,3 +18,9 @@ try:
 except ImportError:
     logger.error("cannnot continue without cryptography")
     raise
+
+try:
+    # one-shot AES-GCM that keeps its key schedule between calls, only available in newer cryptography releases
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
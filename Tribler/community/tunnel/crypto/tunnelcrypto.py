@@ -1,6 +1,6 @@
 import struct
 
-from cryptowrapper import crypto_box_beforenm, crypto_auth, crypto_auth_verify, Cipher, algorithms, modes, HKDFExpand, hashes, default_backend
+from cryptowrapper import crypto_box_beforenm, crypto_auth, crypto_auth_verify, Cipher, algorithms, modes, HKDFExpand, hashes, default_backend, AESGCM
 from Tribler.dispersy.crypto import ECCrypto, LibNaCLPK
 
 
@@ -50,20 +50,30 @@ class TunnelCrypto(ECCrypto):
         kb = key[16:32]
         sf = key[32:36]
         sb = key[36:40]
-        return [kf, kb, sf, sb, 1, 1]
+        # the AES-GCM key schedules are computed once, they are kept with the keys for as long as the hop or relay lives
+        return [kf, kb, sf, sb, 1, 1, self.create_cipher(kf), self.create_cipher(kb)]
 
-    def _bulid_iv(self, salt, salt_explicit):
-        assert isinstance(salt, (basestring)), type(salt)
-        assert isinstance(salt_explicit, (int, long)), type(salt_explicit)
+    def create_cipher(self, key):
+        """
+        Returns the AES-GCM cipher of a session key, or None if this cryptography release can't keep key schedules.
+        """
+        return AESGCM(key) if AESGCM is not None else None
 
+    def _bulid_iv(self, salt, salt_explicit):
+        # salt is the fixed 4 byte prefix of the IV, the packet counter is appended in decimal on every packet
         if salt_explicit == 0:
             raise CryptoException("salt_explicit wrapped")
 
         return salt + str(salt_explicit)
 
-    def encrypt_str(self, content, key, salt, salt_explicit):
+    def encrypt_str(self, content, key, salt, salt_explicit, cipher=None):
         # return the encrypted content prepended with the
         # gcm tag and salt_explicit
+        if AESGCM is not None:
+            # AESGCM appends the tag, the wire format has it in front of the ciphertext
+            ciphertext = (cipher or AESGCM(key)).encrypt(self._bulid_iv(salt, salt_explicit), content, None)
+            return struct.pack('!q16s', salt_explicit, ciphertext[-16:]) + ciphertext[:-16]
+
         cipher = Cipher(algorithms.AES(key),
                         modes.GCM(initialization_vector=self._bulid_iv(salt, salt_explicit)),
                         backend=default_backend()
@@ -71,9 +81,12 @@ class TunnelCrypto(ECCrypto):
         ciphertext = cipher.update(content) + cipher.finalize()
         return struct.pack('!q16s', salt_explicit, cipher.tag) + ciphertext
 
-    def decrypt_str(self, content, key, salt):
+    def decrypt_str(self, content, key, salt, cipher=None):
         # content contains the gcm tag and salt_explicit in plaintext
         salt_explicit, gcm_tag = struct.unpack_from('!q16s', content)
+        if AESGCM is not None:
+            return (cipher or AESGCM(key)).decrypt(self._bulid_iv(salt, salt_explicit), content[24:] + gcm_tag, None)
+
         cipher = Cipher(algorithms.AES(key),
                         modes.GCM(initialization_vector=self._bulid_iv(salt, salt_explicit), tag=gcm_tag),
                         backend=default_backend()
@@ -99,12 +112,12 @@ class NoTunnelCrypto(TunnelCrypto):
         return ''
 
     def generate_session_keys(self, shared_secret):
-        return '\0' * 16, '\0' * 16, '\0' * 4, '\0' * 4, 1, 1
+        return '\0' * 16, '\0' * 16, '\0' * 4, '\0' * 4, 1, 1, None, None
 
-    def encrypt_str(self, content, key, salt, salt_explicit):
+    def encrypt_str(self, content, key, salt, salt_explicit, cipher=None):
         return content
 
-    def decrypt_str(self, content, key, salt):
+    def decrypt_str(self, content, key, salt, cipher=None):
         return content
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+import logging
+from collections import OrderedDict
+
+from twisted.internet import reactor
+
+# seconds that a resolved address, or a hostname that couldn't be resolved, is remembered
+DNS_POSITIVE_TTL = 300
+DNS_NEGATIVE_TTL = 60
+# the number of resolved hostnames, and of hostnames that couldn't be resolved, that are remembered
+DNS_CACHE_SIZE = 1000
+DNS_NEGATIVE_CACHE_SIZE = 200
+# the number of callbacks that can wait for a hostname that is being resolved, callbacks beyond this are dropped
+DNS_MAX_WAITING = 64
+# the number of hostnames that can be resolved at the same time, lookups beyond this are dropped
+DNS_MAX_LOOKUPS = 32
+
+
+class DNSResolver(object):
+
+    """
+    Resolves hostnames for the exit sockets without blocking the reactor.
+
+    Hostnames are resolved through the reactor's resolver, which does the lookup in a thread. The answers, including the
+    hostnames that can't be resolved, are cached for a while. Hostnames that can't be resolved are cached separately, so
+    that lookups for made-up hostnames can't push out the resolved ones. Lookups for a hostname that is already being
+    resolved wait for that resolution instead of starting another one.
+    """
+
+    _reactor = reactor
+
+    def __init__(self, positive_ttl=DNS_POSITIVE_TTL, negative_ttl=DNS_NEGATIVE_TTL, cache_size=DNS_CACHE_SIZE,
+                 negative_cache_size=DNS_NEGATIVE_CACHE_SIZE, max_waiting=DNS_MAX_WAITING,
+                 max_lookups=DNS_MAX_LOOKUPS):
+        self.tunnel_logger = logging.getLogger('TunnelLogger')
+
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.cache_size = cache_size
+        self.negative_cache_size = negative_cache_size
+        self.max_waiting = max_waiting
+        self.max_lookups = max_lookups
+
+        # {hostname: (ip address, expiry time)}, oldest first
+        self.cache = OrderedDict()
+        # {hostname: (None, expiry time)} of the hostnames that couldn't be resolved, oldest first
+        self.negative_cache = OrderedDict()
+        # {hostname: [(callback, args)]} of the hostnames that are being resolved
+        self.waiting = {}
+
+    def resolve(self, hostname, callback, *args):
+        """
+        Calls callback(ip_address, *args) once hostname has been resolved, with None as ip_address if it can't be
+        resolved. The callback is called right away if the answer is cached.
+        :return: False if the callback was dropped because too many callbacks are waiting for hostname, or because too
+        many hostnames are being resolved, True otherwise.
+        """
+        for cache in (self.cache, self.negative_cache):
+            answer = cache.get(hostname)
+            if answer is not None:
+                ip_address, expiry_time = answer
+                if expiry_time > self._reactor.seconds():
+                    callback(ip_address, *args)
+                    return True
+                del cache[hostname]
+
+        callbacks = self.waiting.get(hostname)
+        if callbacks is not None:
+            if len(callbacks) >= self.max_waiting:
+                return False
+            callbacks.append((callback, args))
+            return True
+
+        if len(self.waiting) >= self.max_lookups:
+            return False
+
+        self.waiting[hostname] = [(callback, args)]
+        resolving = self._reactor.resolve(hostname)
+        resolving.addCallbacks(self.on_resolved, self.on_resolve_failed, callbackArgs=(hostname,),
+                               errbackArgs=(hostname,))
+        return True
+
+    def on_resolved(self, ip_address, hostname):
+        self.tunnel_logger.info("Resolved ip address %s for hostname %s", ip_address, hostname)
+        self.answer(hostname, ip_address, self.positive_ttl, self.cache, self.cache_size)
+
+    def on_resolve_failed(self, failure, hostname):
+        self.tunnel_logger.error("Can't resolve ip address for hostname %s: %s", hostname, failure.getErrorMessage())
+        self.answer(hostname, None, self.negative_ttl, self.negative_cache, self.negative_cache_size)
+
+    def answer(self, hostname, ip_address, ttl, cache, cache_size):
+        if len(cache) >= cache_size:
+            now = self._reactor.seconds()
+            for cached_hostname, (_, expiry_time) in cache.items():
+                if expiry_time <= now:
+                    del cache[cached_hostname]
+            while len(cache) >= cache_size:
+                cache.popitem(last=False)
+        cache[hostname] = (ip_address, self._reactor.seconds() + ttl)
+
+        for callback, args in self.waiting.pop(hostname, []):
+            try:
+                callback(ip_address, *args)
+            except:
+                self.tunnel_logger.exception("Failed to handle the ip address of hostname %s", hostname)
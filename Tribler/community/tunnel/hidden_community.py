@@ -16,7 +16,7 @@ from Tribler.Core.DecentralizedTracking.pymdht.core.identifier import Id
 from Tribler.Core.Utilities.encoding import encode, decode
 
 from Tribler.community.tunnel import CIRCUIT_TYPE_IP, CIRCUIT_TYPE_RP, CIRCUIT_TYPE_RENDEZVOUS, \
-    EXIT_NODE, EXIT_NODE_SALT, CIRCUIT_ID_PORT
+    EXIT_NODE, EXIT_NODE_SALT, EXIT_NODE_CIPHER, CIRCUIT_ID_PORT
 
 from Tribler.community.tunnel.payload import (EstablishIntroPayload, IntroEstablishedPayload,
                                               EstablishRendezvousPayload, RendezvousEstablishedPayload,
@@ -526,7 +526,8 @@ class HiddenTunnelCommunity(TunnelCommunity):
 
             _, rp_info = decode(self.crypto.decrypt_str(message.payload.rp_sock_addr,
                                                         session_keys[EXIT_NODE],
-                                                        session_keys[EXIT_NODE_SALT]))
+                                                        session_keys[EXIT_NODE_SALT],
+                                                        session_keys[EXIT_NODE_CIPHER]))
 
             if self.notifier:
                 self.notifier.notify(NTFY_TUNNEL, NTFY_ONCREATED_E2E, cache.info_hash.encode('hex')[:6], rp_info[0])
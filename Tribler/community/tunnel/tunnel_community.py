@@ -1,7 +1,6 @@
 # Written by Egbert Bouman
 
 import random
-import socket
 import time
 from collections import defaultdict
 from cryptography.exceptions import InvalidTag
@@ -14,11 +13,12 @@ from Tribler import dispersy
 from Tribler.Core.Utilities.encoding import decode, encode
 from Tribler.community.bartercast4.statistics import BartercastStatisticTypes, _barter_statistics
 from Tribler.community.tunnel import (CIRCUIT_ID_PORT, CIRCUIT_STATE_EXTENDING, CIRCUIT_STATE_READY, CIRCUIT_TYPE_DATA,
-                                      CIRCUIT_TYPE_RENDEZVOUS, CIRCUIT_TYPE_RP, EXIT_NODE, EXIT_NODE_SALT, ORIGINATOR,
-                                      ORIGINATOR_SALT, PING_INTERVAL)
+                                      CIRCUIT_TYPE_RENDEZVOUS, CIRCUIT_TYPE_RP, EXIT_NODE, EXIT_NODE_CIPHER,
+                                      EXIT_NODE_SALT, ORIGINATOR, ORIGINATOR_CIPHER, ORIGINATOR_SALT, PING_INTERVAL)
 from Tribler.community.tunnel.Socks5.server import Socks5Server
 from Tribler.community.tunnel.conversion import TunnelConversion
 from Tribler.community.tunnel.crypto.tunnelcrypto import CryptoException, TunnelCrypto
+from Tribler.community.tunnel.dns_resolver import DNSResolver
 from Tribler.community.tunnel.payload import (CellPayload, CreatePayload, CreatedPayload, DestroyPayload, ExtendPayload,
                                               ExtendedPayload, PingPayload, PongPayload, StatsRequestPayload,
                                               StatsResponsePayload, TunnelIntroductionRequestPayload,
@@ -134,29 +134,30 @@ class TunnelExitSocket(DatagramProtocol):
         if self.check_num_packets(destination, False):
             if TunnelConversion.is_allowed(data):
                 if dispersy.util.is_valid_address(destination):
-                    ip_address = destination[0]
-                else:
-                    try:
-                        ip_address = socket.gethostbyname(destination[0])
-                        self.tunnel_logger.info("Resolved ip address %s for hostname %s",
-                                                 ip_address,
-                                                 destination[0])
-                    except:
-                        self.tunnel_logger.error("Can't resolve ip address for hostname %s", destination[0])
-
-                try:
-                    self.transport.write(data, (ip_address, destination[1]))
-                except Exception, e:
-                    self.tunnel_logger.error("Failed to write data to transport: %s. Destination: %s",
-                                             e[1],
-                                             repr(destination))
-                    raise
-
-                self.community.increase_bytes_sent(self, len(data))
+                    self.write(data, destination)
+                elif not self.community.dns_resolver.resolve(destination[0], self.on_resolved, data, destination):
+                    self.tunnel_logger.warning("dropping packet to hostname %s, too many packets or hostnames are "
+                                               "waiting to be resolved", destination[0])
             else:
                 self.tunnel_logger.error("dropping forbidden packets from exit socket with circuit_id %d",
                                          self.circuit_id)
 
+    def on_resolved(self, ip_address, data, destination):
+        # the exit socket may have been closed while the hostname was being resolved
+        if ip_address and self.enabled:
+            self.write(data, (ip_address, destination[1]))
+
+    def write(self, data, destination):
+        try:
+            self.transport.write(data, destination)
+        except Exception, e:
+            self.tunnel_logger.error("Failed to write data to transport: %s. Destination: %s",
+                                     e[1],
+                                     repr(destination))
+            raise
+
+        self.community.increase_bytes_sent(self, len(data))
+
     def datagramReceived(self, data, source):
         self.community.increase_bytes_received(self, len(data))
         if self.check_num_packets(source, True):
@@ -254,6 +255,21 @@ class RoundRobin(object):
         return self.community.active_data_circuits()[circuit_id]
 
 
+# the statistics that the traffic of every kind of tunnel object is counted under:
+# (stats key up, stats key down, bartercast type up, bartercast type down, peer address attribute)
+BYTE_COUNTER_TYPES = {
+    Circuit: ('bytes_up', 'bytes_down', BartercastStatisticTypes.TUNNELS_BYTES_SENT,
+              BartercastStatisticTypes.TUNNELS_BYTES_RECEIVED, 'first_hop'),
+    RelayRoute: ('bytes_relay_up', 'bytes_relay_down', BartercastStatisticTypes.TUNNELS_RELAY_BYTES_SENT,
+                 BartercastStatisticTypes.TUNNELS_RELAY_BYTES_RECEIVED, 'sock_addr'),
+    TunnelExitSocket: ('bytes_exit', 'bytes_enter', BartercastStatisticTypes.TUNNELS_EXIT_BYTES_SENT,
+                       BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, 'sock_addr')
+}
+
+# seconds between moving the per-object byte counters into the tunnel and bartercast statistics
+BYTE_COUNTER_FLUSH_INTERVAL = 5.0
+
+
 class TunnelCommunity(Community):
 
     def __init__(self, *args, **kwargs):
@@ -266,12 +282,19 @@ class TunnelCommunity(Community):
         self.relay_from_to = {}
         self.relay_session_keys = {}
         self.exit_sockets = {}
+        self.dns_resolver = DNSResolver()
         self.circuits_needed = defaultdict(int)
         self.exit_candidates = {}
         self.notifier = None
         self.selection_strategy = RoundRobin(self)
+        # traffic is added to the byte counters in here every BYTE_COUNTER_FLUSH_INTERVAL seconds, so readers like the
+        # GUI and the stats crawlers see counters that are up to that many seconds old
         self.stats = defaultdict(int)
         self.creation_time = time.time()
+        # bytes [up, down] per circuit/relay/exit socket that have not been added to the statistics yet
+        self._pending_bytes = {}
+        self._byte_rates = {}
+        self._last_byte_flush = time.time()
         self.crawler_mids = ['5e02620cfabea2d2d3bfdc2032f6307136a35e69'.decode('hex'),
                              '43e8807e6f86ef2f0a784fbc8fa21f8bc49a82ae'.decode('hex'),
                              'e79efd8853cef1640b93c149d7b0f067f6ccf221'.decode('hex')]
@@ -295,6 +318,8 @@ class TunnelCommunity(Community):
 
         self.register_task("do_circuits", LoopingCall(self.do_circuits)).start(5, now=True)
         self.register_task("do_ping", LoopingCall(self.do_ping)).start(PING_INTERVAL)
+        self.register_task("flush_byte_counters",
+                           LoopingCall(self.flush_byte_counters)).start(BYTE_COUNTER_FLUSH_INTERVAL, now=False)
 
         self.socks_server = Socks5Server(self, tribler_session.get_tunnel_community_socks5_listen_ports()
                                          if tribler_session else self.settings.socks_listen_ports)
@@ -385,6 +410,8 @@ class TunnelCommunity(Community):
         for circuit_id in self.exit_sockets.keys():
             self.remove_exit_socket(circuit_id, 'unload', destroy=True)
 
+        self.flush_byte_counters()
+
         super(TunnelCommunity, self).unload_community()
 
     @property
@@ -394,7 +421,7 @@ class TunnelCommunity(Community):
     def get_session_keys(self, keys, direction):
         # increment salt_explicit
         keys[direction + 4] += 1
-        return keys[direction], keys[direction + 2], keys[direction + 4]
+        return keys[direction], keys[direction + 2], keys[direction + 4], keys[direction + 6]
 
     @property
     def dispersy_enable_bloom_filter_sync(self):
@@ -863,7 +890,8 @@ class TunnelCommunity(Community):
                 candidate_list_enc = message.payload.candidate_list
                 _, candidate_list = decode(self.crypto.decrypt_str(candidate_list_enc,
                                                                    hop.session_keys[EXIT_NODE],
-                                                                   hop.session_keys[EXIT_NODE_SALT]))
+                                                                   hop.session_keys[EXIT_NODE_SALT],
+                                                                   hop.session_keys[EXIT_NODE_CIPHER]))
 
                 for ignore_candidate in ignore_candidates:
                     if ignore_candidate in candidate_list:
@@ -1244,7 +1272,8 @@ class TunnelCommunity(Community):
                     try:
                         content = self.crypto.decrypt_str(content,
                                                           hop.session_keys[ORIGINATOR],
-                                                          hop.session_keys[ORIGINATOR_SALT])
+                                                          hop.session_keys[ORIGINATOR_SALT],
+                                                          hop.session_keys[ORIGINATOR_CIPHER])
                     except InvalidTag as e:
                         raise CryptoException("Got exception %r when trying to remove encryption layer %s "
                                               "for message: %r received for circuit_id: %s, is_data: %i, "
@@ -1254,9 +1283,11 @@ class TunnelCommunity(Community):
                 if is_data and circuit.ctype in [CIRCUIT_TYPE_RENDEZVOUS, CIRCUIT_TYPE_RP]:
                     direction = int(circuit.ctype != CIRCUIT_TYPE_RP)
                     direction_salt = direction + 2
+                    direction_cipher = direction + 6
                     content = self.crypto.decrypt_str(content,
                                                       circuit.hs_session_keys[direction],
-                                                      circuit.hs_session_keys[direction_salt])
+                                                      circuit.hs_session_keys[direction_salt],
+                                                      circuit.hs_session_keys[direction_cipher])
                 return content
 
             else:
@@ -1266,7 +1297,8 @@ class TunnelCommunity(Community):
             try:
                 return self.crypto.decrypt_str(content,
                                                self.relay_session_keys[circuit_id][EXIT_NODE],
-                                               self.relay_session_keys[circuit_id][EXIT_NODE_SALT])
+                                               self.relay_session_keys[circuit_id][EXIT_NODE_SALT],
+                                               self.relay_session_keys[circuit_id][EXIT_NODE_CIPHER])
             except InvalidTag as e:
                 raise CryptoException("Got exception %r when trying to decrypt relay message: "
                                       "%r received for circuit_id: %s, is_data: %i, "
@@ -1284,7 +1316,8 @@ class TunnelCommunity(Community):
             try:
                 return self.crypto.decrypt_str(content,
                                                self.relay_session_keys[circuit_id][EXIT_NODE],
-                                               self.relay_session_keys[circuit_id][EXIT_NODE_SALT])
+                                               self.relay_session_keys[circuit_id][EXIT_NODE_SALT],
+                                               self.relay_session_keys[circuit_id][EXIT_NODE_CIPHER])
             except InvalidTag:
                 # Reasons that can cause this:
                 # - The introductionpoint circuit is extended with a candidate
@@ -1310,36 +1343,56 @@ class TunnelCommunity(Community):
 
         raise CryptoException("Direction must be either ORIGINATOR or EXIT_NODE")
 
+    def _get_pending_bytes(self, obj):
+        pending = self._pending_bytes.get(obj)
+        if pending is None and obj.__class__ in BYTE_COUNTER_TYPES:
+            pending = self._pending_bytes[obj] = [0, 0]
+        return pending
+
     def increase_bytes_sent(self, obj, num_bytes):
-        if isinstance(obj, Circuit):
-            obj.bytes_up += num_bytes
-            self.stats['bytes_up'] += num_bytes
-            _barter_statistics.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_BYTES_SENT, "%s:%s" %
-                                                   (obj.first_hop[0], obj.first_hop[1]), num_bytes)
-        elif isinstance(obj, RelayRoute):
+        pending = self._get_pending_bytes(obj)
+        if pending is not None:
             obj.bytes_up += num_bytes
-            self.stats['bytes_relay_up'] += num_bytes
-            _barter_statistics.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_RELAY_BYTES_SENT, "%s:%s" %
-                                                   (obj.sock_addr[0], obj.sock_addr[1]), num_bytes)
-        elif isinstance(obj, TunnelExitSocket):
-            obj.bytes_up += num_bytes
-            self.stats['bytes_exit'] += num_bytes
-            _barter_statistics.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_SENT, "%s:%s" %
-                                                   (obj.sock_addr[0], obj.sock_addr[1]), num_bytes)
+            pending[0] += num_bytes
 
     def increase_bytes_received(self, obj, num_bytes):
-        if isinstance(obj, Circuit):
-            obj.bytes_down += num_bytes
-            self.stats['bytes_down'] += num_bytes
-            _barter_statistics.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_BYTES_RECEIVED, "%s:%s" %
-                                                   (obj.first_hop[0], obj.first_hop[1]), num_bytes)
-        elif isinstance(obj, RelayRoute):
-            obj.bytes_down += num_bytes
-            self.stats['bytes_relay_down'] += num_bytes
-            _barter_statistics.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_RELAY_BYTES_RECEIVED, "%s:%s" %
-                                                   (obj.sock_addr[0], obj.sock_addr[1]), num_bytes)
-        elif isinstance(obj, TunnelExitSocket):
+        pending = self._get_pending_bytes(obj)
+        if pending is not None:
             obj.bytes_down += num_bytes
-            self.stats['bytes_enter'] += num_bytes
-            _barter_statistics.dict_inc_bartercast(BartercastStatisticTypes.TUNNELS_EXIT_BYTES_RECEIVED, "%s:%s" %
-                                                   (obj.sock_addr[0], obj.sock_addr[1]), num_bytes)
+            pending[1] += num_bytes
+
+    def flush_byte_counters(self):
+        """
+        Adds the bytes that were counted per circuit, relay and exit socket since the last flush to the tunnel
+        statistics and the bartercast statistics, and updates the transfer rates. Until then, only the bytes_up and
+        bytes_down of the objects themselves are up to date.
+        """
+        now = time.time()
+        interval = now - self._last_byte_flush
+        self._last_byte_flush = now
+
+        pending_bytes, self._pending_bytes = self._pending_bytes, {}
+        flushed = defaultdict(int)
+        for obj, (bytes_up, bytes_down) in pending_bytes.iteritems():
+            stats_up, stats_down, barter_up, barter_down, addr_attr = BYTE_COUNTER_TYPES[obj.__class__]
+            sock_addr = getattr(obj, addr_attr)
+            peer = "%s:%s" % (sock_addr[0], sock_addr[1])
+            if bytes_up:
+                flushed[stats_up] += bytes_up
+                _barter_statistics.dict_inc_bartercast(barter_up, peer, bytes_up)
+            if bytes_down:
+                flushed[stats_down] += bytes_down
+                _barter_statistics.dict_inc_bartercast(barter_down, peer, bytes_down)
+
+        for key, num_bytes in flushed.iteritems():
+            self.stats[key] += num_bytes
+        self._byte_rates = dict((key, num_bytes / interval) for key, num_bytes in flushed.iteritems()) \
+            if interval > 0 else {}
+
+    def get_byte_rates(self):
+        """
+        Returns the transfer rates (in bytes per second) over the last flush interval, keyed like the byte counters
+        in self.stats (bytes_up, bytes_down, bytes_relay_up, bytes_relay_down, bytes_exit, bytes_enter).
+        """
+        return dict((key, self._byte_rates.get(key, 0.0))
+                    for counter_type in BYTE_COUNTER_TYPES.itervalues() for key in counter_type[:2])
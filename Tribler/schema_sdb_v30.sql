@@ -32,7 +32,7 @@ CREATE UNIQUE INDEX permid_idx
 
 CREATE TABLE Torrent (
   torrent_id       integer PRIMARY KEY AUTOINCREMENT NOT NULL,
-  infohash		   text NOT NULL,
+  infohash		   blob NOT NULL,
   name             text,
   length           integer,
   creation_date    integer,
@@ -83,7 +83,7 @@ CREATE VIEW CollectedTorrent AS SELECT * FROM Torrent WHERE is_collected == 1;
 
 CREATE TABLE IF NOT EXISTS _Channels (
   id                        integer         PRIMARY KEY ASC,
-  dispersy_cid              text,
+  dispersy_cid              blob,
   peer_id                   integer,
   name                      text            NOT NULL,
   description               text,
@@ -95,6 +95,7 @@ CREATE TABLE IF NOT EXISTS _Channels (
   nr_favorite               integer         DEFAULT 0
 );
 CREATE VIEW Channels AS SELECT * FROM _Channels WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS ChannelCidIndex ON _Channels(dispersy_cid, deleted_at);
 
 CREATE TABLE IF NOT EXISTS _ChannelTorrents (
   id                        integer         PRIMARY KEY ASC,
@@ -269,6 +270,17 @@ CREATE INDEX IF NOT EXISTS TorMarkIndex ON _TorrentMarkings(channeltorrent_id);
 
 CREATE VIRTUAL TABLE FullTextIndex USING fts3(swarmname, filenames, fileextensions);
 
+CREATE TABLE IF NOT EXISTS SearchTerm (
+  term                  text    PRIMARY KEY NOT NULL,
+  frequency             integer DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS SearchTermTrigram (
+  trigram               text    NOT NULL,
+  term                  text    NOT NULL,
+  PRIMARY KEY (trigram, term)
+);
+
 -------------------------------------
 
 COMMIT TRANSACTION create_table;
@@ -277,7 +289,7 @@ COMMIT TRANSACTION create_table;
 
 BEGIN TRANSACTION init_values;
 
-INSERT INTO MyInfo VALUES ('version', 28);
+INSERT INTO MyInfo VALUES ('version', 30);
 
 INSERT INTO TrackerInfo (tracker) VALUES ('no-DHT');
 INSERT INTO TrackerInfo (tracker) VALUES ('DHT');